@@ -18,9 +18,35 @@ from .strategy import (
     VolumeBreakoutStrategy,
     TurtleStrategy
 )
+from .features import (
+    Feature,
+    MA,
+    EMA,
+    RSI,
+    MACD,
+    KD,
+    BBANDS,
+    ATR,
+    VolumeMA,
+    ensure_features,
+    clear_feature_cache
+)
 from .engine import BacktestEngine, quick_backtest
-from .metrics import calculate_metrics, print_metrics
+from .risk import RiskManager, PositionSizer
+from .metrics import calculate_metrics, print_metrics, equity_metrics, trade_metrics, batch_metrics
+from .tradelog import TradeLog
+from .search import (
+    ParameterSearch,
+    Trial,
+    Budget,
+    GridSampler,
+    RandomSampler,
+    TPESampler,
+    SuccessiveHalving
+)
+from .walkforward import WalkForward, walk_forward_windows
 from .batch import batch_backtest, market_scan, compare_strategies
+from .panel import MarketPanel, run_panel
 from .report import generate_html_report, print_summary
 
 __all__ = [
@@ -40,17 +66,48 @@ __all__ = [
     'MeanReversionStrategy',
     'VolumeBreakoutStrategy',
     'TurtleStrategy',
+    # 指標欄位
+    'Feature',
+    'MA',
+    'EMA',
+    'RSI',
+    'MACD',
+    'KD',
+    'BBANDS',
+    'ATR',
+    'VolumeMA',
+    'ensure_features',
+    'clear_feature_cache',
     # 引擎
     'BacktestEngine',
     'quick_backtest',
+    # 風險管理
+    'RiskManager',
+    'PositionSizer',
     # 批次回測
     'batch_backtest',
     'market_scan',
     'compare_strategies',
+    'MarketPanel',
+    'run_panel',
     # 報表
     'generate_html_report',
     'print_summary',
     # 指標
+    'TradeLog',
     'calculate_metrics',
-    'print_metrics'
+    'print_metrics',
+    'equity_metrics',
+    'trade_metrics',
+    'batch_metrics',
+    # 參數搜尋
+    'ParameterSearch',
+    'Trial',
+    'Budget',
+    'GridSampler',
+    'RandomSampler',
+    'TPESampler',
+    'SuccessiveHalving',
+    'WalkForward',
+    'walk_forward_windows'
 ]
@@ -16,6 +16,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from .engine import BacktestEngine
 from .strategy import Strategy
+from data_loader import read_stock_file, find_stock_file
 
 
 # 資料目錄
@@ -65,16 +66,12 @@ def batch_backtest(tickers: list = None,
     if tickers is None:
         files = get_all_stock_files()
     else:
-        files = []
-        all_files = get_all_stock_files()
-        for t in tickers:
-            matching = [f for f in all_files if t in os.path.basename(f)]
-            files.extend(matching)
+        files = [f for f in (find_stock_file(t) for t in tickers) if f]
     
     if not files:
         raise ValueError("找不到符合條件的股票檔案")
     
-    engine = BacktestEngine(initial_capital=initial_capital)
+    engine = BacktestEngine(initial_capital=initial_capital, mode='vectorized')
     results = []
     
     iterator = tqdm(files, desc="批次回測") if show_progress else files
@@ -83,7 +80,7 @@ def batch_backtest(tickers: list = None,
         ticker = extract_ticker_from_path(csv_path)
         
         try:
-            df = pd.read_csv(csv_path)
+            df = read_stock_file(csv_path)
             result = engine.run(df, strategy, verbose=False)
             
             metrics = result['metrics'].copy()
@@ -137,12 +134,12 @@ def market_scan(strategy: Strategy,
         pd.DataFrame: 績效最佳股票列表
     """
     files = get_all_stock_files()
-    engine = BacktestEngine()
+    engine = BacktestEngine(mode='vectorized')
     results = []
     
     for csv_path in tqdm(files, desc="掃描市場"):
         try:
-            df = pd.read_csv(csv_path)
+            df = read_stock_file(csv_path)
             
             # 應用過濾條件
             if filter_func and not filter_func(df):
@@ -182,21 +179,18 @@ def compare_strategies(tickers: list,
     Returns:
         pd.DataFrame: 策略比較表
     """
-    engine = BacktestEngine()
+    engine = BacktestEngine(mode='vectorized')
     strategy_results = {s.name: [] for s in strategies}
     
-    files = get_all_stock_files()
-    
     for ticker in tqdm(tickers, desc="比較策略"):
-        matching = [f for f in files if ticker in os.path.basename(f)]
-        if not matching:
+        csv_path = find_stock_file(ticker)
+        if not csv_path:
             continue
             
         try:
-            df = pd.read_csv(matching[0])
+            df = read_stock_file(csv_path)
             
-            for strategy in strategies:
-                result = engine.run(df, strategy, verbose=False)
+            for strategy, result in zip(strategies, engine.run_many(df, strategies)):
                 strategy_results[strategy.name].append(result['metrics'])
                 
         except:
@@ -5,7 +5,13 @@
 import pandas as pd
 import numpy as np
 from .strategy import Strategy
+from .features import ensure_features, strategy_features
 from .metrics import calculate_metrics, print_metrics
+from . import kernels
+from .tradelog import TradeLog, SIDE_BUY, SIDE_SELL
+
+
+ENGINE_MODES = ('loop', 'vectorized', 'kernel')
 
 
 class BacktestEngine:
@@ -13,13 +19,23 @@ class BacktestEngine:
     回測引擎
     
     模擬交易過程並計算績效
+    
+    - mode='loop'：逐列模擬（原始實作）
+    - mode='vectorized'：以陣列推導持倉狀態與權益曲線，結果與逐列模擬相同，
+      適合全市場掃描、參數優化等大量呼叫 run() 的場合
+    - mode='kernel'：陣列化的逐日模擬（kernels.py，有 numba 時編譯執行）；
+      設定停損停利、部位規模或冷靜期時一律使用此路徑
     """
     
     def __init__(self,
                  initial_capital: float = 1_000_000,
                  commission: float = 0.001425,    # 手續費 0.1425%
                  tax: float = 0.003,              # 證交稅 0.3% (賣出時收)
-                 slippage: float = 0.001):        # 滑價 0.1%
+                 slippage: float = 0.001,         # 滑價 0.1%
+                 mode: str = 'loop',
+                 risk_manager=None,
+                 position_sizer=None,
+                 cooldown_days: int = 0):
         """
         初始化回測引擎
         
@@ -28,11 +44,27 @@ class BacktestEngine:
             commission: 手續費率（預設 0.1425%）
             tax: 證交稅率（預設 0.3%）
             slippage: 滑價率（預設 0.1%）
+            mode: 'loop'（逐列）、'vectorized'（向量化）或 'kernel'（編譯迴圈）
+            risk_manager: RiskManager，持有期間以收盤價檢查停損/停利/移動停損
+            position_sizer: PositionSizer，決定每次買入股數（取代 position_size）
+            cooldown_days: 出場後幾個交易日內不再進場
         """
+        if mode not in ENGINE_MODES:
+            raise ValueError(f"mode 必須是 {ENGINE_MODES} 之一: {mode}")
         self.initial_capital = initial_capital
         self.commission = commission
         self.tax = tax
         self.slippage = slippage
+        self.mode = mode
+        self.risk_manager = risk_manager
+        self.position_sizer = position_sizer
+        self.cooldown_days = cooldown_days
+    
+    @property
+    def path_dependent(self) -> bool:
+        """是否設定了需要逐日狀態的規則（停損停利、部位規模、冷靜期）"""
+        return (self.risk_manager is not None or self.position_sizer is not None
+                or self.cooldown_days > 0)
     
     def run(self, df: pd.DataFrame, strategy: Strategy, 
             position_size: float = 1.0,
@@ -54,32 +86,149 @@ class BacktestEngine:
                 'signals': 訊號序列
             }
         """
+        df = self._prepare(df, strategy.required_features())
+        
+        # 產生訊號
+        signals = strategy.generate_signals(df)
+        
+        return self._run_signals(df, strategy, signals, position_size, verbose)
+    
+    def run_many(self, df: pd.DataFrame, strategies: list,
+                 position_size: float = 1.0,
+                 verbose: bool = False,
+                 skip_errors: bool = False) -> list:
+        """
+        同一份資料一次回測多個策略
+        
+        資料只複製、整理一次，並一次補齊所有策略宣告的指標；各策略的訊號組成
+        (策略數, K 棒數) 矩陣，向量化模式下一次推導所有策略的進出場位置。
+        
+        Args:
+            df: 包含 OHLCV 的 DataFrame
+            strategies: 策略物件列表
+            position_size: 持倉比例（0-1，預設全倉）
+            verbose: 是否印出詳細資訊
+            skip_errors: 某個策略回測失敗時，該策略的結果為 None（不中斷其他策略）
+        
+        Returns:
+            list: 各策略的回測結果（格式同 run()，順序同 strategies）
+        """
+        df = self._prepare(df, strategy_features(strategies))
+        
+        # 訊號矩陣
+        signal_list = []
+        for strategy in strategies:
+            try:
+                signal_list.append(strategy.generate_signals(df))
+            except Exception:
+                if not skip_errors:
+                    raise
+                signal_list.append(None)
+        
+        transitions = {}
+        rows = [k for k, signals in enumerate(signal_list) if signals is not None]
+        if self.mode == 'vectorized' and not self.path_dependent and rows and len(df) > 0:
+            matrix = np.vstack([np.asarray(signal_list[k], dtype=float) for k in rows])
+            transitions = dict(zip(rows, _holding_transitions(matrix)))
+        
+        results = []
+        for k, (strategy, signals) in enumerate(zip(strategies, signal_list)):
+            if signals is None:
+                results.append(None)
+                continue
+            try:
+                results.append(self._run_signals(df, strategy, signals, position_size, verbose,
+                                                 transitions.get(k)))
+            except Exception:
+                if not skip_errors:
+                    raise
+                results.append(None)
+        return results
+    
+    def _prepare(self, df: pd.DataFrame, specs) -> pd.DataFrame:
+        """複製資料、欄位轉小寫並補算缺少的指標欄位"""
         # 複製資料避免修改原始 DataFrame
         df = df.copy()
         
         # 確保欄位名稱為小寫
         df.columns = [c.lower() for c in df.columns]
         
-        # 產生訊號
-        signals = strategy.generate_signals(df)
+        # 補算策略宣告但資料中缺少的指標欄位
+        ensure_features(df, specs)
+        return df
+    
+    def run_arrays(self, close, signals, labels=None, index=None, name: str = '',
+                   position_size: float = 1.0, verbose: bool = False) -> dict:
+        """
+        直接以陣列回測（不建立、不複製 DataFrame）
+        
+        參數掃描等大量呼叫的場合使用：價格與訊號陣列由呼叫端準備與快取。
+        
+        Args:
+            close: 收盤價陣列
+            signals: 訊號陣列（1 買 / -1 賣 / 其他 觀望）
+            labels: 每根 K 棒的日期（交易明細用；預設為位置）
+            index: 權益曲線的索引（預設 RangeIndex）
+            name: 策略名稱（寫入 metrics['strategy']）
+            position_size: 持倉比例（0-1，預設全倉）
+            verbose: 是否印出詳細資訊
+        
+        Returns:
+            dict: 格式同 run()（'signals' 為傳入的陣列）
+        """
+        close = np.asarray(close, dtype=float)
+        if index is None:
+            index = pd.RangeIndex(len(close))
+        return self._simulate(close, labels, index, name, signals, position_size, verbose)
+    
+    def _run_signals(self, df: pd.DataFrame, strategy: Strategy, signals: pd.Series,
+                     position_size: float, verbose: bool, transitions=None) -> dict:
+        """取出價格與日期後模擬交易"""
+        return self._simulate(df['close'].to_numpy(dtype=float), _date_labels(df), df.index,
+                              strategy.name, signals, position_size, verbose, transitions)
+    
+    def _simulate(self, close: np.ndarray, labels, index, name: str, signals,
+                  position_size: float, verbose: bool, transitions=None) -> dict:
+        """依引擎模式模擬交易並整理結果"""
+        if self.mode == 'kernel' or self.path_dependent:
+            trades, equity_curve = self._simulate_kernel(close, labels, signals, position_size, verbose)
+            return self._finish(index, name, signals, trades, equity_curve)
+        
+        if self.mode == 'vectorized':
+            simulated = self._simulate_vectorized(close, labels, signals, position_size, verbose,
+                                                  transitions)
+            if simulated is not None:
+                trades, equity_curve = simulated
+                return self._finish(index, name, signals, trades, equity_curve)
+        
+        trades, equity_curve = self._simulate_loop(close, labels, signals, position_size, verbose)
+        return self._finish(index, name, signals, trades, equity_curve)
+    
+    def _simulate_loop(self, close: np.ndarray, labels, signals,
+                       position_size: float, verbose: bool):
+        """
+        逐列模擬
         
+        Returns:
+            (trades, equity_curve)
+        """
         # 初始化
         capital = self.initial_capital
         position = 0  # 持股數量
         entry_price = 0  # 進場價格
-        trades = []  # 交易記錄
+        trades = TradeLog(labels)  # 交易記錄
         equity_curve = []  # 權益曲線
+        signal_values = np.asarray(signals).tolist()
         
-        for i, (idx, row) in enumerate(df.iterrows()):
-            signal = signals.iloc[i]
-            price = row['close']
+        for i, price in enumerate(close.tolist()):
+            signal = signal_values[i]
             
             # 計算目前權益
             current_equity = capital + position * price
             equity_curve.append(current_equity)
             
-            # 處理訊號
-            if signal == 1 and position == 0:
+            # 處理訊號（價格缺值或非正數的 K 棒不成交）
+            if signal == 1 and position == 0 and price > 0:
                 # 買入訊號且無持倉
                 buy_price = price * (1 + self.slippage)  # 滑價
                 shares = int((capital * position_size) / buy_price)
@@ -92,19 +241,12 @@ class BacktestEngine:
                     entry_price = buy_price
                     capital -= (cost + commission_fee)
                     
-                    trade = {
-                        'type': 'BUY',
-                        'date': str(row['date'])[:10] if 'date' in row else str(idx)[:10],
-                        'price': round(buy_price, 2),
-                        'shares': shares,
-                        'cost': round(cost + commission_fee, 2)
-                    }
-                    trades.append(trade)
+                    trades.append(i, SIDE_BUY, buy_price, shares, cost + commission_fee)
                     
                     if verbose:
-                        print(f"BUY: {trade['date']} @ ${trade['price']:.2f} x {shares}")
+                        _print_trade(trades.record(-1))
             
-            elif signal == -1 and position > 0:
+            elif signal == -1 and position > 0 and price > 0:
                 # 賣出訊號且有持倉
                 sell_price = price * (1 - self.slippage)  # 滑價
                 revenue = position * sell_price
@@ -114,20 +256,11 @@ class BacktestEngine:
                 net_revenue = revenue - commission_fee - tax_fee
                 profit = net_revenue - (entry_price * position)
                 
-                trade = {
-                    'type': 'SELL',
-                    'date': str(row['date'])[:10] if 'date' in row else str(idx)[:10],
-                    'price': round(sell_price, 2),
-                    'shares': position,
-                    'revenue': round(net_revenue, 2),
-                    'profit': round(profit, 2),
-                    'return': round(profit / (entry_price * position), 4)
-                }
-                trades.append(trade)
+                trades.append(i, SIDE_SELL, sell_price, position, net_revenue,
+                              pnl=profit, entry=entry_price)
                 
                 if verbose:
-                    print(f"SELL: {trade['date']} @ ${trade['price']:.2f}, "
-                          f"profit: ${trade['profit']:,.0f} ({trade['return']:.2%})")
+                    _print_trade(trades.record(-1))
                 
                 capital += net_revenue
                 position = 0
@@ -135,19 +268,23 @@ class BacktestEngine:
         
         # 如果結束時還有持倉，以最後價格計算
         if position > 0:
-            final_price = df['close'].iloc[-1]
+            final_price = close[-1]
             final_equity = capital + position * final_price
         else:
             final_equity = capital
         
         equity_curve[-1] = final_equity
         
+        return trades, equity_curve
+    
+    def _finish(self, index, name, signals, trades, equity_curve) -> dict:
+        """整理回測結果並計算績效指標"""
         # 轉換為 Series
-        equity_series = pd.Series(equity_curve, index=df.index)
+        equity_series = pd.Series(equity_curve, index=index)
         
         # 計算績效指標
         metrics = calculate_metrics(trades, equity_series, self.initial_capital)
-        metrics['strategy'] = strategy.name
+        metrics['strategy'] = name
         
         return {
             'trades': trades,
@@ -156,6 +293,129 @@ class BacktestEngine:
             'signals': signals
         }
     
+    def _simulate_kernel(self, close: np.ndarray, labels, signals,
+                         position_size: float, verbose: bool):
+        """
+        以 kernels.simulate 執行逐日模擬，再整理成與逐列模擬相同格式的交易明細
+        
+        Returns:
+            (trades, equity_curve)
+        """
+        out = kernels.simulate(
+            close, signals,
+            self.initial_capital, self.commission, self.tax, self.slippage,
+            position_size=position_size,
+            position_sizer=self.position_sizer,
+            risk_manager=self.risk_manager,
+            cooldown=self.cooldown_days)
+        
+        # 買賣交錯出現：每筆賣出的進場價就是前一筆買入價
+        side = np.where(out['side'] == 1, SIDE_BUY, SIDE_SELL)
+        entry = np.concatenate(([0.0], out['price'][:-1])) if len(side) else out['price']
+        entry = np.where(side == SIDE_SELL, entry, 0.0)
+        
+        trades = TradeLog.from_arrays(
+            labels, out['bar'], side, out['price'], out['shares'],
+            out['amount'], out['profit'], entry,
+            reason_codes=out['reason'], reason_names=kernels.EXIT_REASONS)
+        
+        if verbose:
+            for trade in trades:
+                _print_trade(trade)
+        
+        return trades, out['equity']
+    
+    def _simulate_vectorized(self, close: np.ndarray, labels, signals,
+                             position_size: float, verbose: bool, transitions=None):
+        """
+        向量化模擬（單一部位、只做多）
+        
+        持倉狀態 = 最近一個非零訊號（往前填）：1 表示持有，-1 或尚無訊號表示空手；
+        狀態由空手轉持有的那天買入、由持有轉空手的那天賣出。
+        資金只在進出場時變動，逐筆交易累計後再展開成每日權益。
+        
+        Args:
+            transitions: 已算好的 (進場位置, 出場位置)（run_many 一次算完所有策略）
+        
+        Returns:
+            (trades, equity_curve)；若某次買入股數為 0（資金不足一股）或進出場當天價格缺值
+            （之後的訊號會再嘗試，狀態推導不成立）則回傳 None 改用逐列模擬
+        """
+        n = len(close)
+        if n == 0:
+            return None
+        
+        if transitions is None:
+            transitions = _holding_transitions(np.asarray(signals, dtype=float)[None, :])[0]
+        entries, exits = transitions
+        
+        capital = self.initial_capital
+        trades = TradeLog(labels, capacity=2 * len(entries))
+        event_bars = []
+        event_cash = []
+        event_pos = []
+        
+        for k, i in enumerate(entries):
+            # 買入
+            price = close[i]
+            if not price > 0:
+                # 價格缺值：逐列模擬不成交，之後的訊號會再嘗試
+                return None
+            buy_price = price * (1 + self.slippage)  # 滑價
+            shares = int((capital * position_size) / buy_price)
+            if shares <= 0:
+                return None
+            
+            cost = shares * buy_price
+            commission_fee = cost * self.commission
+            entry_price = buy_price
+            capital -= (cost + commission_fee)
+            
+            trades.append(i, SIDE_BUY, buy_price, shares, cost + commission_fee)
+            event_bars.append(i)
+            event_cash.append(capital)
+            event_pos.append(shares)
+            
+            if k >= len(exits):
+                break
+            
+            # 賣出
+            j = exits[k]
+            if not close[j] > 0:
+                return None
+            sell_price = close[j] * (1 - self.slippage)  # 滑價
+            revenue = shares * sell_price
+            commission_fee = revenue * self.commission
+            tax_fee = revenue * self.tax
+            
+            net_revenue = revenue - commission_fee - tax_fee
+            profit = net_revenue - (entry_price * shares)
+            
+            trades.append(j, SIDE_SELL, sell_price, shares, net_revenue,
+                          pnl=profit, entry=entry_price)
+            
+            capital += net_revenue
+            event_bars.append(j)
+            event_cash.append(capital)
+            event_pos.append(0)
+        
+        # 每日收盤前的資金與持股 = 前一個進出場事件之後的狀態
+        event_cash = np.asarray([self.initial_capital] + event_cash, dtype=float)
+        event_pos = np.asarray([0] + event_pos, dtype=float)
+        prior = np.searchsorted(np.asarray(event_bars, dtype=np.int64), np.arange(n), side='left')
+        equity_curve = event_cash[prior] + event_pos[prior] * close
+        
+        # 結束時以最後價格計算
+        if event_pos[-1] > 0:
+            equity_curve[-1] = event_cash[-1] + event_pos[-1] * close[-1]
+        else:
+            equity_curve[-1] = event_cash[-1]
+        
+        if verbose:
+            for trade in trades:
+                _print_trade(trade)
+        return trades, equity_curve
+    
     def run_multiple(self, df: pd.DataFrame, strategies: list,
                      verbose: bool = False) -> pd.DataFrame:
         """
@@ -169,18 +429,13 @@ class BacktestEngine:
         Returns:
             pd.DataFrame: 各策略績效比較表
         """
-        results = []
-        
-        for strategy in strategies:
-            result = self.run(df, strategy, verbose=verbose)
-            metrics = result['metrics']
-            results.append(metrics)
+        results = [result['metrics'] for result in self.run_many(df, strategies, verbose=verbose)]
         
         return pd.DataFrame(results)
     
     def optimize(self, df: pd.DataFrame, strategy_class: type,
                  param_grid: dict, metric: str = 'sharpe_ratio',
-                 verbose: bool = False) -> dict:
+                 verbose: bool = False, num_workers: int = 1) -> dict:
         """
         參數優化
         
@@ -190,6 +445,7 @@ class BacktestEngine:
             param_grid: 參數網格 {'short_period': [5,10,20], 'long_period': [20,60]}
             metric: 優化目標指標 (sharpe_ratio, total_return, max_drawdown, win_rate)
             verbose: 是否印出詳細資訊
+            num_workers: 平行回測的行程數（1 為單行程，0 為 CPU 核心數；資料放在共享記憶體）
         
         Returns:
             dict: {
@@ -200,6 +456,7 @@ class BacktestEngine:
             }
         """
         from itertools import product
+        from .optimizer import evaluate_grid
         
         # 產生所有參數組合
         param_names = list(param_grid.keys())
@@ -214,42 +471,37 @@ class BacktestEngine:
         best_params = None
         best_result = None
         
-        for combo in combinations:
-            # 建立參數字典
-            params = dict(zip(param_names, combo))
-            
-            try:
-                # 建立策略實例
-                strategy = strategy_class(**params)
-                
-                # 執行回測
-                result = self.run(df, strategy, verbose=False)
-                
-                # 記錄結果
-                record = params.copy()
-                record.update(result['metrics'])
-                all_results.append(record)
-                
-                # 檢查是否為最佳
-                score = result['metrics'].get(metric, 0)
-                
-                if metric == 'max_drawdown':
-                    # 回撤越小越好（越接近 0）
-                    if score > best_score:
-                        best_score = score
-                        best_params = params
-                        best_result = result
-                else:
-                    # 其他指標越大越好
-                    if score > best_score:
-                        best_score = score
-                        best_params = params
-                        best_result = result
-                        
-            except Exception as e:
+        outcomes = evaluate_grid(self, df, strategy_class, param_names, combinations,
+                                 num_workers=num_workers, progress=False)
+        
+        for params, metrics, error in outcomes:
+            if metrics is None:
                 if verbose:
-                    print(f"  ❌ 參數 {params} 失敗: {e}")
+                    print(f"  ❌ 參數 {params} 失敗: {error}")
                 continue
+            
+            # 記錄結果
+            record = params.copy()
+            record.update(metrics)
+            all_results.append(record)
+            
+            # 檢查是否為最佳
+            score = metrics.get(metric, 0)
+            
+            if metric == 'max_drawdown':
+                # 回撤越小越好（越接近 0）
+                if score > best_score:
+                    best_score = score
+                    best_params = params
+            else:
+                # 其他指標越大越好
+                if score > best_score:
+                    best_score = score
+                    best_params = params
+        
+        # 只保留分數，最佳組合重新回測一次取得完整結果
+        if best_params is not None:
+            best_result = self.run(df, strategy_class(**best_params), verbose=False)
         
         if verbose and best_params:
             print(f"\n🏆 最佳參數: {best_params}")
@@ -263,6 +515,65 @@ class BacktestEngine:
         }
 
 
+def _holding_changes(signal_matrix: np.ndarray) -> tuple:
+    """
+    由訊號矩陣推導所有進出場位置（未分列）
+    
+    持倉狀態 = 最近一個非零訊號（往前填）：1 表示持有，-1 或尚無訊號表示空手。
+    
+    Args:
+        signal_matrix: (列數, K 棒數) 訊號（1 買 / -1 賣 / 其他 觀望）
+    
+    Returns:
+        tuple: (進場列, 進場位置, 出場列, 出場位置)，依列、位置排序
+    """
+    n = signal_matrix.shape[1]
+    marks = np.where(signal_matrix == 1, 1, np.where(signal_matrix == -1, -1, 0))
+    
+    # 最近一個非零訊號的位置（往前填）
+    last = np.where(marks != 0, np.arange(n), -1)
+    np.maximum.accumulate(last, axis=1, out=last)
+    holding = (last >= 0) & (np.take_along_axis(marks, np.maximum(last, 0), axis=1) == 1)
+    was_holding = np.zeros_like(holding)
+    was_holding[:, 1:] = holding[:, :-1]
+    
+    entry_rows, entry_bars = np.nonzero(holding & ~was_holding)
+    exit_rows, exit_bars = np.nonzero(~holding & was_holding)
+    return entry_rows, entry_bars, exit_rows, exit_bars
+
+
+def _holding_transitions(signal_matrix: np.ndarray) -> list:
+    """
+    由訊號矩陣推導每列的進出場位置
+    
+    Args:
+        signal_matrix: (策略數, K 棒數) 訊號（1 買 / -1 賣 / 其他 觀望）
+    
+    Returns:
+        list: 每列一組 (進場位置, 出場位置)
+    """
+    entry_rows, entry_bars, exit_rows, exit_bars = _holding_changes(signal_matrix)
+    splits = np.arange(1, signal_matrix.shape[0])
+    entries = np.split(entry_bars, np.searchsorted(entry_rows, splits))
+    exits = np.split(exit_bars, np.searchsorted(exit_rows, splits))
+    return list(zip(entries, exits))
+
+
+def _date_labels(df: pd.DataFrame) -> pd.Series:
+    """交易日期的來源：date 欄位，沒有時用 index"""
+    return df['date'] if 'date' in df.columns else df.index.to_series()
+
+
+def _print_trade(trade: dict):
+    """印出單筆交易（verbose 模式）"""
+    if trade['type'] == 'BUY':
+        print(f"BUY: {trade['date']} @ ${trade['price']:.2f} x {trade['shares']}")
+    else:
+        reason = f" [{trade['reason']}]" if trade.get('reason') else ""
+        print(f"SELL: {trade['date']} @ ${trade['price']:.2f}, "
+              f"profit: ${trade['profit']:,.0f} ({trade['return']:.2%}){reason}")
+
+
 def quick_backtest(csv_path: str, strategy: Strategy, 
                    initial_capital: float = 1_000_000,
                    show_report: bool = True) -> dict:
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+隨需計算的指標欄位
+
+策略用 required_features() 宣告需要的指標（例如 MA(10)、RSI(14)），
+回測前只補算 DataFrame 缺少的欄位。計算結果依 (股票, 指標, 輸入資料) 快取，
+同一輪回測中的多個策略、參數掃描中重複出現的均線都只算一次。
+"""
+import os
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import numpy as np
+
+# 確保可以匯入專案模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indicators
+
+
+# ========== 指標規格 ==========
+
+class Feature:
+    """
+    指標規格基類
+
+    子類別定義 inputs（需要的原始欄位）、columns（產出欄位）與 compute()。
+    規格以 (類別, 參數) 判斷相等，可作為快取鍵。
+    columnwise 表示 compute() 只做逐欄的 pandas 運算（rolling、shift、ewm），
+    全市場面板可以把 (K 棒 × 股票) 寬表當成欄位傳入一次計算；否則逐檔計算。
+    """
+
+    inputs = ('close',)
+    columnwise = False
+
+    def __init__(self, *params):
+        self.params = params
+
+    @property
+    def columns(self) -> tuple:
+        raise NotImplementedError("請實作 columns")
+
+    def compute(self, frame: pd.DataFrame) -> dict:
+        """
+        計算指標
+
+        Args:
+            frame: 只含 inputs 欄位的 DataFrame
+
+        Returns:
+            dict: {欄位名稱: 數值序列}
+        """
+        raise NotImplementedError("請實作 compute 方法")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.params == other.params
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.params))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(str(p) for p in self.params)})"
+
+
+class MA(Feature):
+    """簡單移動平均 ma{n}"""
+
+    columnwise = True
+
+    def __init__(self, period: int):
+        super().__init__(int(period))
+
+    @property
+    def columns(self):
+        return (f'ma{self.params[0]}',)
+
+    def compute(self, frame):
+        return _collect(indicators.calc_ma(frame, [self.params[0]]), self.columns)
+
+
+class EMA(Feature):
+    """指數移動平均 ema{n}"""
+
+    columnwise = True
+
+    def __init__(self, period: int):
+        super().__init__(int(period))
+
+    @property
+    def columns(self):
+        return (f'ema{self.params[0]}',)
+
+    def compute(self, frame):
+        return _collect(indicators.calc_ema(frame, [self.params[0]]), self.columns)
+
+
+class RSI(Feature):
+    """RSI；預設週期 14 對應既有的 rsi 欄位，其他週期為 rsi{n}"""
+
+    columnwise = True
+
+    def __init__(self, period: int = 14):
+        super().__init__(int(period))
+
+    @property
+    def columns(self):
+        period = self.params[0]
+        return ('rsi',) if period == 14 else (f'rsi{period}',)
+
+    def compute(self, frame):
+        frame = indicators.calc_rsi(frame, self.params[0])
+        return {self.columns[0]: frame['rsi']}
+
+
+class MACD(Feature):
+    """MACD 線、信號線與柱狀體"""
+
+    columnwise = True
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        super().__init__(int(fast), int(slow), int(signal))
+
+    @property
+    def columns(self):
+        suffix = '' if self.params == (12, 26, 9) else '_' + '_'.join(str(p) for p in self.params)
+        return (f'macd{suffix}', f'macd_signal{suffix}', f'macd_hist{suffix}')
+
+    def compute(self, frame):
+        frame = indicators.calc_macd(frame, *self.params)
+        return dict(zip(self.columns, (frame['macd'], frame['macd_signal'], frame['macd_hist'])))
+
+
+class KD(Feature):
+    """KD 隨機指標"""
+
+    inputs = ('high', 'low', 'close')
+    columnwise = True
+
+    def __init__(self, k_period: int = 9, d_period: int = 3):
+        super().__init__(int(k_period), int(d_period))
+
+    @property
+    def columns(self):
+        suffix = '' if self.params == (9, 3) else '_' + '_'.join(str(p) for p in self.params)
+        return (f'k{suffix}', f'd{suffix}')
+
+    def compute(self, frame):
+        frame = indicators.calc_kd(frame, *self.params)
+        return dict(zip(self.columns, (frame['k'], frame['d'])))
+
+
+class BBANDS(Feature):
+    """布林通道上、中、下軌"""
+
+    columnwise = True
+
+    def __init__(self, period: int = 20, std_dev: float = 2):
+        super().__init__(int(period), std_dev)
+
+    @property
+    def columns(self):
+        suffix = '' if self.params == (20, 2) else '_' + '_'.join(str(p) for p in self.params)
+        return (f'bb_upper{suffix}', f'bb_middle{suffix}', f'bb_lower{suffix}')
+
+    def compute(self, frame):
+        frame = indicators.calc_bollinger(frame, *self.params)
+        return dict(zip(self.columns, (frame['bb_upper'], frame['bb_middle'], frame['bb_lower'])))
+
+
+class ATR(Feature):
+    """ATR 真實波動幅度均值"""
+
+    inputs = ('high', 'low', 'close')
+
+    def __init__(self, period: int = 14):
+        super().__init__(int(period))
+
+    @property
+    def columns(self):
+        period = self.params[0]
+        return ('atr',) if period == 14 else (f'atr{period}',)
+
+    def compute(self, frame):
+        frame = indicators.calc_atr(frame, self.params[0])
+        return {self.columns[0]: frame['atr']}
+
+
+class VolumeMA(Feature):
+    """成交量均線 vol_ma{n}"""
+
+    inputs = ('volume',)
+    columnwise = True
+
+    def __init__(self, period: int):
+        super().__init__(int(period))
+
+    @property
+    def columns(self):
+        return (f'vol_ma{self.params[0]}',)
+
+    def compute(self, frame):
+        return _collect(indicators.calc_volume_ma(frame, [self.params[0]]), self.columns)
+
+
+def _collect(frame, columns):
+    return {col: frame[col] for col in columns}
+
+
+# ========== 計算結果快取 ==========
+
+FEATURE_CACHE_SIZE = 512   # 最多保留的 (股票, 指標) 組數
+
+_feature_cache = OrderedDict()
+_feature_lock = threading.Lock()
+
+
+def _fingerprint(df: pd.DataFrame, columns) -> tuple:
+    """輸入欄位的內容指紋：同一檔股票換了日期區間或資料更新時不會誤用舊結果"""
+    digest = hashlib.blake2b(digest_size=16)
+    for col in columns:
+        values = np.ascontiguousarray(df[col].to_numpy(dtype=float))
+        digest.update(values.tobytes())
+    return len(df), digest.hexdigest()
+
+
+def _cached_compute(df: pd.DataFrame, spec: Feature, key) -> dict:
+    cache_key = (key, spec, _fingerprint(df, spec.inputs))
+    with _feature_lock:
+        values = _feature_cache.get(cache_key)
+        if values is not None:
+            _feature_cache.move_to_end(cache_key)
+            return values
+
+    frame = pd.DataFrame({col: df[col].to_numpy(dtype=float) for col in spec.inputs})
+    values = {col: np.asarray(series, dtype=float) for col, series in spec.compute(frame).items()}
+    for arr in values.values():
+        arr.setflags(write=False)
+
+    with _feature_lock:
+        _feature_cache[cache_key] = values
+        while len(_feature_cache) > FEATURE_CACHE_SIZE:
+            _feature_cache.popitem(last=False)
+    return values
+
+
+def ensure_features(df: pd.DataFrame, specs, key=None) -> pd.DataFrame:
+    """
+    補上 DataFrame 缺少的指標欄位（就地加入，已存在的欄位不重算）
+
+    Args:
+        df: 包含 OHLCV 的 DataFrame（欄位小寫）
+        specs: 指標規格列表，例如 [MA(10), RSI()]
+        key: 快取命名空間（通常是股票代號）；預設取 df.attrs['ticker']
+
+    Returns:
+        df: 同一個 DataFrame
+    """
+    if key is None:
+        key = df.attrs.get('ticker')
+    for spec in specs:
+        missing = [col for col in spec.columns if col not in df.columns]
+        if not missing:
+            continue
+        values = _cached_compute(df, spec, key)
+        for col in missing:
+            df[col] = values[col].copy()
+    return df
+
+
+def strategy_features(strategies) -> list:
+    """合併多個策略宣告的指標（去除重複，保留順序）"""
+    specs = []
+    for strategy in strategies:
+        for spec in strategy.required_features():
+            if spec not in specs:
+                specs.append(spec)
+    return specs
+
+
+def clear_feature_cache():
+    """清空指標快取"""
+    with _feature_lock:
+        _feature_cache.clear()
+
+
+def feature_cache_info() -> dict:
+    """快取狀態"""
+    with _feature_lock:
+        return {'entries': len(_feature_cache), 'max_entries': FEATURE_CACHE_SIZE}
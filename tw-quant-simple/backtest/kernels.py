@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+路徑相依回測的內層迴圈
+
+停損停利、移動停損、冷靜期與部位規模都依賴前一天的狀態，無法單純用陣列推導。
+這裡把逐日模擬寫成只操作陣列的函數：安裝 numba 時編譯執行，否則以純 Python 執行
+（結果相同，只是較慢）。
+"""
+import numpy as np
+
+# 嘗試導入 numba（選用）
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# ========== 代碼對照 ==========
+
+# 部位規模計算方式（對應 PositionSizer.method）
+SIZING_ALL_IN = 0        # 未指定：capital * position_size / 價格
+SIZING_PERCENT = 1
+SIZING_FIXED_AMOUNT = 2
+SIZING_KELLY = 3
+
+SIZING_CODES = {
+    'percent': SIZING_PERCENT,
+    'fixed_amount': SIZING_FIXED_AMOUNT,
+    'kelly': SIZING_KELLY,
+}
+
+# 出場原因（對應 RiskManager.check_exit 的回傳值）
+EXIT_SIGNAL = 0
+EXIT_STOP_LOSS = 1
+EXIT_TAKE_PROFIT = 2
+EXIT_TRAILING_STOP = 3
+
+EXIT_REASONS = {
+    EXIT_SIGNAL: None,
+    EXIT_STOP_LOSS: 'STOP_LOSS',
+    EXIT_TAKE_PROFIT: 'TAKE_PROFIT',
+    EXIT_TRAILING_STOP: 'TRAILING_STOP',
+}
+
+
+def sizing_params(position_sizer) -> tuple:
+    """PositionSizer → (方式代碼, 數值)；None 表示沿用 position_size 全額買入"""
+    if position_sizer is None:
+        return SIZING_ALL_IN, 0.0
+    if position_sizer.method not in SIZING_CODES:
+        raise ValueError(f"不支援的部位規模計算方式: {position_sizer.method}")
+    return SIZING_CODES[position_sizer.method], float(position_sizer.value)
+
+
+def risk_params(risk_manager) -> tuple:
+    """RiskManager → (停損, 停利, 移動停損)；0 表示不啟用"""
+    if risk_manager is None:
+        return 0.0, 0.0, 0.0
+    return (float(risk_manager.stop_loss_pct or 0),
+            float(risk_manager.take_profit_pct or 0),
+            float(risk_manager.trailing_stop_pct or 0))
+
+
+# ========== 模擬核心 ==========
+
+def _simulate(close, signals, initial_capital, commission, tax, slippage,
+              position_size, sizing_method, sizing_value,
+              stop_loss, take_profit, trailing_stop, cooldown):
+    """
+    單一部位、只做多的逐日模擬
+
+    與 BacktestEngine 逐列模擬相同的成交與成本計算；另外：
+    - 持有期間每天先以收盤價檢查停損/停利/移動停損（同 RiskManager.check_exit，
+      最高價從進場隔天起算），觸發即以當天價格賣出
+    - 價格缺值（NaN）或非正數的 K 棒不進出場
+    - 出場後 cooldown 個交易日內不再進場
+    - sizing_method 非 0 時以 PositionSizer 的規則決定股數；凱利公式使用到目前為止
+      已實現交易的勝率與賠率（尚無交易時用 10%）
+
+    Args:
+        close: 收盤價
+        signals: 訊號（1 買 / -1 賣 / 其他 觀望）
+
+    Returns:
+        (trade_bar, trade_side, trade_price, trade_shares, trade_amount,
+         trade_profit, trade_reason, n_trades, equity)
+        trade_amount 買入為含手續費成本、賣出為淨收入；trade_side 1=買、-1=賣
+    """
+    n = len(close)
+    trade_bar = np.empty(n, dtype=np.int64)
+    trade_side = np.empty(n, dtype=np.int8)
+    trade_price = np.empty(n, dtype=np.float64)
+    trade_shares = np.empty(n, dtype=np.int64)
+    trade_amount = np.empty(n, dtype=np.float64)
+    trade_profit = np.empty(n, dtype=np.float64)
+    trade_reason = np.empty(n, dtype=np.int8)
+    equity = np.empty(n, dtype=np.float64)
+
+    capital = initial_capital
+    position = 0
+    entry_price = 0.0
+    highest = 0.0
+    last_exit = -1
+    n_trades = 0
+
+    # 凱利公式用的已實現交易統計
+    n_closed = 0
+    n_wins = 0
+    n_losses = 0
+    sum_wins = 0.0
+    sum_losses = 0.0
+
+    for i in range(n):
+        price = close[i]
+        signal = signals[i]
+
+        # 計算目前權益
+        equity[i] = capital + position * price
+
+        exit_reason = -1
+        if position > 0 and price > 0:
+            # 停損停利（同 RiskManager.check_exit）
+            if price > highest:
+                highest = price
+            if stop_loss != 0 and price <= entry_price * (1 - stop_loss):
+                exit_reason = EXIT_STOP_LOSS
+            elif take_profit != 0 and price >= entry_price * (1 + take_profit):
+                exit_reason = EXIT_TAKE_PROFIT
+            elif trailing_stop != 0 and highest > 0 and price <= highest * (1 - trailing_stop):
+                exit_reason = EXIT_TRAILING_STOP
+            elif signal == -1:
+                exit_reason = EXIT_SIGNAL
+
+        if exit_reason >= 0:
+            sell_price = price * (1 - slippage)  # 滑價
+            revenue = position * sell_price
+            commission_fee = revenue * commission
+            tax_fee = revenue * tax
+
+            net_revenue = revenue - commission_fee - tax_fee
+            profit = net_revenue - (entry_price * position)
+
+            trade_bar[n_trades] = i
+            trade_side[n_trades] = -1
+            trade_price[n_trades] = sell_price
+            trade_shares[n_trades] = position
+            trade_amount[n_trades] = net_revenue
+            trade_profit[n_trades] = profit
+            trade_reason[n_trades] = exit_reason
+            n_trades += 1
+
+            n_closed += 1
+            if profit > 0:
+                n_wins += 1
+                sum_wins += profit
+            elif profit < 0:
+                n_losses += 1
+                sum_losses += profit
+
+            capital += net_revenue
+            position = 0
+            entry_price = 0.0
+            last_exit = i
+
+        elif signal == 1 and position == 0 and (last_exit < 0 or i - last_exit >= cooldown):
+            buy_price = price * (1 + slippage)  # 滑價
+
+            if not buy_price > 0:
+                # 價格缺值（NaN）或非正數：不進場
+                shares = 0
+            elif sizing_method == SIZING_ALL_IN:
+                shares = int((capital * position_size) / buy_price)
+            else:
+                # 同 PositionSizer.get_shares
+                if sizing_method == SIZING_PERCENT:
+                    target_amount = capital * sizing_value
+                elif sizing_method == SIZING_FIXED_AMOUNT:
+                    target_amount = min(capital, sizing_value)
+                else:
+                    win_rate = n_wins / n_closed if n_closed > 0 else 0.0
+                    avg_win = sum_wins / n_wins if n_wins > 0 else 0.0
+                    avg_loss = sum_losses / n_losses if n_losses > 0 else 0.0
+                    ratio = abs(avg_win / avg_loss) if avg_loss != 0 else 0.0
+                    if win_rate <= 0 or ratio <= 0:
+                        target_amount = capital * 0.1
+                    else:
+                        kelly_fraction = win_rate - (1 - win_rate) / ratio
+                        kelly_fraction = min(0.5, max(0.0, kelly_fraction * 0.5))
+                        target_amount = capital * kelly_fraction
+                shares = int(target_amount // buy_price)
+
+            if shares > 0:
+                cost = shares * buy_price
+                commission_fee = cost * commission
+
+                position = shares
+                entry_price = buy_price
+                highest = 0.0
+                capital -= (cost + commission_fee)
+
+                trade_bar[n_trades] = i
+                trade_side[n_trades] = 1
+                trade_price[n_trades] = buy_price
+                trade_shares[n_trades] = shares
+                trade_amount[n_trades] = cost + commission_fee
+                trade_profit[n_trades] = 0.0
+                trade_reason[n_trades] = EXIT_SIGNAL
+                n_trades += 1
+
+    # 結束時還有持倉，以最後價格計算
+    if n > 0 and position > 0:
+        equity[n - 1] = capital + position * close[n - 1]
+    elif n > 0:
+        equity[n - 1] = capital
+
+    return (trade_bar, trade_side, trade_price, trade_shares, trade_amount,
+            trade_profit, trade_reason, n_trades, equity)
+
+
+if NUMBA_AVAILABLE:
+    _simulate_compiled = njit(cache=True)(_simulate)
+else:
+    _simulate_compiled = None
+
+
+def simulate(close, signals, initial_capital: float, commission: float, tax: float,
+             slippage: float, position_size: float = 1.0,
+             position_sizer=None, risk_manager=None, cooldown: int = 0,
+             use_numba: bool = True) -> dict:
+    """
+    執行路徑相依模擬
+
+    Args:
+        close: 收盤價（轉為連續 float64 陣列）
+        signals: 訊號（轉為 int8 陣列，NaN 視為 0）
+        initial_capital / commission / tax / slippage: 同 BacktestEngine
+        position_size: 未指定 position_sizer 時的持倉比例
+        position_sizer: PositionSizer（選用）
+        risk_manager: RiskManager（選用）
+        cooldown: 出場後幾個交易日內不進場
+        use_numba: 有安裝 numba 時是否使用編譯版本
+
+    Returns:
+        dict: {'bar', 'side', 'price', 'shares', 'amount', 'profit', 'reason'}（各筆交易）
+              與 'equity'（每日權益）
+    """
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    sig = np.asarray(signals, dtype=np.float64)
+    sig = np.where(sig == 1, 1, np.where(sig == -1, -1, 0)).astype(np.int8)
+
+    sizing_method, sizing_value = sizing_params(position_sizer)
+    stop_loss, take_profit, trailing_stop = risk_params(risk_manager)
+    args = (float(initial_capital), float(commission), float(tax), float(slippage),
+            float(position_size), sizing_method, sizing_value,
+            stop_loss, take_profit, trailing_stop, int(cooldown))
+
+    if use_numba and _simulate_compiled is not None:
+        out = _simulate_compiled(close, sig, *args)
+    else:
+        # 純 Python：逐元素存取 list 比 numpy 純量快
+        out = _simulate(close.tolist(), sig.tolist(), *args)
+
+    bar, side, price, shares, amount, profit, reason, n_trades, equity = out
+    return {
+        'bar': bar[:n_trades],
+        'side': side[:n_trades],
+        'price': price[:n_trades],
+        'shares': shares[:n_trades],
+        'amount': amount[:n_trades],
+        'profit': profit[:n_trades],
+        'reason': reason[:n_trades],
+        'equity': equity,
+    }
@@ -1,105 +1,281 @@
 # -*- coding: utf-8 -*-
 """
 績效指標計算
+
+核心是只吃陣列的 equity_metrics()：權益可以是一條 (K 棒數,) 或一次多條 (策略數, K 棒數)，
+逐列一次算完，掃描與參數優化可以整批計算。calculate_metrics() 是單次回測用的包裝，
+輸出格式（含四捨五入規則）與原本相同。
 """
 import pandas as pd
 import numpy as np
+from .tradelog import TradeLog
+
+
+TRADING_DAYS = 252
+
+
+# ========== 陣列核心 ==========
+
+def equity_metrics(equity, initial_capital, risk_free_rate: float = 0.02,
+                   position=None, traded_value=None) -> dict:
+    """
+    由權益曲線計算報酬與風險指標（不四捨五入）
+    
+    Args:
+        equity: float64 權益，(K 棒數,) 或 (策略數, K 棒數)
+        initial_capital: 初始資金（純量或每列一個）
+        risk_free_rate: 無風險利率（年化）
+        position: 持倉（股數或市值，同 equity 形狀），非 0 視為有曝險；None 則曝險為 NaN
+        traded_value: 每列的成交總金額（買入成本 + 賣出收入）；None 則週轉率為 NaN
+    
+    Returns:
+        dict: 1-D 輸入回傳純量，2-D 輸入回傳每列一個值的陣列
+            final_capital, total_return, annual_return, volatility, sharpe_ratio,
+            sortino_ratio, max_drawdown, max_drawdown_bar（-1 = 無）, max_drawdown_duration,
+            calmar_ratio, exposure, turnover
+    """
+    eq = np.asarray(equity, dtype=np.float64)
+    single = eq.ndim == 1
+    eq = np.atleast_2d(eq)
+    rows, n = eq.shape
+    if n == 0:
+        raise ValueError("權益曲線不可為空")
+    init = np.broadcast_to(np.asarray(initial_capital, dtype=np.float64), (rows,))
+    
+    # ========== 報酬率 ==========
+    final = eq[:, -1]
+    total_return = (final - init) / init
+    annual_return = (1 + total_return) ** (TRADING_DAYS / n) - 1
+    
+    # ========== 波動（每日報酬，略過缺值） ==========
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rets = eq[:, 1:] / eq[:, :-1] - 1
+        valid = ~np.isnan(rets)
+        count = valid.sum(axis=1)
+        filled = np.where(valid, rets, 0.0)
+        mean = filled.sum(axis=1) / count
+        dev = np.where(valid, mean[:, None] - rets, 0.0)
+        var = (dev ** 2).sum(axis=1) / (count - 1)
+        var[count < 2] = np.nan
+        volatility = np.sqrt(var) * np.sqrt(TRADING_DAYS)
+        
+        downside = np.minimum(filled, 0.0)
+        downside_dev = np.sqrt((downside ** 2).sum(axis=1) / count) * np.sqrt(TRADING_DAYS)
+        
+        excess = annual_return - risk_free_rate
+        sharpe = np.where(volatility > 0, excess / volatility, 0.0)
+        sortino = np.where(downside_dev > 0, excess / downside_dev, 0.0)
+        
+        # ========== 回撤 ==========
+        running_max = np.fmax.accumulate(eq, axis=1)
+        drawdown = (eq - running_max) / running_max
+    
+    max_drawdown = np.fmin.reduce(drawdown, axis=1)
+    no_drawdown = np.isnan(max_drawdown)
+    max_drawdown_bar = np.where(no_drawdown, -1,
+                                np.argmin(np.where(np.isnan(drawdown), np.inf, drawdown), axis=1))
+    
+    # 回撤持續期間：距離上一個新高的 K 棒數，取最長
+    bars = np.arange(n)
+    underwater = drawdown < 0
+    last_peak = np.maximum.accumulate(np.where(underwater, 0, bars), axis=1)
+    max_drawdown_duration = (bars - last_peak).max(axis=1)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        calmar = np.where(max_drawdown < 0, annual_return / np.abs(max_drawdown), 0.0)
+    
+    # ========== 曝險與週轉 ==========
+    if position is not None:
+        held = np.atleast_2d(np.asarray(position)) != 0
+        exposure = held.mean(axis=1)
+    else:
+        exposure = np.full(rows, np.nan)
+    
+    if traded_value is not None:
+        avg_equity = np.nanmean(eq, axis=1)
+        turnover = (np.broadcast_to(np.asarray(traded_value, dtype=np.float64), (rows,))
+                    / avg_equity * (TRADING_DAYS / n))
+    else:
+        turnover = np.full(rows, np.nan)
+    
+    result = {
+        'final_capital': final,
+        'total_return': total_return,
+        'annual_return': annual_return,
+        'volatility': volatility,
+        'sharpe_ratio': sharpe,
+        'sortino_ratio': sortino,
+        'max_drawdown': max_drawdown,
+        'max_drawdown_bar': max_drawdown_bar,
+        'max_drawdown_duration': max_drawdown_duration,
+        'calmar_ratio': calmar,
+        'exposure': exposure,
+        'turnover': turnover,
+    }
+    if single:
+        return {key: values[0] for key, values in result.items()}
+    return result
+
+
+def trade_metrics(profits) -> dict:
+    """
+    由已實現損益計算交易統計（不四捨五入）
+    
+    Args:
+        profits: 每筆交易損益陣列
+    
+    Returns:
+        dict: win_rate, avg_win, avg_loss, profit_factor, total_profit, total_loss
+    """
+    p = np.asarray(profits, dtype=np.float64)
+    wins = p[p > 0]
+    losses = p[p < 0]
+    avg_win = wins.mean() if len(wins) else 0.0
+    avg_loss = losses.mean() if len(losses) else 0.0
+    if avg_loss != 0:
+        profit_factor = abs(avg_win / avg_loss)
+    else:
+        profit_factor = float('inf') if avg_win > 0 else 0.0
+    return {
+        'win_rate': len(wins) / len(p) if len(p) else 0.0,
+        'avg_win': avg_win,
+        'avg_loss': avg_loss,
+        'profit_factor': profit_factor,
+        # 依序累加（與 Python sum 相同）
+        'total_profit': np.cumsum(wins)[-1] if len(wins) else 0.0,
+        'total_loss': np.cumsum(losses)[-1] if len(losses) else 0.0,
+    }
+
+
+def batch_metrics(equity, initial_capital, profits: list = None, position=None,
+                  traded_value=None, risk_free_rate: float = 0.02) -> pd.DataFrame:
+    """
+    多條權益曲線一次計算
+    
+    Args:
+        equity: (策略數, K 棒數) 權益矩陣
+        initial_capital: 初始資金（純量或每列一個）
+        profits: 每列的損益陣列列表（長度可不同）；None 則不含交易統計
+        position / traded_value / risk_free_rate: 同 equity_metrics
+    
+    Returns:
+        pd.DataFrame: 每列一組指標（未四捨五入）
+    """
+    result = equity_metrics(np.atleast_2d(equity), initial_capital, risk_free_rate,
+                            position=position, traded_value=traded_value)
+    table = pd.DataFrame(result)
+    if profits is not None:
+        stats = pd.DataFrame([trade_metrics(p) for p in profits], index=table.index)
+        stats['trade_count'] = [len(p) for p in profits]
+        table = pd.concat([table, stats], axis=1)
+    return table
+
+
+# ========== 單次回測 ==========
+
+def _trade_arrays(trades, n_bars: int):
+    """交易紀錄 → (損益列表, 每日是否持倉, 成交總金額)"""
+    if isinstance(trades, TradeLog):
+        profits = trades.profits().tolist()
+        traded_value = float(trades.column('amount').sum())
+        held = None
+        if not trades.is_portfolio:
+            # 買入當天到賣出前一天視為持倉
+            delta = np.zeros(n_bars + 1, dtype=np.int64)
+            sides = trades.column('side')
+            bars = trades.column('bar')
+            np.add.at(delta, bars, np.where(sides == 1, 1, -1))
+            held = np.cumsum(delta[:n_bars]) > 0
+        return profits, held, traded_value
+    
+    profits = [t['profit'] for t in trades if 'profit' in t]
+    traded_value = float(sum(t.get('cost', t.get('revenue', t.get('amount', 0))) for t in trades))
+    return profits, None, traded_value
 
 
 def calculate_metrics(trades: list, equity_curve: pd.Series, 
-                      initial_capital: float, risk_free_rate: float = 0.02) -> dict:
+                      initial_capital: float, risk_free_rate: float = 0.02,
+                      position=None) -> dict:
     """
     計算回測績效指標
     
     Args:
-        trades: 交易記錄列表
+        trades: 交易記錄（TradeLog 或 list of dict）
         equity_curve: 權益曲線
         initial_capital: 初始資金
         risk_free_rate: 無風險利率（年化，預設 2%）
+        position: 每日持倉（股數或市值），計算曝險比例用；單股 TradeLog 可自動推得
     
     Returns:
         dict: 績效指標字典
     """
     metrics = {}
+    equity = np.asarray(equity_curve, dtype=np.float64)
+    profits, held, traded_value = _trade_arrays(trades, len(equity))
+    if position is None:
+        position = held
+    m = equity_metrics(equity, initial_capital, risk_free_rate,
+                       position=position, traded_value=traded_value)
     
     # ========== 報酬率指標 ==========
-    final_capital = equity_curve.iloc[-1]
-    total_return = (final_capital - initial_capital) / initial_capital
     metrics['initial_capital'] = initial_capital
-    metrics['final_capital'] = round(final_capital, 2)
-    metrics['total_return'] = round(total_return, 4)
-    
-    # 年化報酬率
-    trading_days = len(equity_curve)
-    if trading_days > 0:
-        annual_return = (1 + total_return) ** (252 / trading_days) - 1
-        metrics['annual_return'] = round(annual_return, 4)
-    else:
-        metrics['annual_return'] = 0
+    metrics['final_capital'] = round(m['final_capital'], 2)
+    metrics['total_return'] = round(m['total_return'], 4)
+    metrics['annual_return'] = round(m['annual_return'], 4)
     
     # ========== 風險指標 ==========
-    
-    # 每日報酬率
-    daily_returns = equity_curve.pct_change().dropna()
-    
-    # 波動率（年化）
-    volatility = daily_returns.std() * np.sqrt(252)
+    volatility = m['volatility']
     metrics['volatility'] = round(volatility, 4) if not np.isnan(volatility) else 0
     
-    # 夏普比率
+    # 夏普比率（沿用四捨五入後的年化報酬與波動）
     if metrics['volatility'] > 0:
         sharpe_ratio = (metrics['annual_return'] - risk_free_rate) / metrics['volatility']
         metrics['sharpe_ratio'] = round(sharpe_ratio, 2)
     else:
         metrics['sharpe_ratio'] = 0
+    metrics['sortino_ratio'] = round(m['sortino_ratio'], 2) if not np.isnan(m['sortino_ratio']) else 0
     
     # 最大回撤
-    running_max = equity_curve.cummax()
-    drawdown = (equity_curve - running_max) / running_max
-    max_drawdown = drawdown.min()
+    max_drawdown = m['max_drawdown']
     metrics['max_drawdown'] = round(max_drawdown, 4) if not np.isnan(max_drawdown) else 0
     
-    # 最大回撤期間
-    drawdown_start = drawdown.idxmin() if not drawdown.empty else None
+    # 最大回撤日期
+    drawdown_start = None
+    if m['max_drawdown_bar'] >= 0:
+        index = getattr(equity_curve, 'index', None)
+        drawdown_start = index[m['max_drawdown_bar']] if index is not None else m['max_drawdown_bar']
     metrics['max_drawdown_date'] = str(drawdown_start)[:10] if drawdown_start else "N/A"
+    metrics['max_drawdown_duration'] = int(m['max_drawdown_duration'])
+    metrics['calmar_ratio'] = round(m['calmar_ratio'], 2) if np.isfinite(m['calmar_ratio']) else 0
+    
+    # 曝險（持倉天數比例）與年化週轉率
+    metrics['exposure'] = round(m['exposure'], 4) if not np.isnan(m['exposure']) else None
+    metrics['turnover'] = round(m['turnover'], 2) if np.isfinite(m['turnover']) else 0
     
     # ========== 交易統計 ==========
     
-    if trades:
-        # 計算盈虧
-        profits = [t['profit'] for t in trades if 'profit' in t]
+    metrics['trade_count'] = len(trades)
+    
+    if trades and profits:
+        stats = trade_metrics(profits)
+        
+        # 勝率
+        metrics['win_rate'] = round(stats['win_rate'], 4)
         
-        metrics['trade_count'] = len(trades)
+        # 平均獲利/虧損
+        metrics['avg_win'] = round(stats['avg_win'], 2) if stats['avg_win'] else 0
+        metrics['avg_loss'] = round(stats['avg_loss'], 2) if stats['avg_loss'] else 0
         
-        if profits:
-            wins = [p for p in profits if p > 0]
-            losses = [p for p in profits if p < 0]
-            
-            # 勝率
-            metrics['win_rate'] = round(len(wins) / len(profits), 4) if profits else 0
-            
-            # 平均獲利/虧損
-            metrics['avg_win'] = round(np.mean(wins), 2) if wins else 0
-            metrics['avg_loss'] = round(np.mean(losses), 2) if losses else 0
-            
-            # 盈虧比
-            if metrics['avg_loss'] != 0:
-                metrics['profit_factor'] = round(abs(metrics['avg_win'] / metrics['avg_loss']), 2)
-            else:
-                metrics['profit_factor'] = float('inf') if metrics['avg_win'] > 0 else 0
-            
-            # 總獲利/虧損
-            metrics['total_profit'] = round(sum(wins), 2) if wins else 0
-            metrics['total_loss'] = round(sum(losses), 2) if losses else 0
+        # 盈虧比（沿用四捨五入後的平均獲利/虧損）
+        if metrics['avg_loss'] != 0:
+            metrics['profit_factor'] = round(abs(metrics['avg_win'] / metrics['avg_loss']), 2)
         else:
-            metrics['win_rate'] = 0
-            metrics['avg_win'] = 0
-            metrics['avg_loss'] = 0
-            metrics['profit_factor'] = 0
-            metrics['total_profit'] = 0
-            metrics['total_loss'] = 0
+            metrics['profit_factor'] = float('inf') if metrics['avg_win'] > 0 else 0
+        
+        # 總獲利/虧損
+        metrics['total_profit'] = round(stats['total_profit'], 2) if stats['total_profit'] else 0
+        metrics['total_loss'] = round(stats['total_loss'], 2) if stats['total_loss'] else 0
     else:
-        metrics['trade_count'] = 0
         metrics['win_rate'] = 0
         metrics['avg_win'] = 0
         metrics['avg_loss'] = 0
@@ -128,6 +304,12 @@ def print_metrics(metrics: dict):
     print(f"   年化波動: {metrics['volatility']:.2%}")
     print(f"   夏普比率: {metrics['sharpe_ratio']:.2f}")
     print(f"   最大回撤: {metrics['max_drawdown']:.2%}")
+    if 'sortino_ratio' in metrics:
+        print(f"   索提諾比率: {metrics['sortino_ratio']:.2f}")
+        print(f"   卡瑪比率: {metrics['calmar_ratio']:.2f}")
+        print(f"   最長回撤: {metrics['max_drawdown_duration']} 天")
+    if metrics.get('exposure') is not None:
+        print(f"   持倉比例: {metrics['exposure']:.2%}")
     
     print("\n🔄 交易統計")
     print(f"   交易次數: {metrics['trade_count']} 筆")
@@ -2,48 +2,286 @@
 """
 策略參數優化器
 透過 Grid Search 找出最佳策略參數
+
+參數組合多時可分散到多個行程：價格與指標陣列只放進共享記憶體一次
+（multiprocessing.shared_memory），各行程直接讀取，不隨每個任務序列化。
 """
 import os
 import sys
+import math
 import pandas as pd
 import numpy as np
 from itertools import product
 from datetime import datetime
 from typing import Dict, List, Any
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Pool, cpu_count, shared_memory
 
 # 確保可以匯入專案模組
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backtest.engine import BacktestEngine
 from backtest.strategy import MACrossStrategy, MACDStrategy, RSIStrategy
+from backtest.features import MA, ensure_features, strategy_features, _cached_compute
+from backtest.search import ParameterSearch
+
+
+# ========== 均線交叉掃描 ==========
+
+class MASweep:
+    """
+    均線交叉參數掃描
+    
+    每個週期的均線陣列只取得一次（資料已有 ma{n} 欄位就直接使用，否則經由指標快取計算），
+    每組 (短, 長) 的交叉訊號陣列快取；回測把陣列直接交給 BacktestEngine.run_arrays，
+    不必每個組合複製一次整個 DataFrame。訊號與 MACrossStrategy.generate_signals 相同。
+    """
+    
+    def __init__(self, df: pd.DataFrame, engine: BacktestEngine):
+        if any(c != c.lower() for c in df.columns if isinstance(c, str)):
+            df = df.rename(columns=str.lower)
+        self.df = df
+        self.engine = engine
+        self.close = df['close'].to_numpy(dtype=float)
+        self.labels = df['date'] if 'date' in df.columns else None
+        self.index = df.index
+        self._ma = {}
+        self._signals = {}
+    
+    @classmethod
+    def for_strategy(cls, df: pd.DataFrame, engine: BacktestEngine, strategy_class):
+        """策略類別適用掃描模式時回傳 MASweep，否則 None"""
+        if strategy_class is MACrossStrategy and 'close' in (str(c).lower() for c in df.columns):
+            return cls(df, engine)
+        return None
+    
+    def ma(self, period: int) -> np.ndarray:
+        """period 日均線"""
+        values = self._ma.get(period)
+        if values is None:
+            column = f'ma{period}'
+            if column in self.df.columns:
+                values = self.df[column].to_numpy(dtype=float)
+            else:
+                values = _cached_compute(self.df, MA(period), self.df.attrs.get('ticker'))[column]
+            self._ma[period] = values
+        return values
+    
+    def signals(self, short_period: int, long_period: int) -> np.ndarray:
+        """黃金交叉 1、死亡交叉 -1、其他 0"""
+        key = (short_period, long_period)
+        signals = self._signals.get(key)
+        if signals is None:
+            short_ma = self.ma(short_period)
+            long_ma = self.ma(long_period)
+            short_prev = np.concatenate(([np.nan], short_ma[:-1]))
+            long_prev = np.concatenate(([np.nan], long_ma[:-1]))
+            
+            signals = np.zeros(len(short_ma), dtype=np.int64)
+            signals[(short_ma > long_ma) & (short_prev <= long_prev)] = 1
+            signals[(short_ma < long_ma) & (short_prev >= long_prev)] = -1
+            self._signals[key] = signals
+        return signals
+    
+    def run(self, strategy: MACrossStrategy) -> dict:
+        """回測一組參數（結果格式同 BacktestEngine.run）"""
+        signals = self.signals(strategy.short_period, strategy.long_period)
+        return self.engine.run_arrays(self.close, signals, labels=self.labels,
+                                      index=self.index, name=strategy.name)
+
+
+# ========== 參數組合回測（單行程 / 多行程） ==========
+
+SERIAL_CHUNK = 5   # 單行程時每批組合數（每批回報一次進度）
+
+
+def _evaluate_combos(engine, df, strategy_class, param_names, combos, sweep=None) -> list:
+    """
+    回測一批參數組合（同一份資料只整理一次）
+    
+    Args:
+        sweep: MASweep（均線交叉策略的掃描模式，不複製 DataFrame）
+    
+    Returns:
+        list: 每個組合一筆 (參數 dict, 績效指標 dict 或 None, 錯誤訊息 或 None)
+    """
+    params_list = [dict(zip(param_names, combo)) for combo in combos]
+    if sweep is not None:
+        outcomes = []
+        for params in params_list:
+            try:
+                result = sweep.run(strategy_class(**params))
+                outcomes.append((params, result['metrics'], None))
+            except Exception as e:
+                outcomes.append((params, None, str(e)))
+        return outcomes
+    
+    try:
+        strategies = [strategy_class(**params) for params in params_list]
+        results = engine.run_many(df, strategies)
+        return [(params, result['metrics'], None) for params, result in zip(params_list, results)]
+    except Exception:
+        pass
+    
+    # 有組合失敗：逐一回測以取得個別的錯誤訊息
+    outcomes = []
+    for params in params_list:
+        try:
+            result = engine.run(df, strategy_class(**params))
+            outcomes.append((params, result['metrics'], None))
+        except Exception as e:
+            outcomes.append((params, None, str(e)))
+    return outcomes
+
+
+def _share_frame(df: pd.DataFrame):
+    """
+    把 DataFrame 的 float64 / int64 欄位複製到一塊共享記憶體
+    
+    Returns:
+        (SharedMemory, spec)：spec 記錄各欄位的位置，其餘欄位（日期字串等）與索引隨 spec 傳遞
+    """
+    n = len(df)
+    layout = []
+    offset = 0
+    for col in df.columns:
+        dtype = df[col].dtype
+        if dtype == np.float64 or dtype == np.int64:
+            layout.append((col, dtype.str, offset))
+            offset += n * 8
+    
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for col, dtype, start in layout:
+        np.ndarray(n, dtype=dtype, buffer=shm.buf, offset=start)[:] = df[col].to_numpy()
+    
+    shared = {col for col, _, _ in layout}
+    spec = {
+        'name': shm.name,
+        'length': n,
+        'columns': list(df.columns),
+        'layout': layout,
+        'others': df[[c for c in df.columns if c not in shared]],
+        'attrs': dict(df.attrs),
+    }
+    return shm, spec
+
+
+def _attach_frame(shm, spec) -> pd.DataFrame:
+    """以共享記憶體中的陣列（唯讀）重建 DataFrame"""
+    arrays = {}
+    for col, dtype, start in spec['layout']:
+        values = np.ndarray(spec['length'], dtype=dtype, buffer=shm.buf, offset=start)
+        values.flags.writeable = False
+        arrays[col] = values
+    others = spec['others']
+    df = pd.DataFrame({col: arrays[col] if col in arrays else others[col].to_numpy()
+                       for col in spec['columns']},
+                      index=others.index, copy=False)
+    df.attrs.update(spec['attrs'])
+    return df
+
+
+# 子行程的狀態（由 _init_worker 設定，整個行程共用）
+_worker = {}
+
+
+def _init_worker(spec, engine, strategy_class, param_names):
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    df = _attach_frame(shm, spec)
+    _worker.update(
+        shm=shm,  # 保留參考，避免共享記憶體在子行程中被釋放
+        df=df,
+        engine=engine,
+        strategy_class=strategy_class,
+        param_names=param_names,
+        sweep=MASweep.for_strategy(df, engine, strategy_class),
+    )
+
+
+def _worker_evaluate(combos) -> list:
+    return _evaluate_combos(_worker['engine'], _worker['df'], _worker['strategy_class'],
+                            _worker['param_names'], combos, _worker['sweep'])
+
+
+def evaluate_grid(engine, df: pd.DataFrame, strategy_class, param_names: list,
+                  combinations: list, num_workers: int = 1, progress: bool = True) -> list:
+    """
+    回測所有參數組合
+    
+    Args:
+        engine: BacktestEngine
+        df: 股價 DataFrame（建議先補好指標欄位）
+        strategy_class: 策略類別
+        param_names: 參數名稱
+        combinations: 參數值組合列表（與 param_names 對應）
+        num_workers: 行程數；1 為單行程，0 或負數為 CPU 核心數
+        progress: 是否印出進度
+    
+    Returns:
+        list: 每個組合一筆 (參數 dict, 績效指標 dict 或 None, 錯誤訊息 或 None)，
+              順序與 combinations 相同（不受行程完成先後影響）
+    """
+    total = len(combinations)
+    if num_workers is None or num_workers <= 0:
+        num_workers = cpu_count()
+    num_workers = min(num_workers, total)
+    
+    if num_workers <= 1:
+        chunk_size = SERIAL_CHUNK
+    else:
+        # 每個行程約分到 4 批，兼顧負載平衡與進度回報
+        chunk_size = max(1, math.ceil(total / (num_workers * 4)))
+    chunks = [combinations[i:i + chunk_size] for i in range(0, total, chunk_size)]
+    
+    outcomes = []
+    
+    def report(batch):
+        outcomes.extend(batch)
+        if progress:
+            done = len(outcomes)
+            print(f"   進度: {done}/{total} ({done/total*100:.0f}%)")
+    
+    if num_workers <= 1:
+        sweep = MASweep.for_strategy(df, engine, strategy_class)
+        for chunk in chunks:
+            report(_evaluate_combos(engine, df, strategy_class, param_names, chunk, sweep))
+        return outcomes
+    
+    shm, spec = _share_frame(df)
+    try:
+        with Pool(processes=num_workers, initializer=_init_worker,
+                  initargs=(spec, engine, strategy_class, param_names)) as pool:
+            # imap 依提交順序回傳，結果順序固定
+            for batch in pool.imap(_worker_evaluate, chunks):
+                report(batch)
+    finally:
+        shm.close()
+        shm.unlink()
+    return outcomes
 
 
 class StrategyOptimizer:
     """
     策略參數優化器
     """
-    def __init__(self, initial_capital: float = 1_000_000, min_trades: int = 3):
+    def __init__(self, initial_capital: float = 1_000_000, min_trades: int = 3,
+                 num_workers: int = 1):
+        """
+        Args:
+            initial_capital: 初始資金
+            min_trades: 最低交易次數過濾
+            num_workers: 平行回測的行程數（1 為單行程，0 為 CPU 核心數）
+        """
         self.initial_capital = initial_capital
         self.min_trades = min_trades  # 最低交易次數過濾
-        self.engine = BacktestEngine(initial_capital=initial_capital)
+        self.num_workers = num_workers
+        self.engine = BacktestEngine(initial_capital=initial_capital, mode='vectorized')
     
-    def _ensure_ma_columns(self, df: pd.DataFrame, periods: List[int]) -> pd.DataFrame:
-        """
-        確保 DataFrame 有需要的 MA 欄位，沒有就自動計算
-        """
-        df = df.copy()
-        for period in periods:
-            col_name = f'ma{period}'
-            if col_name not in df.columns:
-                df[col_name] = df['close'].rolling(window=period).mean()
-        return df
-        
     def grid_search(self, 
                     df: pd.DataFrame, 
                     strategy_class, 
                     param_grid: Dict[str, List[Any]],
-                    metric: str = 'sharpe_ratio') -> pd.DataFrame:
+                    metric: str = 'sharpe_ratio',
+                    num_workers: int = None) -> pd.DataFrame:
         """
         Grid Search 參數優化
         
@@ -52,10 +290,13 @@ class StrategyOptimizer:
             strategy_class: 策略類別 (e.g. MACrossStrategy)
             param_grid: 參數網格 e.g. {'short_period': [5, 10], 'long_period': [20, 40]}
             metric: 優化目標指標 ('sharpe_ratio', 'total_return', 'max_drawdown')
+            num_workers: 行程數（預設使用建構時的設定）
             
         Returns:
-            pd.DataFrame: 所有組合的回測結果
+            pd.DataFrame: 所有組合的回測結果（組合順序固定，與行程數無關）
         """
+        if num_workers is None:
+            num_workers = self.num_workers
         # 產生所有參數組合
         param_names = list(param_grid.keys())
         param_values = list(param_grid.values())
@@ -76,49 +317,43 @@ class StrategyOptimizer:
         print(f"   最低交易次數: {self.min_trades}")
         print("-" * 50)
         
-        # 預先計算所有需要的 MA 欄位
-        all_periods = set()
-        for name, values in param_grid.items():
-            if 'period' in name.lower():
-                all_periods.update(values)
+        # 預先補算所有組合宣告的指標欄位（相同的均線只算一次）
+        try:
+            specs = strategy_features(strategy_class(**dict(zip(param_names, combo)))
+                                      for combo in valid_combinations)
+        except Exception:
+            specs = []
+        
+        if specs:
+            print(f"   📊 自動計算指標欄位: {', '.join(repr(s) for s in specs)}")
+            df = df.copy()
+            df.columns = [c.lower() for c in df.columns]
+            ensure_features(df, specs)
         
-        if all_periods:
-            print(f"   📊 自動計算 MA 欄位: {sorted(all_periods)}")
-            df = self._ensure_ma_columns(df, list(all_periods))
+        if num_workers != 1 and len(valid_combinations) > 1:
+            print(f"   ⚡ 平行回測: {num_workers if num_workers > 0 else cpu_count()} 個行程")
+        
+        outcomes = evaluate_grid(self.engine, df, strategy_class, param_names,
+                                 valid_combinations, num_workers=num_workers)
         
         results = []
         
-        for i, combo in enumerate(valid_combinations, 1):
-            # 建立參數字典
-            params = dict(zip(param_names, combo))
-            
-            try:
-                # 建立策略
-                strategy = strategy_class(**params)
-                
-                # 執行回測
-                result = self.engine.run(df, strategy)
-                metrics = result.get('metrics', {})
-                
-                # 記錄結果
-                record = {**params}
-                record['sharpe_ratio'] = metrics.get('sharpe_ratio', 0)
-                record['total_return'] = metrics.get('total_return', 0)
-                record['annual_return'] = metrics.get('annual_return', 0)
-                record['max_drawdown'] = metrics.get('max_drawdown', 0)
-                record['win_rate'] = metrics.get('win_rate', 0)
-                record['profit_factor'] = metrics.get('profit_factor', 0)
-                record['total_trades'] = metrics.get('trade_count', 0)
-                
-                results.append(record)
-                
-                # 顯示進度
-                if i % 5 == 0 or i == len(valid_combinations):
-                    print(f"   進度: {i}/{len(valid_combinations)} ({i/len(valid_combinations)*100:.0f}%)")
-                    
-            except Exception as e:
-                print(f"   ⚠️ 參數組合 {params} 失敗: {e}")
+        for params, metrics, error in outcomes:
+            if metrics is None:
+                print(f"   ⚠️ 參數組合 {params} 失敗: {error}")
                 continue
+            
+            # 記錄結果
+            record = {**params}
+            record['sharpe_ratio'] = metrics.get('sharpe_ratio', 0)
+            record['total_return'] = metrics.get('total_return', 0)
+            record['annual_return'] = metrics.get('annual_return', 0)
+            record['max_drawdown'] = metrics.get('max_drawdown', 0)
+            record['win_rate'] = metrics.get('win_rate', 0)
+            record['profit_factor'] = metrics.get('profit_factor', 0)
+            record['total_trades'] = metrics.get('trade_count', 0)
+            
+            results.append(record)
         
         # 轉成 DataFrame 並排序
         df_results = pd.DataFrame(results)
@@ -142,6 +377,50 @@ class StrategyOptimizer:
         
         return df_results
     
+    def search(self,
+               df: pd.DataFrame,
+               strategy_class,
+               space: Dict[str, List[Any]],
+               sampler='tpe',
+               metric: str = 'sharpe_ratio',
+               n_trials: int = 50,
+               timeout: float = None,
+               patience: int = None,
+               seed: int = None) -> pd.DataFrame:
+        """
+        非窮舉的參數搜尋（隨機 / TPE / 連續減半），適合很大的參數空間
+        
+        Args:
+            df: 股價 DataFrame
+            strategy_class: 策略類別
+            space: 參數空間，格式同 param_grid；可加入 stop_loss_pct / take_profit_pct / trailing_stop_pct
+            sampler: 'grid' / 'random' / 'tpe' / 'halving' 或 search 模組的取樣物件
+            metric: 優化目標指標
+            n_trials: 試驗次數上限
+            timeout: 秒數上限
+            patience: 連續幾次沒有進步就停止
+            seed: 亂數種子
+            
+        Returns:
+            pd.DataFrame: 使用全部資料評估的組合（欄位同 grid_search），依目標指標排序
+        """
+        search = ParameterSearch(df, strategy_class, space, metric=metric,
+                                 engine=self.engine, min_trades=self.min_trades)
+        search.optimize(sampler, n_trials=n_trials, timeout=timeout, patience=patience, seed=seed)
+        
+        trials = search.trials_frame()
+        if trials.empty:
+            return trials
+        trials = trials[(trials['state'] == 'complete') & (trials['bars'] == search.n_bars)]
+        trials = trials[list(space) + [c for c in trials.columns if c in (
+            'sharpe_ratio', 'total_return', 'annual_return', 'max_drawdown',
+            'win_rate', 'profit_factor', 'total_trades')]]
+        filtered = trials[trials['total_trades'] >= self.min_trades]
+        if not filtered.empty:
+            trials = filtered
+        # 與 ParameterSearch 一致一律取大（max_drawdown 為負值，越大越好）；同分保留較早的試驗
+        return trials.sort_values(metric, ascending=False, kind='stable').reset_index(drop=True)
+    
     def generate_optimization_report(self, 
                                       df_results: pd.DataFrame, 
                                       strategy_name: str,
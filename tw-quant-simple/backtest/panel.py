@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+全市場面板回測
+
+把整個市場堆成 (K 棒 × 股票) 的二維陣列：指標、訊號、持倉推導、資金複利與績效都一次對所有股票計算，
+不再逐檔建立 DataFrame、逐檔呼叫 BacktestEngine.run()。
+
+每檔股票從自己的第一根 K 棒往下排（第 i 列就是該股第 i 根 K 棒），資料較短的股票尾端補 NaN。
+逐檔回測本來就不理會停牌缺日，以 K 棒序號對齊可以讓滾動視窗、shift 的結果與逐檔回測完全相同；
+尾端的 NaN 只出現在該股最後一根 K 棒之後，不會影響任何有效的值。
+"""
+import numpy as np
+import pandas as pd
+
+from .strategy import (
+    MACrossStrategy,
+    RSIStrategy,
+    KDStrategy,
+    MACDStrategy,
+    BollingerStrategy,
+    InstitutionalFollowStrategy,
+    MomentumBreakoutStrategy,
+    VolumeBreakoutStrategy,
+    TurtleStrategy,
+)
+from .engine import BacktestEngine, _holding_changes
+from .metrics import equity_metrics
+
+
+# 逐檔回測績效中，面板回測會輸出的欄位
+PANEL_METRICS = ('final_capital', 'total_return', 'annual_return', 'volatility',
+                 'sharpe_ratio', 'max_drawdown', 'win_rate', 'trade_count')
+
+
+class MarketPanel:
+    """
+    全市場面板
+
+    Attributes:
+        tickers: 股票代碼清單
+        lengths: 每檔股票的 K 棒數
+        dates: (K 棒, 股票) datetime64 陣列（尾端為 NaT）
+        fields: {欄位: (K 棒, 股票) float64 陣列}
+    """
+
+    def __init__(self, tickers: list, lengths, dates: np.ndarray, fields: dict,
+                 present: dict = None):
+        self.tickers = list(tickers)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.dates = dates
+        self.fields = fields
+        self.ticker_index = {t: j for j, t in enumerate(self.tickers)}
+        # 各欄位在哪些股票的原始資料中存在（不存在的才需要補算）
+        self.present = present if present is not None else {
+            name: np.ones(len(self.tickers), dtype=bool) for name in fields}
+
+    @classmethod
+    def from_frames(cls, frames: dict, columns: list = None) -> 'MarketPanel':
+        """
+        由 {股票代碼: DataFrame} 建立面板
+
+        Args:
+            frames: 每檔股票的 DataFrame（欄位小寫，依日期排序）
+            columns: 要放進面板的欄位（None = 所有出現過的欄位，date 除外）
+        """
+        tickers = list(frames)
+        lengths = np.array([len(df) for df in frames.values()], dtype=np.int64)
+        n_bars = int(lengths.max(initial=0))
+        if columns is None:
+            columns = list(dict.fromkeys(c for df in frames.values() for c in df.columns))
+        columns = [c for c in columns if c != 'date']
+
+        shape = (n_bars, len(tickers))
+        dates = np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]')
+        fields = {c: np.full(shape, np.nan) for c in columns}
+        present = {c: np.zeros(len(tickers), dtype=bool) for c in columns}
+        for j, df in enumerate(frames.values()):
+            n = len(df)
+            if 'date' in df.columns:
+                dates[:n, j] = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+            for c in columns:
+                if c in df.columns:
+                    fields[c][:n, j] = df[c].to_numpy(dtype=float)
+                    present[c][j] = True
+        return cls(tickers, lengths, dates, fields, present)
+
+    @property
+    def shape(self) -> tuple:
+        return self.dates.shape
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.fields[field]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.fields
+
+    def wide(self, field: str) -> pd.DataFrame:
+        """欄位的寬表（K 棒 × 股票），pandas 的 rolling / shift 逐欄計算，與單檔 Series 結果相同"""
+        return pd.DataFrame(self.fields[field], copy=False)
+
+    def frame(self, ticker, fields: list = None) -> pd.DataFrame:
+        """
+        切出單一股票的 DataFrame（只含有效的 K 棒）
+
+        Args:
+            ticker: 股票代碼或欄位置
+            fields: 要的欄位（None = 全部）
+        """
+        j = ticker if isinstance(ticker, (int, np.integer)) else self.ticker_index[ticker]
+        n = int(self.lengths[j])
+        data = {'date': self.dates[:n, j]}
+        for name in (fields or self.fields):
+            data[name] = self.fields[name][:n, j]
+        return pd.DataFrame(data)
+
+    def ensure_features(self, specs) -> 'MarketPanel':
+        """
+        補上缺少的指標欄位（原始資料已有的股票不重算，與 features.ensure_features 相同）
+
+        Args:
+            specs: 指標規格列表，例如 [MA(10), RSI()]
+        """
+        n_tickers = len(self.tickers)
+        for spec in specs:
+            missing = {col: ~self.present.get(col, np.zeros(n_tickers, dtype=bool))
+                       for col in spec.columns}
+            cols = np.flatnonzero(np.logical_or.reduce(list(missing.values())))
+            if not len(cols):
+                continue
+            if spec.columnwise:
+                # 逐欄的 pandas 運算：傳入寬表一次計算所有股票
+                frame = {col: pd.DataFrame(self.fields[col][:, cols]) for col in spec.inputs}
+                values = spec.compute(frame)
+            else:
+                # 會跨欄位運算的指標（例如 ATR 取三種波幅的最大值）逐檔計算
+                values = {col: np.full((self.dates.shape[0], len(cols)), np.nan) for col in spec.columns}
+                for k, j in enumerate(cols):
+                    n = int(self.lengths[j])
+                    frame = pd.DataFrame({col: self.fields[col][:n, j] for col in spec.inputs})
+                    for col, series in spec.compute(frame).items():
+                        values[col][:n, k] = np.asarray(series, dtype=float)
+            for col in spec.columns:
+                target = self.fields.setdefault(col, np.full(self.dates.shape, np.nan))
+                need = missing[col][cols]
+                target[:, cols[need]] = np.asarray(values[col], dtype=float)[:, need]
+                self.present.setdefault(col, np.zeros(n_tickers, dtype=bool))[cols[need]] = True
+        return self
+
+    def signals(self, strategy) -> np.ndarray:
+        """
+        策略在所有股票上的訊號
+
+        內建策略以寬表呼叫 signal_masks（與 generate_signals 同一套規則）；其他策略逐檔呼叫
+        generate_signals，失敗的股票訊號為 0。
+
+        Returns:
+            ndarray: (K 棒, 股票) int8，1 買 / -1 賣 / 0 觀望
+        """
+        if type(strategy) in PANEL_STRATEGIES:
+            buy, sell = strategy.signal_masks(_WideView(self))
+            # 與 generate_signals 相同：先標買入，賣出訊號覆蓋
+            signals = np.where(np.asarray(sell), -1, np.where(np.asarray(buy), 1, 0)).astype(np.int8)
+            # 補 NaN 的尾端不一定算出 NaN（例如 RSI 把缺值的漲跌當 0），一律清掉
+            signals[np.arange(len(signals))[:, None] >= self.lengths] = 0
+            return signals
+
+        signals = np.zeros(self.dates.shape, dtype=np.int8)
+        for j in range(len(self.tickers)):
+            try:
+                values = strategy.generate_signals(self.frame(j))
+            except Exception:
+                continue
+            signals[:self.lengths[j], j] = np.asarray(values)
+        return signals
+
+
+# ========== 內建策略的寬表訊號 ==========
+
+class _WideView:
+    """panel 的寬表取用介面：view[欄位] 回傳 (K 棒 × 股票) DataFrame，供 Strategy.signal_masks 使用"""
+
+    def __init__(self, panel: MarketPanel):
+        self.panel = panel
+
+    def __getitem__(self, field: str) -> pd.DataFrame:
+        return self.panel.wide(field)
+
+
+# 以 signal_masks 寬表計算的策略；只對應類別本身：子類別可能改寫 generate_signals，一律逐檔計算
+PANEL_STRATEGIES = (
+    MACrossStrategy,
+    RSIStrategy,
+    KDStrategy,
+    MACDStrategy,
+    BollingerStrategy,
+    InstitutionalFollowStrategy,
+    MomentumBreakoutStrategy,
+    VolumeBreakoutStrategy,
+    TurtleStrategy,
+)
+
+
+# ========== 模擬 ==========
+
+def _simulate_panel(engine: BacktestEngine, close: np.ndarray, signals: np.ndarray,
+                    lengths: np.ndarray, position_size: float) -> dict:
+    """
+    所有股票一次模擬（規則同 BacktestEngine 的向量化模式）
+
+    各股票的第 k 筆交易一起處理：資金只在進出場時變動，逐筆交易序號往前推進，
+    每一步都是對所有還有第 k 筆交易的股票做陣列運算。
+
+    Returns:
+        dict: equity (股票, K 棒) 權益、trade_count、wins、sells、vectorized（False 的股票
+              有某次買入股數為 0、或進出場當天價格缺值，需改用逐列模擬）
+    """
+    n_bars, n_tickers = close.shape
+    entry_rows, entry_bars, exit_rows, exit_bars = _holding_changes(signals.T)
+    n_entries = np.bincount(entry_rows, minlength=n_tickers)
+    n_exits = np.bincount(exit_rows, minlength=n_tickers)
+    entry_start = np.cumsum(n_entries) - n_entries
+    exit_start = np.cumsum(n_exits) - n_exits
+
+    capital = np.full(n_tickers, float(engine.initial_capital))
+    vectorized = np.ones(n_tickers, dtype=bool)
+    buy_cash = np.zeros(len(entry_rows))
+    buy_shares = np.zeros(len(entry_rows))
+    sell_cash = np.zeros(len(exit_rows))
+    profit = np.zeros(len(exit_rows))
+
+    for k in range(int(n_entries.max(initial=0))):
+        # 買入
+        rows = np.flatnonzero(vectorized & (n_entries > k))
+        e = entry_start[rows] + k
+        buy_price = close[entry_bars[e], rows] * (1 + engine.slippage)  # 滑價
+        shares = np.floor((capital[rows] * position_size) / buy_price)
+        # 價格缺值或非正數時 shares 為 NaN / 非正數：逐列模擬不成交，之後的訊號會再嘗試
+        failed = ~(shares > 0)
+        if failed.any():
+            vectorized[rows[failed]] = False
+            rows, e, buy_price, shares = rows[~failed], e[~failed], buy_price[~failed], shares[~failed]
+
+        cost = shares * buy_price
+        commission_fee = cost * engine.commission
+        capital[rows] -= (cost + commission_fee)
+        buy_cash[e] = capital[rows]
+        buy_shares[e] = shares
+
+        # 賣出
+        selling = n_exits[rows] > k
+        rows, buy_price, shares = rows[selling], buy_price[selling], shares[selling]
+        x = exit_start[rows] + k
+        exit_close = close[exit_bars[x], rows]
+        failed = ~(exit_close > 0)
+        if failed.any():
+            vectorized[rows[failed]] = False
+            rows, x, buy_price, shares, exit_close = (
+                rows[~failed], x[~failed], buy_price[~failed], shares[~failed], exit_close[~failed])
+        sell_price = exit_close * (1 - engine.slippage)  # 滑價
+        revenue = shares * sell_price
+        commission_fee = revenue * engine.commission
+        tax_fee = revenue * engine.tax
+
+        net_revenue = revenue - commission_fee - tax_fee
+        profit[x] = net_revenue - (buy_price * shares)
+        capital[rows] += net_revenue
+        sell_cash[x] = capital[rows]
+
+    # 每日收盤前的資金與持股 = 前一個進出場事件之後的狀態（第 b 根的事件從 b + 1 起生效）
+    keep_entry = vectorized[entry_rows]
+    keep_exit = vectorized[exit_rows]
+    event_rows = np.concatenate((entry_rows[keep_entry], exit_rows[keep_exit]))
+    event_cols = np.concatenate((entry_bars[keep_entry], exit_bars[keep_exit])) + 1
+    cash = np.empty((n_tickers, n_bars + 1))
+    held = np.zeros((n_tickers, n_bars + 1))
+    cash[:, 0] = engine.initial_capital
+    cash[event_rows, event_cols] = np.concatenate((buy_cash[keep_entry], sell_cash[keep_exit]))
+    held[event_rows, event_cols] = np.concatenate((buy_shares[keep_entry],
+                                                   np.zeros(keep_exit.sum())))
+    marked = np.zeros((n_tickers, n_bars + 1), dtype=bool)
+    marked[:, 0] = True
+    marked[event_rows, event_cols] = True
+    last = np.where(marked, np.arange(n_bars + 1), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    cash = np.take_along_axis(cash, last, axis=1)
+    held = np.take_along_axis(held, last, axis=1)
+
+    equity = cash[:, :n_bars] + held[:, :n_bars] * close.T
+
+    # 結束時以最後價格計算
+    rows = np.arange(n_tickers)
+    final_bar = np.maximum(lengths - 1, 0)
+    final_cash = cash[rows, lengths]
+    final_held = held[rows, lengths]
+    equity[rows, final_bar] = np.where(final_held > 0,
+                                       final_cash + final_held * close[final_bar, rows],
+                                       final_cash)
+
+    # 勝率用的損益與單股 TradeLog.profits() 相同，取到小數 2 位
+    wins = np.bincount(exit_rows, weights=np.round(profit, 2) > 0, minlength=n_tickers)
+    return {
+        'equity': equity,
+        'trade_count': n_entries + n_exits,
+        'wins': wins.astype(np.int64),
+        'sells': n_exits,
+        'vectorized': vectorized,
+    }
+
+
+def _round_metrics(m: dict, simulated: dict, rows: np.ndarray,
+                   risk_free_rate: float) -> dict:
+    """equity_metrics 結果依 calculate_metrics 的規則四捨五入"""
+    volatility = np.where(np.isnan(m['volatility']), 0.0, np.round(m['volatility'], 4))
+    annual_return = np.round(m['annual_return'], 4)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(volatility > 0,
+                          np.round((annual_return - risk_free_rate) / volatility, 2), 0.0)
+    sells = simulated['sells'][rows]
+    wins = simulated['wins'][rows]
+    return {
+        'final_capital': np.round(m['final_capital'], 2),
+        'total_return': np.round(m['total_return'], 4),
+        'annual_return': annual_return,
+        'volatility': volatility,
+        'sharpe_ratio': sharpe,
+        'max_drawdown': np.where(np.isnan(m['max_drawdown']), 0.0,
+                                 np.round(m['max_drawdown'], 4)),
+        # 與 calculate_metrics 相同用 Python round（整數比值的四捨五入）
+        'win_rate': [round(w / s, 4) if s else 0 for w, s in zip(wins.tolist(), sells.tolist())],
+        'trade_count': simulated['trade_count'][rows],
+    }
+
+
+def run_panel(panel: MarketPanel, strategy, engine: BacktestEngine = None,
+              position_size: float = 1.0) -> pd.DataFrame:
+    """
+    單一策略在面板上所有股票的回測績效
+
+    績效欄位（含四捨五入）與逐檔 engine.run(df, strategy)['metrics'] 相同；
+    某次買入股數為 0 或進出場當天價格缺值的股票、以及設定了停損停利等逐日規則的引擎，改為逐檔以 run_arrays 回測。
+
+    Args:
+        panel: MarketPanel
+        strategy: 策略物件
+        engine: 回測引擎（預設向量化模式；使用其初始資金、手續費、稅與滑價）
+        position_size: 持倉比例（0-1，預設全倉）
+
+    Returns:
+        pd.DataFrame: index 為股票代碼，欄位為 PANEL_METRICS
+    """
+    engine = engine or BacktestEngine(mode='vectorized')
+    panel.ensure_features(strategy.required_features())
+    close = panel['close']
+    signals = panel.signals(strategy)
+    lengths = panel.lengths
+
+    table = pd.DataFrame(index=pd.Index(panel.tickers, name='ticker'),
+                         columns=list(PANEL_METRICS), dtype=float)
+    fallback = np.ones(len(panel.tickers), dtype=bool)
+    if close.shape[0] and not engine.path_dependent:
+        simulated = _simulate_panel(engine, close, signals, lengths, position_size)
+        fallback = ~simulated['vectorized'] | (lengths == 0)
+
+        # 相同長度的股票一起計算績效
+        done = np.flatnonzero(~fallback)
+        for n in np.unique(lengths[done]):
+            rows = done[lengths[done] == n]
+            m = equity_metrics(simulated['equity'][rows, :n], engine.initial_capital)
+            for name, values in _round_metrics(m, simulated, rows, 0.02).items():
+                table.iloc[rows, table.columns.get_loc(name)] = values
+
+    for j in np.flatnonzero(fallback & (lengths > 0)):
+        n = int(lengths[j])
+        result = engine.run_arrays(close[:n, j], signals[:n, j], name=strategy.name,
+                                   position_size=position_size)
+        table.iloc[j] = [result['metrics'][name] for name in PANEL_METRICS]
+
+    table['trade_count'] = table['trade_count'].fillna(0).astype(np.int64)
+    return table
@@ -5,31 +5,191 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from collections.abc import Mapping
 from typing import Dict, List
 from .strategy_portfolio import PortfolioStrategy
 from .metrics import calculate_metrics
+from .tradelog import TradeLog, SIDE_BUY, SIDE_SELL
+from .rebalance import Rebalancer, LOT_SIZE_ODD
+from .trading_calendar import TradingCalendar
+
+
+# ========== 策略看到的唯讀檢視 ==========
+
+class RowView(Mapping):
+    """單一股票某一天的資料列（唯讀），欄位值直接從該股票的欄位陣列讀取，不複製整列"""
+    __slots__ = ('_columns', '_row')
+    
+    def __init__(self, columns: dict, row: int):
+        self._columns = columns
+        self._row = row
+    
+    def __getitem__(self, field):
+        return self._columns[field][self._row]
+    
+    def __contains__(self, field):
+        return field in self._columns
+    
+    def __iter__(self):
+        return iter(self._columns)
+    
+    def __len__(self):
+        return len(self._columns)
+    
+    def __repr__(self):
+        return f"RowView({dict(self)})"
+
+
+class DataSlice(Mapping):
+    """某一天有資料的股票 {ticker: RowView}（唯讀）"""
+    __slots__ = ('_data', '_day')
+    
+    def __init__(self, data: 'PortfolioData', day: int):
+        self._data = data
+        self._day = day
+    
+    def __getitem__(self, ticker):
+        j = self._data.ticker_index.get(ticker)
+        row = self._data.row_of[self._day, j] if j is not None else -1
+        if row < 0:
+            raise KeyError(ticker)
+        return RowView(self._data.columns[j], row)
+    
+    def __contains__(self, ticker):
+        j = self._data.ticker_index.get(ticker)
+        return j is not None and self._data.row_of[self._day, j] >= 0
+    
+    def __iter__(self):
+        tickers = self._data.tickers
+        return (tickers[j] for j in np.flatnonzero(self._data.available[self._day]))
+    
+    def __len__(self):
+        return int(self._data.available[self._day].sum())
+
+
+class PositionView(Mapping):
+    """單一股票的持倉 {'shares', 'avg_cost'}（唯讀，隨引擎狀態即時更新）"""
+    __slots__ = ('_shares', '_avg_cost', '_j')
+    _FIELDS = ('shares', 'avg_cost')
+    
+    def __init__(self, shares: np.ndarray, avg_cost: np.ndarray, j: int):
+        self._shares = shares
+        self._avg_cost = avg_cost
+        self._j = j
+    
+    def __getitem__(self, field):
+        if field == 'shares':
+            return int(self._shares[self._j])
+        if field == 'avg_cost':
+            return float(self._avg_cost[self._j])
+        raise KeyError(field)
+    
+    def __iter__(self):
+        return iter(self._FIELDS)
+    
+    def __len__(self):
+        return len(self._FIELDS)
+
+
+class PositionsView(Mapping):
+    """所有股票的持倉 {ticker: PositionView}（唯讀）"""
+    
+    def __init__(self, tickers: list, shares: np.ndarray, avg_cost: np.ndarray):
+        self._index = {t: j for j, t in enumerate(tickers)}
+        self._views = {t: PositionView(shares, avg_cost, j) for t, j in self._index.items()}
+    
+    def __getitem__(self, ticker):
+        return self._views[ticker]
+    
+    def __iter__(self):
+        return iter(self._views)
+    
+    def __len__(self):
+        return len(self._views)
+
+
+# ========== 對齊後的資料 ==========
+
+class PortfolioData:
+    """
+    多檔股票對齊到同一條日期軸
+    
+    Attributes:
+        dates: 日期字串（排序後的聯集）
+        tickers: 股票代碼（依 data_map 順序）
+        close: (日期, 股票) 收盤價，沒有資料為 NaN
+        available: (日期, 股票) 該日是否有資料
+        row_of: (日期, 股票) 該日在原始 DataFrame 的列位置，沒有資料為 -1
+        columns: 每檔股票 {欄位: 陣列}（原始長度，不對齊、不複製成矩陣）
+    """
+    
+    def __init__(self, data_map: Dict[str, pd.DataFrame]):
+        self.tickers = list(data_map.keys())
+        self.ticker_index = {t: j for j, t in enumerate(self.tickers)}
+        
+        keys = []
+        self.columns = []
+        for ticker, df in data_map.items():
+            names = [c.lower() for c in df.columns]
+            # 確保有 date 欄位且為字串
+            if 'date' in names:
+                date_keys = df.iloc[:, names.index('date')].astype(str).to_numpy()
+            else:
+                date_keys = df.index.astype(str).to_numpy()
+            if len(pd.unique(date_keys)) != len(date_keys):
+                raise ValueError(f"{ticker} 的日期有重複")
+            keys.append(date_keys.astype(str))
+            self.columns.append({name: df.iloc[:, k].to_numpy()
+                                 for k, name in enumerate(names) if name != 'date'})
+        
+        dates = np.unique(np.concatenate(keys)) if keys else np.array([], dtype=str)
+        self.dates = dates.tolist()
+        
+        shape = (len(self.dates), len(self.tickers))
+        self.row_of = np.full(shape, -1, dtype=np.int64)
+        self.close = np.full(shape, np.nan)
+        for j, date_keys in enumerate(keys):
+            rows = np.searchsorted(dates, date_keys)
+            self.row_of[rows, j] = np.arange(len(date_keys))
+            self.close[rows, j] = self.columns[j]['close']
+        self.available = self.row_of >= 0
+    
+    def slice(self, day: int) -> DataSlice:
+        return DataSlice(self, day)
+
 
 class PortfolioEngine:
     """
     多股投資組合回測引擎
+    
+    所有股票先對齊到同一條日期軸（收盤價矩陣 + 有無資料的遮罩），持股與平均成本存在陣列；
+    策略拿到的 data_slice / positions 是唯讀檢視，不會每天複製整列資料；
+    策略用 schedule() 登記的交易日才呼叫 rebalance_signal
     """
     def __init__(self,
                  initial_capital: float = 1_000_000,
                  commission: float = 0.001425,
                  tax: float = 0.003,
-                 slippage: float = 0.001):
+                 slippage: float = 0.001,
+                 lot_size: int = LOT_SIZE_ODD):
+        """
+        Args:
+            lot_size: 交易單位股數（1 為零股，1000 為整張）
+        """
         self.initial_capital = initial_capital
         self.commission = commission
         self.tax = tax
         self.slippage = slippage
+        self.lot_size = lot_size
         
-    def run(self, data_map: Dict[str, pd.DataFrame], strategy: PortfolioStrategy, 
+    def run(self, data_map, strategy: PortfolioStrategy, 
             rebalance_freq='monthly') -> dict:
         """
         執行回測
         
         Args:
-            data_map: {ticker: DataFrame} 股票資料字典，DF 需由舊到新排序
+            data_map: {ticker: DataFrame} 股票資料字典，DF 需由舊到新排序；
+                      也可以傳入已對齊的 PortfolioData（多個策略共用時只對齊一次）
             strategy: 投資組合策略
             rebalance_freq: 再平衡頻率 (daily, weekly, monthly) - 尚未實作，全部依策略訊號
             
@@ -37,77 +197,70 @@ class PortfolioEngine:
             dict: 回測結果
         """
         # 1. 時間軸對齊
-        # 收集所有日期
-        all_dates = set()
-        ticker_data_lookup = {}  # 加速查詢 {ticker: {date_str: row}}
-        
-        print("⏳ 正在整理多股資料與時間軸...")
+        if isinstance(data_map, PortfolioData):
+            data = data_map
+        else:
+            print("⏳ 正在整理多股資料與時間軸...")
+            data = PortfolioData(data_map)
+            print(f"✅ 時間軸建立完成: 共 {len(data.dates)} 個交易日")
+        sorted_dates = data.dates
+        tickers = data.tickers
         
-        # 預處理：轉成字典格式加速讀取，並找出所有日期
-        for ticker, df in data_map.items():
-            df = df.copy()
-            df.columns = [c.lower() for c in df.columns]
-            # 確保有 date 欄位且為字串
-            if 'date' not in df.columns:
-                df['date'] = df.index.astype(str)
-            else:
-                df['date'] = df['date'].astype(str)
-                
-            # 建立日期索引的資料表
-            df_dict = df.set_index('date').to_dict('index')
-            ticker_data_lookup[ticker] = df_dict
-            all_dates.update(df_dict.keys())
-            
-        # 排序日期
-        sorted_dates = sorted(list(all_dates))
-        print(f"✅ 時間軸建立完成: 共 {len(sorted_dates)} 個交易日")
+        # 策略登記的呼叫日（None 為每天呼叫）
+        calendar = TradingCalendar(sorted_dates)
+        events = strategy.schedule(calendar)
         
         # 2. 初始化帳戶狀態
         cash = self.initial_capital
-        # positions = {ticker: {'shares': 0, 'avg_cost': 0.0}}
-        positions = {ticker: {'shares': 0, 'avg_cost': 0.0} for ticker in data_map.keys()}
-        portfolio_value_curve = []  # 總權益曲線
-        trades = []
+        # 持倉存在陣列：shares[j]、avg_cost[j] 對應 tickers[j]
+        shares = np.zeros(len(tickers), dtype=np.int64)
+        avg_cost = np.zeros(len(tickers))
+        positions = PositionsView(tickers, shares, avg_cost)
+        equity_values = np.empty(len(sorted_dates))
+        cash_values = np.empty(len(sorted_dates))
+        market_values = np.empty(len(sorted_dates))
+        trades = TradeLog(sorted_dates, tickers=tickers)
+        # 每檔最後已知收盤價（停牌、上市櫃行事曆不同的日子沿用前值；尚未上市為 0，此時也不可能持有）
+        last_price = np.zeros(len(tickers))
+        private = np.array([ticker.startswith('_') for ticker in tickers], dtype=bool)
+        rebalancer = Rebalancer(self.commission, self.tax, self.slippage, self.lot_size)
+        
+        def buy(j, buy_shares, buy_price, total_cost):
+            # 更新平均成本
+            old_shares = int(shares[j])
+            new_shares = old_shares + buy_shares
+            avg_cost[j] = ((old_shares * float(avg_cost[j])) + total_cost) / new_shares
+            shares[j] = new_shares
         
         # 3. 逐日模擬
-        for current_date in sorted_dates:
-            # 取得當日各股價格
-            current_prices = {}
-            data_slice = {}
-            portfolio_market_value = 0
+        for day, current_date in enumerate(sorted_dates):
+            available = data.available[day]
+            np.copyto(last_price, data.close[day], where=available & ~np.isnan(data.close[day]))
+            
+            # 持股以最後已知收盤價計算市值（依股票順序累加）
+            held_value = shares * last_price
+            portfolio_market_value = np.cumsum(held_value)[-1] if len(held_value) else 0.0
             
-            # 先掃描今日有資料的股票
-            for ticker in data_map.keys():
-                row = ticker_data_lookup[ticker].get(current_date)
-                if row:
-                    price = row['close']
-                    current_prices[ticker] = price
-                    data_slice[ticker] = row
-                    portfolio_market_value += positions[ticker]['shares'] * price
-                elif positions[ticker]['shares'] > 0:
-                    # 今日無資料但有持倉，使用平均成本估算市值 (或上日收盤)
-                    # 為求精確應使用 Forward Fill，這裡簡化處理
-                    # 假設價格不變
-                    pass
-                    # 若要更精確，應維持上一個已知價格，這裡暫略
-
             # 計算當日總權益 (NAV)
             total_equity = cash + portfolio_market_value
-            portfolio_value_curve.append({
-                'date': current_date,
-                'equity': total_equity,
-                'cash': cash,
-                'market_value': portfolio_market_value
-            })
+            equity_values[day] = total_equity
+            cash_values[day] = cash
+            market_values[day] = portfolio_market_value
             
             # --- 再平衡邏輯 ---
-            available_tickers = list(current_prices.keys())
-            if not available_tickers:
+            if events is not None and not events[day]:
                 continue
-                
-            target_weights = strategy.rebalance_signal(current_date, available_tickers, data_slice, positions)
+            columns = np.flatnonzero(available)
+            if not len(columns):
+                continue
+            available_tickers = [tickers[j] for j in columns]
+            
+            target_weights = strategy.rebalance_signal(current_date, available_tickers,
+                                                       data.slice(day), positions)
             
             if target_weights is not None:
+                current_prices = data.close[day].tolist()
+                
                 # 檢查是否為 DCA 模式（純買入，不賣出）
                 is_dca_mode = target_weights.pop('_dca_mode', False)
                 monthly_amount = target_weights.pop('_monthly_amount', 0)
@@ -130,15 +283,19 @@ class PortfolioEngine:
                     # 等權重分配購買金額
                     per_ticker_budget = buy_budget / len(available_tickers)
                     
-                    for ticker in available_tickers:
+                    for j, ticker in zip(columns, available_tickers):
                         if ticker.startswith('_'):
                             continue
-                        current_price = current_prices[ticker]
+                        current_price = current_prices[j]
+                        if not current_price > 0:
+                            # 收盤價缺值：今天不買（同再平衡的可交易條件）
+                            continue
                         buy_price = current_price * (1 + self.slippage)
                         cost_factor = 1 + self.commission + self.slippage
                         
                         # 計算可購買股數
                         buy_shares = int(per_ticker_budget / (buy_price * cost_factor))
+                        buy_shares -= buy_shares % self.lot_size
                         
                         if buy_shares > 0:
                             cost = buy_shares * buy_price
@@ -147,141 +304,50 @@ class PortfolioEngine:
                             
                             if cash >= total_cost:
                                 cash -= total_cost
+                                buy(j, buy_shares, buy_price, total_cost)
                                 
-                                # 更新平均成本
-                                old_shares = positions[ticker]['shares']
-                                old_cost = positions[ticker]['avg_cost']
-                                new_shares = old_shares + buy_shares
-                                new_avg_cost = ((old_shares * old_cost) + total_cost) / new_shares
-                                
-                                positions[ticker]['shares'] = new_shares
-                                positions[ticker]['avg_cost'] = new_avg_cost
-                                
-                                trades.append({
-                                    'date': current_date,
-                                    'ticker': ticker,
-                                    'type': 'BUY',
-                                    'shares': buy_shares,
-                                    'price': buy_price,
-                                    'amount': total_cost,
-                                    'profit': 0,
-                                    'reason': '定期定額買入' if not is_first_buy else '初始資金買入'
-                                })
+                                trades.append(day, SIDE_BUY, buy_price, buy_shares, total_cost,
+                                              reason='定期定額買入' if not is_first_buy else '初始資金買入',
+                                              ticker=ticker)
                 else:
-                    # 一般再平衡模式（包含賣出）
-                    # 賣出邏輯 (先賣再買，釋放資金)
-                    for ticker in available_tickers:
-                        if ticker.startswith('_'):
-                            continue
-                        current_shares = positions[ticker]['shares']
-                        current_price = current_prices[ticker]
-                        
-                        # 目標權重 (若無則為 0)
-                        w = target_weights.get(ticker, 0.0)
-                        target_value = total_equity * w
-                        target_shares = int(target_value / current_price)
-                        
-                        diff_shares = target_shares - current_shares
-                        
-                        if diff_shares < 0:
-                            # SELL
-                            sell_shares = abs(diff_shares)
-                            sell_price = current_price * (1 - self.slippage)
-                            revenue = sell_shares * sell_price
-                            fee_comm = revenue * self.commission
-                            fee_tax = revenue * self.tax
-                            net_revenue = revenue - fee_comm - fee_tax
-                            
-                            # 計算損益
-                            avg_cost = positions[ticker]['avg_cost']
-                            cost_basis = sell_shares * avg_cost
-                            realized_pnl = net_revenue - cost_basis
-                            
-                            cash += net_revenue
-                            positions[ticker]['shares'] -= sell_shares
-                            if positions[ticker]['shares'] == 0:
-                                positions[ticker]['avg_cost'] = 0.0
-                            
-                            trades.append({
-                                'date': current_date,
-                                'ticker': ticker,
-                                'type': 'SELL',
-                                'shares': sell_shares,
-                                'price': sell_price,
-                                'amount': net_revenue,
-                                'profit': realized_pnl,
-                                'reason': '再平衡賣出'
-                            })
-                    
-                    # 買入邏輯
-                    for ticker in available_tickers:
-                        if ticker.startswith('_'):
-                            continue
-                        current_shares = positions[ticker]['shares']
-                        current_price = current_prices[ticker]
-                        w = target_weights.get(ticker, 0.0)
-                        target_value = total_equity * w
-                        
-                        # 買入時要考慮成本
-                        cost_factor = 1 + self.commission + self.slippage
-                        target_shares = int(target_value / (current_price * cost_factor))
-                        
-                        diff_shares = target_shares - current_shares
-                        
-                        if diff_shares > 0:
-                            # BUY
-                            buy_shares = diff_shares
-                            buy_price = current_price * (1 + self.slippage)
-                            cost = buy_shares * buy_price
-                            fee_comm = cost * self.commission
-                            
-                            total_cost = cost + fee_comm
-                            
-                            if cash >= total_cost:
-                                cash -= total_cost
-                                
-                                # 更新平均成本
-                                old_shares = positions[ticker]['shares']
-                                old_cost = positions[ticker]['avg_cost']
-                                new_shares = old_shares + buy_shares
-                                new_avg_cost = ((old_shares * old_cost) + total_cost) / new_shares
-                                
-                                positions[ticker]['shares'] = new_shares
-                                positions[ticker]['avg_cost'] = new_avg_cost
-                                
-                                trades.append({
-                                    'date': current_date,
-                                    'ticker': ticker,
-                                    'type': 'BUY',
-                                    'shares': buy_shares,
-                                    'price': buy_price,
-                                    'amount': total_cost,
-                                    'profit': 0,
-                                    'reason': '再平衡買入'
-                                })
+                    # 一般再平衡模式（包含賣出）：目標股數、費用與現金檢查整批計算
+                    weights = np.zeros(len(tickers))
+                    for ticker, w in target_weights.items():
+                        j = data.ticker_index.get(ticker)
+                        if j is not None:
+                            weights[j] = w
+                    cash, sells, buys = rebalancer.rebalance(cash, shares, avg_cost, data.close[day],
+                                                             weights, total_equity,
+                                                             available & ~private)
+                    trades.extend(day, SIDE_SELL, sells.price, sells.shares, sells.amount,
+                                  pnl=sells.pnl, reason='再平衡賣出', ticker=sells.ticker)
+                    trades.extend(day, SIDE_BUY, buys.price, buys.shares, buys.amount,
+                                  reason='再平衡買入', ticker=buys.ticker)
         
-        # 4. 結算 - 計算最終市值
+        # 4. 結算 - 計算最終市值（最後一天沒有資料的持股用最後已知收盤價）
         final_market_value = 0
         final_prices = {}
-        for ticker, pos in positions.items():
-            if pos['shares'] > 0:
-                # 嘗試取得最後一天的價格
-                last_row = ticker_data_lookup[ticker].get(sorted_dates[-1])
-                if last_row:
-                    price = last_row['close']
-                    final_prices[ticker] = price
-                    final_market_value += pos['shares'] * price
+        for j, ticker in enumerate(tickers):
+            if shares[j] > 0:
+                price = float(last_price[j])
+                final_prices[ticker] = price
+                final_market_value += int(shares[j]) * price
         
         # 總權益 = 現金 + 持股市值
         final_equity = cash + final_market_value
         
-        df_result = pd.DataFrame(portfolio_value_curve)
-        df_result['date'] = pd.to_datetime(df_result['date'])
+        df_result = pd.DataFrame({
+            'date': pd.to_datetime(pd.Series(sorted_dates, dtype=object)),
+            'equity': equity_values,
+            'cash': cash_values,
+            'market_value': market_values
+        })
         df_result.set_index('date', inplace=True)
         
         # 計算績效指標 (重複利用 metrics 模組)
         equity_series = df_result['equity']
-        metrics = calculate_metrics(trades, equity_series, self.initial_capital)
+        metrics = calculate_metrics(trades, equity_series, self.initial_capital,
+                                    position=df_result['market_value'])
         
         # 覆蓋 final_capital 為正確的總權益
         metrics['final_capital'] = round(final_equity, 2)
@@ -291,12 +357,12 @@ class PortfolioEngine:
         metrics['total_trades'] = len(trades)  # 報告用這個 key
         
         # 轉換 positions 格式回傳 (僅回傳 shares 方便閱讀)
-        final_positions = {k: v['shares'] for k, v in positions.items() if v['shares'] > 0}
+        final_positions = {ticker: int(shares[j]) for j, ticker in enumerate(tickers) if shares[j] > 0}
         
         return {
             'metrics': metrics,
             'equity_curve': equity_series,
-            'trades': pd.DataFrame(trades),
+            'trades': trades.to_frame(),
             'positions': final_positions,
             'final_prices': final_prices
         }
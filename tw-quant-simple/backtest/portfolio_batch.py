@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+投資組合多策略比較
+
+同一組股票只讀取、對齊一次（PortfolioData），再依序或以多行程跑多個投資組合策略，
+回傳比較表與各策略的權益曲線。
+
+用法：
+    result = compare_portfolio_strategies(data_map, {
+        '等權重 每月': EqualWeightMonthlyStrategy(freq='monthly'),
+        '等權重 每季': EqualWeightMonthlyStrategy(freq='quarterly'),
+        '定期定額': DCAStrategy(buy_day=5, monthly_amount=20000),
+    })
+    result['table']           # 每列一個策略的績效
+    result['equity_curves']   # 每欄一個策略的權益曲線
+"""
+import copy
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+
+from .portfolio import PortfolioData, PortfolioEngine
+
+
+# 比較表欄位（依序）
+COMPARE_COLUMNS = [
+    'total_return', 'annual_return', 'volatility', 'sharpe_ratio', 'sortino_ratio',
+    'max_drawdown', 'max_drawdown_duration', 'calmar_ratio', 'exposure', 'turnover',
+    'win_rate', 'total_trades', 'final_equity', 'cash', 'market_value',
+]
+
+# 子行程的狀態（由 _init_worker 設定，整個行程共用）
+_worker = {}
+
+
+def _init_worker(data, engine):
+    _worker.update(data=data, engine=engine)
+
+
+def _worker_run(task):
+    name, strategy = task
+    return name, _worker['engine'].run(_worker['data'], strategy)
+
+
+def _named_strategies(strategies) -> list:
+    """{名稱: 策略} 或策略列表 → [(名稱, 策略複本)]；列表中同名的策略加上序號"""
+    if isinstance(strategies, dict):
+        items = list(strategies.items())
+    else:
+        items = [(strategy.name, strategy) for strategy in strategies]
+
+    named = []
+    seen = {}
+    for name, strategy in items:
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name} #{seen[name]}"
+        # 策略會記錄再平衡狀態，每次比較都從全新的複本開始
+        named.append((name, copy.deepcopy(strategy)))
+    return named
+
+
+def compare_portfolio_strategies(data_map, strategies,
+                                 engine: PortfolioEngine = None,
+                                 num_workers: int = 1) -> dict:
+    """
+    在同一組股票上比較多個投資組合策略
+
+    Args:
+        data_map: {ticker: DataFrame} 或已對齊的 PortfolioData
+        strategies: {名稱: PortfolioStrategy} 或 PortfolioStrategy 列表（以 strategy.name 命名）
+        engine: 投資組合引擎（預設 PortfolioEngine()）
+        num_workers: 平行執行的行程數（1 為單行程，0 為 CPU 核心數）
+
+    Returns:
+        dict: {
+            'table': 比較表 DataFrame（index 為策略名稱，欄位見 COMPARE_COLUMNS）,
+            'equity_curves': 權益曲線 DataFrame（每欄一個策略）,
+            'results': {名稱: PortfolioEngine.run() 的回傳結果}
+        }
+    """
+    data = data_map if isinstance(data_map, PortfolioData) else PortfolioData(data_map)
+    engine = engine or PortfolioEngine()
+    tasks = _named_strategies(strategies)
+    if not tasks:
+        raise ValueError("沒有要比較的策略")
+
+    if num_workers is None or num_workers <= 0:
+        num_workers = cpu_count()
+    num_workers = min(num_workers, len(tasks))
+
+    if num_workers <= 1:
+        results = {name: engine.run(data, strategy) for name, strategy in tasks}
+    else:
+        with Pool(processes=num_workers, initializer=_init_worker,
+                  initargs=(data, engine)) as pool:
+            # imap 依提交順序回傳，結果順序固定
+            results = dict(pool.imap(_worker_run, tasks))
+
+    table = pd.DataFrame([{column: result['metrics'].get(column) for column in COMPARE_COLUMNS}
+                          for result in results.values()],
+                         index=pd.Index(list(results), name='strategy'))
+    equity_curves = pd.DataFrame({name: result['equity_curve'] for name, result in results.items()})
+
+    return {
+        'table': table,
+        'equity_curves': equity_curves,
+        'results': results,
+    }
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+目標權重再平衡（陣列版）
+
+一次再平衡的目標股數、買賣股數、手續費、證交稅、滑價與現金是否足夠，全部以股票為維度的陣列一次算完：
+
+- 先賣後買：賣出不受現金限制，整批成交；賣出收入依股票順序加回現金
+- 買入依股票順序檢查現金，現金足夠整批買入時不需要逐檔迴圈；
+  遇到第一檔買不起的股票後，剩下的股票才逐檔檢查（與逐檔處理的結果相同）
+- lot_size=1 為零股交易，lot_size=1000 只買賣整張（目標股數無條件捨去到整張）
+"""
+import numpy as np
+
+
+LOT_SIZE_ODD = 1
+LOT_SIZE_ROUND = 1000
+
+
+def target_shares(total_equity: float, weights: np.ndarray, prices: np.ndarray,
+                  cost_factor: float = 1.0, lot_size: int = LOT_SIZE_ODD) -> np.ndarray:
+    """
+    目標權重換算成目標股數
+
+    Args:
+        total_equity: 總權益
+        weights: 各股票目標權重
+        prices: 各股票價格（NaN 表示無法交易）
+        cost_factor: 價格放大倍數（買入時含手續費與滑價）
+        lot_size: 交易單位股數
+
+    Returns:
+        np.ndarray: 目標股數（float，無條件捨去；無法計算的為 NaN）
+    """
+    target_value = total_equity * weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if cost_factor == 1.0:
+            shares = np.trunc(target_value / prices)
+        else:
+            shares = np.trunc(target_value / (prices * cost_factor))
+        if lot_size > 1:
+            shares = np.floor(shares / lot_size) * lot_size
+    return shares
+
+
+class TradeBlock:
+    """
+    一次再平衡單一方向的成交（依股票順序）
+
+    Attributes:
+        ticker: 股票位置
+        price: 成交價（含滑價）
+        shares: 股數
+        amount: 買入為含手續費成本，賣出為扣除手續費與稅的淨收入
+        pnl: 已實現損益（買入為 0）
+    """
+    __slots__ = ('ticker', 'price', 'shares', 'amount', 'pnl')
+
+    def __init__(self, ticker, price, shares, amount, pnl):
+        self.ticker = ticker
+        self.price = price
+        self.shares = shares
+        self.amount = amount
+        self.pnl = pnl
+
+    def __len__(self):
+        return len(self.ticker)
+
+
+class Rebalancer:
+    """
+    目標權重再平衡
+
+    用法：
+        rebalancer = Rebalancer(commission=0.001425, tax=0.003, slippage=0.001, lot_size=1000)
+        cash, sells, buys = rebalancer.rebalance(cash, shares, avg_cost, prices, weights,
+                                                 total_equity, tradable)
+    """
+
+    def __init__(self, commission: float = 0.001425, tax: float = 0.003,
+                 slippage: float = 0.001, lot_size: int = LOT_SIZE_ODD):
+        """
+        Args:
+            commission: 手續費率
+            tax: 證交稅率（賣出）
+            slippage: 滑價
+            lot_size: 交易單位股數（1 為零股，1000 為整張）
+        """
+        if lot_size < 1:
+            raise ValueError("lot_size 必須大於 0")
+        self.commission = commission
+        self.tax = tax
+        self.slippage = slippage
+        self.lot_size = int(lot_size)
+
+    def rebalance(self, cash: float, shares: np.ndarray, avg_cost: np.ndarray,
+                  prices: np.ndarray, weights: np.ndarray, total_equity: float,
+                  tradable: np.ndarray) -> tuple:
+        """
+        執行一次再平衡（就地更新 shares 與 avg_cost）
+
+        Args:
+            cash: 目前現金
+            shares: 各股票持股（int64，就地更新）
+            avg_cost: 各股票平均成本（就地更新）
+            prices: 各股票今日價格
+            weights: 各股票目標權重（沒有的為 0）
+            total_equity: 計算目標部位用的總權益
+            tradable: 今日可交易的股票遮罩
+
+        Returns:
+            tuple: (再平衡後現金, 賣出 TradeBlock, 買入 TradeBlock)
+        """
+        tradable = tradable & (prices > 0)
+        sells = self._sell(shares, avg_cost, prices, weights, total_equity, tradable)
+        if len(sells):
+            cash = float(np.cumsum(np.concatenate(([cash], sells.amount)))[-1])
+        cash, buys = self._buy(cash, shares, avg_cost, prices, weights, total_equity, tradable)
+        return cash, sells, buys
+
+    def _sell(self, shares, avg_cost, prices, weights, total_equity, tradable) -> TradeBlock:
+        target = target_shares(total_equity, weights, prices, lot_size=self.lot_size)
+        js = np.flatnonzero(tradable & (target < shares))
+        sell_shares = shares[js] - target[js].astype(np.int64)
+        sell_price = prices[js] * (1 - self.slippage)
+        revenue = sell_shares * sell_price
+        net_revenue = revenue - revenue * self.commission - revenue * self.tax
+        realized_pnl = net_revenue - sell_shares * avg_cost[js]
+
+        shares[js] -= sell_shares
+        avg_cost[js[shares[js] == 0]] = 0.0
+        return TradeBlock(js, sell_price, sell_shares, net_revenue, realized_pnl)
+
+    def _buy(self, cash, shares, avg_cost, prices, weights, total_equity, tradable) -> tuple:
+        cost_factor = 1 + self.commission + self.slippage
+        target = target_shares(total_equity, weights, prices, cost_factor, self.lot_size)
+        js = np.flatnonzero(tradable & (target > shares))
+        buy_shares = target[js].astype(np.int64) - shares[js]
+        buy_price = prices[js] * (1 + self.slippage)
+        cost = buy_shares * buy_price
+        total_cost = cost + cost * self.commission
+
+        # 依序扣款後的剩餘現金：remaining[k] 為買完前 k 檔後的現金
+        remaining = np.cumsum(np.concatenate(([cash], -total_cost)))
+        affordable = remaining[:-1] >= total_cost
+        if affordable.all():
+            cash = float(remaining[-1])
+        else:
+            # 從第一檔買不起的股票開始逐檔檢查
+            first = int(np.argmin(affordable))
+            cash = float(remaining[first])
+            affordable[first] = False
+            for k in range(first + 1, len(js)):
+                affordable[k] = cash >= total_cost[k]
+                if affordable[k]:
+                    cash -= float(total_cost[k])
+            js, buy_shares, buy_price, total_cost = (
+                js[affordable], buy_shares[affordable], buy_price[affordable], total_cost[affordable])
+
+        old_shares = shares[js]
+        new_shares = old_shares + buy_shares
+        avg_cost[js] = (old_shares * avg_cost[js] + total_cost) / new_shares
+        shares[js] = new_shares
+        return cash, TradeBlock(js, buy_price, buy_shares, total_cost, np.zeros(len(js)))
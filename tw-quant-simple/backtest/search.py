@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+參數搜尋
+
+網格很大時（例如 短均線 × 長均線 × 停損 × 停利）窮舉不可行。這裡提供可替換的取樣方式：
+- GridSampler：依序窮舉（同 grid_search）
+- RandomSampler：隨機取樣
+- TPESampler：依過去試驗結果，往表現好的參數區域取樣（Tree-structured Parzen Estimator）
+- SuccessiveHalving：所有候選先用短期資料評估，只把前段班升級到較長的資料
+
+各取樣方式共用同一套預算（試驗次數、時間上限、多少次沒有進步就停止）與試驗紀錄。
+"""
+import copy
+import math
+import time
+from dataclasses import dataclass, field
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from .engine import BacktestEngine
+from .risk import RiskManager
+
+
+# 這些參數交給 RiskManager（其餘參數傳給策略類別）
+RISK_PARAMS = ('stop_loss_pct', 'take_profit_pct', 'trailing_stop_pct')
+
+# 試驗紀錄中保留的績效欄位（同 StrategyOptimizer.grid_search）
+RECORD_METRICS = {
+    'sharpe_ratio': 'sharpe_ratio',
+    'total_return': 'total_return',
+    'annual_return': 'annual_return',
+    'max_drawdown': 'max_drawdown',
+    'win_rate': 'win_rate',
+    'profit_factor': 'profit_factor',
+    'total_trades': 'trade_count',
+}
+
+
+@dataclass
+class Trial:
+    """一次參數評估"""
+    number: int
+    params: dict
+    bars: int                      # 評估用的 K 棒數（取最近 bars 根）
+    score: float = float('-inf')   # 目標指標；失敗或交易次數不足為 -inf
+    metrics: dict = field(default_factory=dict)
+    state: str = 'complete'        # complete / failed
+    error: str = None
+
+
+def default_constraint(params: dict) -> bool:
+    """預設限制：短均線必須小於長均線"""
+    if 'short_period' in params and 'long_period' in params:
+        return params['short_period'] < params['long_period']
+    return True
+
+
+class Budget:
+    """
+    搜尋預算
+
+    任一條件達到即停止：
+    - n_trials: 試驗次數上限
+    - timeout: 秒數上限
+    - patience: 連續幾次試驗沒有刷新最佳分數就停止（提前停止）
+    """
+
+    def __init__(self, n_trials: int = None, timeout: float = None, patience: int = None):
+        self.n_trials = n_trials
+        self.timeout = timeout
+        self.patience = patience
+        self._start = None
+        self._offset = 0
+
+    def start(self, search: 'ParameterSearch'):
+        self._start = time.perf_counter()
+        self._offset = len(search.trials)
+
+    def exhausted(self, search: 'ParameterSearch') -> bool:
+        used = len(search.trials) - self._offset
+        if self.n_trials is not None and used >= self.n_trials:
+            return True
+        if self.timeout is not None and time.perf_counter() - self._start >= self.timeout:
+            return True
+        if self.patience is not None and used > 0:
+            best = search.leader()
+            since_best = len(search.trials) - 1 - best.number if best is not None else used
+            if since_best >= self.patience:
+                return True
+        return False
+
+
+# ========== 取樣方式 ==========
+
+class Sampler:
+    """
+    取樣方式基類
+
+    子類別實作 ask()：回傳下一組要評估的參數（None 表示已無可評估的組合）；
+    需要自行安排評估流程時（例如 SuccessiveHalving）改寫 run()。
+    """
+
+    def __init__(self, seed: int = None):
+        self.rng = np.random.default_rng(seed)
+
+    def ask(self, search: 'ParameterSearch') -> dict:
+        raise NotImplementedError("請實作 ask 方法")
+
+    def default_trials(self, search: 'ParameterSearch') -> int:
+        """沒有指定任何預算時的試驗次數"""
+        return search.size
+
+    def run(self, search: 'ParameterSearch', budget: Budget):
+        while not budget.exhausted(search):
+            params = self.ask(search)
+            if params is None:
+                break
+            search.evaluate(params)
+
+    def _random(self, search: 'ParameterSearch', max_tries: int = 100) -> dict:
+        """隨機取一組未評估過、符合限制的參數"""
+        for _ in range(max_tries):
+            params = {name: values[self.rng.integers(len(values))]
+                      for name, values in search.space.items()}
+            if search.is_new(params):
+                return params
+        # 隨機取不到時依序找剩下的組合
+        for params in search.combinations():
+            if search.is_new(params):
+                return params
+        return None
+
+
+class GridSampler(Sampler):
+    """依序窮舉所有組合"""
+
+    def __init__(self, seed: int = None):
+        super().__init__(seed)
+        self._remaining = None
+
+    def ask(self, search):
+        if self._remaining is None:
+            self._remaining = search.combinations()
+        for params in self._remaining:
+            if search.is_new(params):
+                return params
+        return None
+
+
+class RandomSampler(Sampler):
+    """隨機取樣（不重複）"""
+
+    def ask(self, search):
+        return self._random(search)
+
+
+class TPESampler(Sampler):
+    """
+    TPE（Tree-structured Parzen Estimator）取樣
+
+    前 n_startup 次隨機取樣；之後把已完成的試驗依分數分成前 gamma 比例（好）與其餘（差），
+    各參數在候選值上以核密度估計 l(x)（好）與 g(x)（差），
+    抽 n_candidates 組候選，取 l(x) / g(x) 最大者。參數值依列表順序視為有序。
+    """
+
+    def __init__(self, n_startup: int = 10, gamma: float = 0.25, n_candidates: int = 24,
+                 seed: int = None):
+        super().__init__(seed)
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+
+    def _density(self, indices: list, size: int) -> np.ndarray:
+        """候選值位置上的平滑密度（均勻先驗 + 高斯核）"""
+        positions = np.arange(size)
+        bandwidth = max(1.0, size / 10)
+        density = np.full(size, 1.0 / size)
+        for i in indices:
+            density += np.exp(-0.5 * ((positions - i) / bandwidth) ** 2)
+        return density / density.sum()
+
+    def ask(self, search):
+        done = [t for t in search.trials if t.state == 'complete' and t.bars == search.n_bars]
+        if len(done) < self.n_startup:
+            return self._random(search)
+
+        ranked = sorted(done, key=lambda t: t.score, reverse=True)
+        n_good = max(1, math.ceil(self.gamma * len(ranked)))
+        good, bad = ranked[:n_good], ranked[n_good:]
+
+        draws = np.zeros((self.n_candidates, len(search.space)), dtype=np.int64)
+        log_ratio = np.zeros(self.n_candidates)
+        for j, (name, values) in enumerate(search.space.items()):
+            l = self._density([values.index(t.params[name]) for t in good], len(values))
+            g = self._density([values.index(t.params[name]) for t in bad], len(values))
+            draws[:, j] = self.rng.choice(len(values), size=self.n_candidates, p=l)
+            log_ratio += np.log(l[draws[:, j]]) - np.log(g[draws[:, j]])
+
+        names = list(search.space)
+        for k in np.argsort(-log_ratio, kind='stable'):
+            params = {name: search.space[name][draws[k, j]] for j, name in enumerate(names)}
+            if search.is_new(params):
+                return params
+        return self._random(search)
+
+
+class SuccessiveHalving(Sampler):
+    """
+    連續減半
+
+    先取 n_candidates 組參數，全部用最近 min_bars 根 K 棒評估；依分數保留前 1/eta，
+    資料長度乘以 eta 再評估，直到使用全部資料。差的參數只花短期資料的成本。
+    """
+
+    def __init__(self, n_candidates: int = 27, min_bars: int = 120, eta: int = 3,
+                 sampler: Sampler = None, seed: int = None):
+        """
+        Args:
+            n_candidates: 第一輪的候選數
+            min_bars: 第一輪使用的 K 棒數
+            eta: 每輪保留 1/eta、資料長度乘以 eta
+            sampler: 產生候選的取樣方式（預設隨機）
+        """
+        super().__init__(seed)
+        if eta < 2:
+            raise ValueError("eta 必須 >= 2")
+        self.n_candidates = n_candidates
+        self.min_bars = min_bars
+        self.eta = eta
+        self.sampler = sampler or RandomSampler(seed)
+
+    def rungs(self, n_bars: int) -> list:
+        """各輪使用的 K 棒數"""
+        rungs = []
+        bars = min(self.min_bars, n_bars)
+        while bars < n_bars:
+            rungs.append(bars)
+            bars *= self.eta
+        rungs.append(n_bars)
+        return rungs
+
+    def default_trials(self, search) -> int:
+        """各輪候選數的總和（每輪都評估完，最後一輪使用全部資料）"""
+        n = min(self.n_candidates, search.size)
+        total = 0
+        for _ in self.rungs(search.n_bars):
+            total += n
+            n = max(1, n // self.eta)
+        return total
+
+    def _finish_early(self, search):
+        """預算在最後一輪前用完：目前領先的候選直接用全部資料評估一次（不受預算限制）"""
+        if search.best is not None:
+            return
+        leader = search.leader()
+        if leader is not None:
+            search.evaluate(leader.params)
+
+    def run(self, search, budget):
+        # 候選暫時登記為已看過，避免重複
+        candidates = []
+        for _ in range(self.n_candidates):
+            params = self.sampler.ask(search)
+            if params is None:
+                break
+            candidates.append(params)
+            search.mark_seen(params)
+
+        for bars in self.rungs(search.n_bars):
+            trials = []
+            for params in candidates:
+                if budget.exhausted(search):
+                    self._finish_early(search)
+                    return
+                trials.append(search.evaluate(params, bars=bars))
+
+            keep = max(1, len(trials) // self.eta)
+            ranked = sorted(trials, key=lambda t: t.score, reverse=True)
+            candidates = [t.params for t in ranked[:keep]]
+
+
+SAMPLERS = {
+    'grid': GridSampler,
+    'random': RandomSampler,
+    'tpe': TPESampler,
+    'halving': SuccessiveHalving,
+}
+
+
+# ========== 搜尋 ==========
+
+class ParameterSearch:
+    """
+    參數搜尋
+
+    用法：
+        search = ParameterSearch(df, MACrossStrategy, {
+            'short_period': list(range(3, 40)),
+            'long_period': list(range(20, 250, 5)),
+            'stop_loss_pct': [None, 0.05, 0.08, 0.1],
+        })
+        best = search.optimize('tpe', n_trials=100, timeout=60, patience=30)
+        search.trials_frame()
+    """
+
+    def __init__(self, df: pd.DataFrame, strategy_class, space: dict,
+                 metric: str = 'sharpe_ratio',
+                 engine: BacktestEngine = None,
+                 min_trades: int = 3,
+                 constraint=default_constraint):
+        """
+        Args:
+            df: 股價 DataFrame
+            strategy_class: 策略類別
+            space: 參數空間 {參數名稱: 候選值列表}；stop_loss_pct / take_profit_pct /
+                trailing_stop_pct 交給 RiskManager（None 表示不啟用）
+            metric: 目標指標（越大越好；max_drawdown 為負值，越接近 0 越好）
+            engine: 回測引擎（預設向量化模式）
+            min_trades: 交易次數低於此值的試驗分數視為 -inf
+            constraint: 參數限制函數，回傳 False 的組合不評估
+        """
+        if not space:
+            raise ValueError("參數空間不可為空")
+        self.df = df.copy()
+        self.df.columns = [c.lower() for c in self.df.columns]
+        self.strategy_class = strategy_class
+        self.space = {name: list(values) for name, values in space.items()}
+        self.metric = metric
+        self.engine = engine or BacktestEngine(mode='vectorized')
+        self.min_trades = min_trades
+        self.constraint = constraint or (lambda params: True)
+        self.trials = []
+        self._seen = set()
+
+    @property
+    def n_bars(self) -> int:
+        return len(self.df)
+
+    @property
+    def size(self) -> int:
+        """參數空間大小（未套用限制）"""
+        return math.prod(len(values) for values in self.space.values())
+
+    def _key(self, params: dict) -> tuple:
+        return tuple(params[name] for name in self.space)
+
+    def combinations(self):
+        """依序產生所有符合限制的組合"""
+        names = list(self.space)
+        for combo in product(*self.space.values()):
+            params = dict(zip(names, combo))
+            if self.constraint(params):
+                yield params
+
+    def is_new(self, params: dict) -> bool:
+        """是否符合限制且尚未評估"""
+        return self.constraint(params) and self._key(params) not in self._seen
+
+    def mark_seen(self, params: dict):
+        self._seen.add(self._key(params))
+
+    # ========== 評估 ==========
+
+    def evaluate(self, params: dict, bars: int = None) -> Trial:
+        """
+        回測一組參數並加入試驗紀錄
+
+        Args:
+            params: 參數
+            bars: 只用最近 bars 根 K 棒（None 為全部）
+        """
+        bars = self.n_bars if bars is None else min(int(bars), self.n_bars)
+        self.mark_seen(params)
+        trial = Trial(number=len(self.trials), params=dict(params), bars=bars)
+
+        strategy_params = {k: v for k, v in params.items() if k not in RISK_PARAMS}
+        risk_params = {k: v for k, v in params.items() if k in RISK_PARAMS}
+        engine = self.engine
+        if any(v is not None for v in risk_params.values()):
+            engine = copy.copy(self.engine)
+            engine.risk_manager = RiskManager(**risk_params)
+
+        data = self.df if bars == self.n_bars else self.df.iloc[-bars:]
+        try:
+            result = engine.run(data, self.strategy_class(**strategy_params))
+            trial.metrics = result['metrics']
+            if trial.metrics.get('trade_count', 0) >= self.min_trades:
+                trial.score = float(trial.metrics.get(self.metric, 0))
+        except Exception as e:
+            trial.state = 'failed'
+            trial.error = str(e)
+
+        self.trials.append(trial)
+        return trial
+
+    @property
+    def best(self) -> Trial:
+        """最佳試驗：使用全部資料評估的試驗中分數最高者（只用短期資料評估過的不算）"""
+        done = [t for t in self.trials if t.state == 'complete' and t.bars == self.n_bars]
+        if not done:
+            return None
+        return max(done, key=lambda t: (t.score, -t.number))
+
+    def leader(self) -> Trial:
+        """目前領先的試驗：使用最長資料的試驗中分數最高者（搜尋途中判斷進步與否用）"""
+        done = [t for t in self.trials if t.state == 'complete']
+        if not done:
+            return None
+        return max(done, key=lambda t: (t.bars, t.score, -t.number))
+
+    def optimize(self, sampler='tpe', n_trials: int = None, timeout: float = None,
+                 patience: int = None, seed: int = None, verbose: bool = True) -> Trial:
+        """
+        執行搜尋（可多次呼叫，試驗紀錄會累積）
+
+        Args:
+            sampler: 取樣方式物件或名稱（'grid' / 'random' / 'tpe' / 'halving'）
+            n_trials: 試驗次數上限（None 且無其他限制時為空間大小；halving 為各輪候選數總和）
+            timeout: 秒數上限
+            patience: 連續幾次沒有進步就停止
+            seed: 亂數種子（sampler 為名稱時使用）
+            verbose: 是否印出進度
+
+        Returns:
+            Trial: 最佳試驗
+        """
+        if isinstance(sampler, str):
+            if sampler not in SAMPLERS:
+                raise ValueError(f"sampler 必須是 {tuple(SAMPLERS)} 之一: {sampler}")
+            sampler = SAMPLERS[sampler](seed=seed)
+        if n_trials is None and timeout is None and patience is None:
+            n_trials = sampler.default_trials(self)
+
+        budget = Budget(n_trials, timeout, patience)
+        budget.start(self)
+        start_time = time.perf_counter()
+
+        if verbose:
+            print(f"🔍 參數搜尋: {type(sampler).__name__} | 空間大小 {self.size:,} | 目標 {self.metric}")
+
+        sampler.run(self, budget)
+
+        best = self.best
+        if verbose:
+            used = len(self.trials) - budget._offset
+            print(f"✅ 搜尋完成: {used} 次試驗，耗時 {time.perf_counter() - start_time:.1f} 秒")
+            if best is not None:
+                print(f"🏆 最佳參數: {best.params} ({self.metric}: {best.score:.4f})")
+        return best
+
+    def trials_frame(self) -> pd.DataFrame:
+        """試驗紀錄表（參數、K 棒數、狀態、分數與主要績效）"""
+        rows = []
+        for t in self.trials:
+            row = {'number': t.number, **t.params, 'bars': t.bars, 'state': t.state, 'score': t.score}
+            for column, key in RECORD_METRICS.items():
+                row[column] = t.metrics.get(key)
+            rows.append(row)
+        return pd.DataFrame(rows)
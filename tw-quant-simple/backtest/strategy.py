@@ -4,6 +4,7 @@
 """
 import pandas as pd
 import numpy as np
+from .features import MA, RSI, MACD, KD, BBANDS
 
 
 class Strategy:
@@ -31,6 +32,35 @@ class Strategy:
         """
         raise NotImplementedError("請實作 generate_signals 方法")
     
+    def signal_masks(self, data) -> tuple:
+        """
+        買賣條件（內建策略的訊號規則；全市場面板回測以寬表呼叫同一套規則）
+        
+        只使用 data[欄位] 與逐欄的 pandas 運算（比較、shift、rolling），
+        data 可以是單檔 DataFrame，也可以是取出 (K 棒 × 股票) 寬表的面板。
+        
+        Returns:
+            tuple: (買入遮罩, 賣出遮罩)
+        """
+        raise NotImplementedError("此策略沒有提供 signal_masks")
+    
+    def _signals_from_masks(self, df: pd.DataFrame) -> pd.Series:
+        """signal_masks → 訊號序列（先標買入，賣出覆蓋）"""
+        buy_signal, sell_signal = self.signal_masks(df)
+        signals = pd.Series(0, index=df.index)
+        signals[buy_signal] = 1
+        signals[sell_signal] = -1
+        return signals
+    
+    def required_features(self) -> list:
+        """
+        宣告策略需要的指標欄位（回測前由引擎補算缺少的欄位）
+        
+        Returns:
+            list: 指標規格，例如 [MA(5), RSI()]
+        """
+        return []
+    
     def __repr__(self):
         return f"<Strategy: {self.name}>"
 
@@ -48,9 +78,10 @@ class MACrossStrategy(Strategy):
         self.short_period = short_period
         self.long_period = long_period
     
+    def required_features(self):
+        return [MA(self.short_period), MA(self.long_period)]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
         short_ma = f'ma{self.short_period}'
         long_ma = f'ma{self.long_period}'
         
@@ -58,15 +89,19 @@ class MACrossStrategy(Strategy):
         if short_ma not in df.columns or long_ma not in df.columns:
             raise ValueError(f"DataFrame 需要包含 {short_ma} 和 {long_ma} 欄位")
         
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        short_ma = data[f'ma{self.short_period}']
+        long_ma = data[f'ma{self.long_period}']
+        
         # 黃金交叉（短上穿長）→ 買入
-        golden_cross = (df[short_ma] > df[long_ma]) & (df[short_ma].shift(1) <= df[long_ma].shift(1))
-        signals[golden_cross] = 1
+        golden_cross = (short_ma > long_ma) & (short_ma.shift(1) <= long_ma.shift(1))
         
         # 死亡交叉（短下穿長）→ 賣出
-        death_cross = (df[short_ma] < df[long_ma]) & (df[short_ma].shift(1) >= df[long_ma].shift(1))
-        signals[death_cross] = -1
+        death_cross = (short_ma < long_ma) & (short_ma.shift(1) >= long_ma.shift(1))
         
-        return signals
+        return golden_cross, death_cross
 
 
 class RSIStrategy(Strategy):
@@ -82,21 +117,25 @@ class RSIStrategy(Strategy):
         self.oversold = oversold
         self.overbought = overbought
     
+    def required_features(self):
+        return [RSI()]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
         if 'rsi' not in df.columns:
             raise ValueError("DataFrame 需要包含 rsi 欄位")
         
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        rsi = data['rsi']
+        
         # RSI 由下往上突破超賣區 → 買入
-        buy_signal = (df['rsi'] > self.oversold) & (df['rsi'].shift(1) <= self.oversold)
-        signals[buy_signal] = 1
+        buy_signal = (rsi > self.oversold) & (rsi.shift(1) <= self.oversold)
         
         # RSI 由上往下跌破超買區 → 賣出
-        sell_signal = (df['rsi'] < self.overbought) & (df['rsi'].shift(1) >= self.overbought)
-        signals[sell_signal] = -1
+        sell_signal = (rsi < self.overbought) & (rsi.shift(1) >= self.overbought)
         
-        return signals
+        return buy_signal, sell_signal
 
 
 class KDStrategy(Strategy):
@@ -112,25 +151,29 @@ class KDStrategy(Strategy):
         self.oversold = oversold
         self.overbought = overbought
     
+    def required_features(self):
+        return [KD()]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
         if 'k' not in df.columns or 'd' not in df.columns:
             raise ValueError("DataFrame 需要包含 k 和 d 欄位")
         
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        k, d = data['k'], data['d']
+        
         # K 上穿 D 且在超賣區 → 買入
-        buy_signal = ((df['k'] > df['d']) & 
-                      (df['k'].shift(1) <= df['d'].shift(1)) & 
-                      (df['k'] < self.overbought))
-        signals[buy_signal] = 1
+        buy_signal = ((k > d) & 
+                      (k.shift(1) <= d.shift(1)) & 
+                      (k < self.overbought))
         
         # K 下穿 D 且在超買區 → 賣出
-        sell_signal = ((df['k'] < df['d']) & 
-                       (df['k'].shift(1) >= df['d'].shift(1)) & 
-                       (df['k'] > self.oversold))
-        signals[sell_signal] = -1
+        sell_signal = ((k < d) & 
+                       (k.shift(1) >= d.shift(1)) & 
+                       (k > self.oversold))
         
-        return signals
+        return buy_signal, sell_signal
 
 
 class MACDStrategy(Strategy):
@@ -144,21 +187,25 @@ class MACDStrategy(Strategy):
     def __init__(self):
         super().__init__(name="MACD")
     
+    def required_features(self):
+        return [MACD()]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
         if 'macd' not in df.columns or 'macd_signal' not in df.columns:
             raise ValueError("DataFrame 需要包含 macd 和 macd_signal 欄位")
         
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        macd, macd_signal = data['macd'], data['macd_signal']
+        
         # MACD 上穿信號線 → 買入
-        buy_signal = (df['macd'] > df['macd_signal']) & (df['macd'].shift(1) <= df['macd_signal'].shift(1))
-        signals[buy_signal] = 1
+        buy_signal = (macd > macd_signal) & (macd.shift(1) <= macd_signal.shift(1))
         
         # MACD 下穿信號線 → 賣出
-        sell_signal = (df['macd'] < df['macd_signal']) & (df['macd'].shift(1) >= df['macd_signal'].shift(1))
-        signals[sell_signal] = -1
+        sell_signal = (macd < macd_signal) & (macd.shift(1) >= macd_signal.shift(1))
         
-        return signals
+        return buy_signal, sell_signal
 
 
 # ========== 法人跟單策略 ==========
@@ -184,12 +231,13 @@ class InstitutionalFollowStrategy(Strategy):
         self.threshold = threshold
     
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
         if self.inst_type not in df.columns:
             raise ValueError(f"DataFrame 需要包含 {self.inst_type} 欄位，請使用 load_stock_with_institutional() 載入資料")
         
-        inst = df[self.inst_type]
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        inst = data[self.inst_type]
         
         # 計算連續買超天數
         is_buying = inst > self.threshold
@@ -197,15 +245,13 @@ class InstitutionalFollowStrategy(Strategy):
         
         # 連續買超 N 天 → 買入
         buy_signal = (consecutive_buys == self.consecutive_days) & (consecutive_buys.shift(1) < self.consecutive_days)
-        signals[buy_signal] = 1
         
         # 連續賣超 N 天 → 賣出
         is_selling = inst < -self.threshold
         consecutive_sells = is_selling.rolling(self.consecutive_days).sum()
         sell_signal = (consecutive_sells == self.consecutive_days) & (consecutive_sells.shift(1) < self.consecutive_days)
-        signals[sell_signal] = -1
         
-        return signals
+        return buy_signal, sell_signal
 
 
 class ChipTechStrategy(Strategy):
@@ -222,6 +268,9 @@ class ChipTechStrategy(Strategy):
         self.rsi_oversold = rsi_oversold
         self.rsi_overbought = rsi_overbought
     
+    def required_features(self):
+        return [RSI(), MACD()]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
         signals = pd.Series(0, index=df.index)
         
@@ -330,23 +379,27 @@ class BollingerStrategy(Strategy):
     def __init__(self):
         super().__init__(name="Bollinger")
     
+    def required_features(self):
+        return [BBANDS()]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
         required = ['close', 'bb_lower', 'bb_upper']
         missing = [c for c in required if c not in df.columns]
         if missing:
             raise ValueError(f"DataFrame 缺少欄位: {missing}")
         
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        close, lower, upper = data['close'], data['bb_lower'], data['bb_upper']
+        
         # 股價從下方穿越下軌 → 買入
-        buy_signal = (df['close'] > df['bb_lower']) & (df['close'].shift(1) <= df['bb_lower'].shift(1))
-        signals[buy_signal] = 1
+        buy_signal = (close > lower) & (close.shift(1) <= lower.shift(1))
         
         # 股價從上方穿越上軌 → 賣出
-        sell_signal = (df['close'] < df['bb_upper']) & (df['close'].shift(1) >= df['bb_upper'].shift(1))
-        signals[sell_signal] = -1
+        sell_signal = (close < upper) & (close.shift(1) >= upper.shift(1))
         
-        return signals
+        return buy_signal, sell_signal
 
 
 class MomentumBreakoutStrategy(Strategy):
@@ -368,27 +421,28 @@ class MomentumBreakoutStrategy(Strategy):
         self.volume_mult = volume_mult
     
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        close, volume = data['close'], data['volume']
         
         # 計算 N 日高點、低點
-        high_n = df['high'].rolling(self.period).max()
-        low_n = df['low'].rolling(self.period).min()
+        high_n = data['high'].rolling(self.period).max()
+        low_n = data['low'].rolling(self.period).min()
         
         # 成交量均線
-        vol_ma = df['volume'].rolling(self.period).mean()
+        vol_ma = volume.rolling(self.period).mean()
         
         # 突破高點 + 量增 → 買入
         buy_signal = (
-            (df['close'] > high_n.shift(1)) &
-            (df['volume'] > vol_ma * self.volume_mult)
+            (close > high_n.shift(1)) &
+            (volume > vol_ma * self.volume_mult)
         )
-        signals[buy_signal] = 1
         
         # 跌破低點 → 賣出
-        sell_signal = df['close'] < low_n.shift(1)
-        signals[sell_signal] = -1
+        sell_signal = close < low_n.shift(1)
         
-        return signals
+        return buy_signal, sell_signal
 
 
 class MeanReversionStrategy(Strategy):
@@ -414,6 +468,9 @@ class MeanReversionStrategy(Strategy):
         self.rsi_low = rsi_low
         self.rsi_high = rsi_high
     
+    def required_features(self):
+        return [MA(self.ma_period), RSI()]
+    
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
         signals = pd.Series(0, index=df.index)
         
@@ -458,29 +515,30 @@ class VolumeBreakoutStrategy(Strategy):
         self.price_change = price_change
     
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        volume = data['volume']
         
         # 成交量均線
-        vol_ma = df['volume'].rolling(20).mean()
+        vol_ma = volume.rolling(20).mean()
         
         # 價格變動
-        price_pct = df['close'].pct_change()
+        price_pct = data['close'].pct_change()
         
         # 量增價漲 → 買入
         buy_signal = (
-            (df['volume'] > vol_ma * self.volume_mult) &
+            (volume > vol_ma * self.volume_mult) &
             (price_pct > self.price_change)
         )
-        signals[buy_signal] = 1
         
         # 量縮價跌 → 賣出
         sell_signal = (
-            (df['volume'] < vol_ma * 0.5) &
+            (volume < vol_ma * 0.5) &
             (price_pct < -self.price_change)
         )
-        signals[sell_signal] = -1
         
-        return signals
+        return buy_signal, sell_signal
 
 
 class TurtleStrategy(Strategy):
@@ -498,17 +556,17 @@ class TurtleStrategy(Strategy):
         self.exit_period = exit_period
     
     def generate_signals(self, df: pd.DataFrame) -> pd.Series:
-        signals = pd.Series(0, index=df.index)
-        
-        entry_high = df['high'].rolling(self.entry_period).max()
-        exit_low = df['low'].rolling(self.exit_period).min()
+        return self._signals_from_masks(df)
+    
+    def signal_masks(self, data) -> tuple:
+        close = data['close']
+        entry_high = data['high'].rolling(self.entry_period).max()
+        exit_low = data['low'].rolling(self.exit_period).min()
         
         # 突破 N 日高點 → 買入
-        buy_signal = df['close'] > entry_high.shift(1)
-        signals[buy_signal] = 1
+        buy_signal = close > entry_high.shift(1)
         
         # 跌破 M 日低點 → 賣出
-        sell_signal = df['close'] < exit_low.shift(1)
-        signals[sell_signal] = -1
+        sell_signal = close < exit_low.shift(1)
         
-        return signals
+        return buy_signal, sell_signal
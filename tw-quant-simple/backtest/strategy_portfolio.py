@@ -7,6 +7,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from typing import Dict, List, Optional
+from .trading_calendar import TradingCalendar
 
 
 class PortfolioStrategy:
@@ -15,12 +16,29 @@ class PortfolioStrategy:
     """
     def __init__(self, name="Portfolio Strategy"):
         self.name = name
+    
+    def schedule(self, calendar: TradingCalendar) -> Optional[np.ndarray]:
+        """
+        登記需要呼叫 rebalance_signal 的交易日
+        
+        其他日子引擎只更新市值，不呼叫策略；登記多餘的日子沒有關係（策略回傳 None 即可）
+        
+        Returns:
+            np.ndarray: bool 遮罩（長度同 calendar），None 表示每個交易日都呼叫
+        """
+        return None
         
     def rebalance_signal(self, current_date, available_tickers: list, 
                          data_slice: dict, positions: dict = None) -> dict:
         """
         產生再平衡訊號
         
+        Args:
+            current_date: 當日日期字串
+            available_tickers: 當日有資料的股票
+            data_slice: 唯讀對照 {ticker: 當日欄位}，如 data_slice[ticker]['close']
+            positions: 唯讀對照 {ticker: {'shares', 'avg_cost'}}（未持有時 shares 為 0）
+        
         Returns:
             dict: 目標權重 {ticker: target_weight}
                   None 表示不調整
@@ -63,6 +81,14 @@ class EqualWeightMonthlyStrategy(PortfolioStrategy):
         else:
             # 月初或季初：由上層判斷（每個新週期的第一個交易日）
             return True
+    
+    def schedule(self, calendar: TradingCalendar) -> np.ndarray:
+        """週頻為每個週一，月頻 / 季頻為每個週期的第一個交易日"""
+        if self.freq == "weekly":
+            return calendar.weekdays(0)
+        if self.freq == "quarterly":
+            return calendar.period_starts("quarterly")
+        return calendar.period_starts("monthly")
         
     def rebalance_signal(self, current_date, available_tickers: list, 
                          data_slice: dict, positions: dict = None) -> dict:
@@ -141,6 +167,25 @@ class BuyAndHoldStrategy(PortfolioStrategy):
         
         # multilayer 模式：已執行的加碼
         self.executed_extra_buys = set()
+    
+    def schedule(self, calendar: TradingCalendar) -> Optional[np.ndarray]:
+        """
+        鑽石手只在第一天買入；買回模式每天檢查停損停利
+        
+        多層次每次呼叫最多執行一筆（第一天的初始買入也算一筆），同日或早於第一天的加碼會順延到之後的交易日，
+        所以從最早的加碼日起，到最晚的加碼日之後再多 len(extra_buys) 個交易日為止每天都呼叫
+        """
+        if self.mode == "diamond":
+            return calendar.first_day()
+        if self.mode == "multilayer":
+            events = calendar.first_day()
+            starts = [calendar.on_or_after(extra['date'])
+                      for extra in self.extra_buys if extra.get('date')]
+            starts = [int(days[0]) for days in starts if len(days)]
+            if starts:
+                events[min(starts):max(starts) + len(self.extra_buys) + 1] = True
+            return events
+        return None
         
     def rebalance_signal(self, current_date, available_tickers: list, 
                          data_slice: dict, positions: dict = None) -> dict:
@@ -301,6 +346,10 @@ class DCAStrategy(PortfolioStrategy):
         self.last_buy_month = None
         self.is_first_buy = True  # 追蹤是否為第一次購買
         self.buy_only = True  # 標記這是純買入策略，不允許賣出
+    
+    def schedule(self, calendar: TradingCalendar) -> np.ndarray:
+        """第一天（初始資金）與每月 buy_day 號（含）之後的第一個交易日"""
+        return calendar.first_day() | calendar.month_days_on_or_after(self.buy_day)
         
     def rebalance_signal(self, current_date, available_tickers: list, 
                          data_slice: dict, positions: dict = None) -> dict:
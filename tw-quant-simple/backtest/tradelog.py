@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+交易紀錄（欄式陣列）
+
+回測迴圈中每筆交易只寫入幾個型別固定的陣列（K 棒位置、價格、股數、金額、損益、
+買賣方向、原因），日期字串與四捨五入等格式化延後到真正需要輸出時才做。
+TradeLog 的行為與原本的 list of dict 相容：可迭代、索引、切片、len()、與 list 比較。
+"""
+import numpy as np
+import pandas as pd
+
+
+SIDE_BUY = 1
+SIDE_SELL = 2
+
+SIDE_NAMES = {SIDE_BUY: 'BUY', SIDE_SELL: 'SELL'}
+
+
+class TradeLog:
+    """
+    欄式交易紀錄
+
+    - 單股回測（tickers=None）：輸出格式同 BacktestEngine 的交易明細
+      BUY  {'type', 'date', 'price', 'shares', 'cost'}
+      SELL {'type', 'date', 'price', 'shares', 'revenue', 'profit', 'return'[, 'reason']}
+      價格、金額取到小數 2 位，報酬率 4 位；日期取 label 的前 10 個字元
+    - 投資組合（指定 tickers）：輸出格式同 PortfolioEngine 的交易明細
+      {'date', 'ticker', 'type', 'shares', 'price', 'amount', 'profit', 'reason'}（不四捨五入）
+    """
+
+    def __init__(self, labels=None, tickers: list = None, capacity: int = 16):
+        """
+        Args:
+            labels: K 棒位置對應的日期（Series / list / ndarray）
+            tickers: 投資組合的股票代碼列表（單股回測不需要）
+            capacity: 初始容量（不足時自動加倍）
+        """
+        self.labels = labels
+        self.tickers = list(tickers) if tickers is not None else None
+        self._ticker_index = {t: i for i, t in enumerate(self.tickers)} if self.tickers is not None else {}
+        self._reasons = [None]
+        self._reason_codes = {None: 0}
+        self._n = 0
+        self._alloc(max(int(capacity), 1))
+        self._records = None
+
+    def _alloc(self, capacity):
+        self.bar = np.empty(capacity, dtype=np.int32)
+        self.side = np.empty(capacity, dtype=np.uint8)
+        self.price = np.empty(capacity, dtype=np.float64)
+        self.shares = np.empty(capacity, dtype=np.int64)
+        self.amount = np.empty(capacity, dtype=np.float64)
+        self.pnl = np.empty(capacity, dtype=np.float64)
+        self.entry = np.empty(capacity, dtype=np.float64)
+        self.reason = np.empty(capacity, dtype=np.uint8)
+        self.ticker = np.empty(capacity, dtype=np.int32)
+
+    _FIELDS = ('bar', 'side', 'price', 'shares', 'amount', 'pnl', 'entry', 'reason', 'ticker')
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in self._FIELDS}
+        # 反序列化後的空紀錄容量可能為 0
+        self._alloc(max(1, len(old['bar']) * 2))
+        for name, values in old.items():
+            getattr(self, name)[:self._n] = values[:self._n]
+
+    def _reason_code(self, reason) -> int:
+        code = self._reason_codes.get(reason)
+        if code is None:
+            code = len(self._reasons)
+            if code > 255:
+                raise ValueError("交易原因種類超過 255 種")
+            self._reasons.append(reason)
+            self._reason_codes[reason] = code
+        return code
+
+    # ========== 寫入 ==========
+
+    def append(self, bar: int, side: int, price: float, shares: int, amount: float,
+               pnl: float = 0.0, entry: float = 0.0, reason: str = None, ticker: str = None):
+        """
+        新增一筆交易
+
+        Args:
+            bar: K 棒位置（對應 labels）
+            side: SIDE_BUY / SIDE_SELL
+            price: 成交價（含滑價）
+            shares: 股數
+            amount: 買入為含手續費成本，賣出為淨收入
+            pnl: 已實現損益（賣出）
+            entry: 進場價（單股回測計算報酬率用）
+            reason: 交易原因
+            ticker: 股票代碼（投資組合）
+        """
+        if self._n == len(self.bar):
+            self._grow()
+        i = self._n
+        self.bar[i] = bar
+        self.side[i] = side
+        self.price[i] = price
+        self.shares[i] = shares
+        self.amount[i] = amount
+        self.pnl[i] = pnl
+        self.entry[i] = entry
+        self.reason[i] = self._reason_code(reason)
+        self.ticker[i] = self._ticker_index[ticker] if ticker is not None else -1
+        self._n += 1
+        self._records = None
+
+    def extend(self, bar: int, side: int, price, shares, amount, pnl=0.0,
+               reason: str = None, ticker=None):
+        """
+        一次新增多筆交易（同一根 K 棒、同一方向，例如一次再平衡的全部賣出）
+
+        Args:
+            price / shares / amount / pnl: 各筆交易的陣列（純量會廣播）
+            ticker: 各筆交易的股票位置（對應 tickers 的索引）
+        """
+        price = np.asarray(price, dtype=np.float64)
+        n = len(price)
+        if not n:
+            return
+        while self._n + n > len(self.bar):
+            self._grow()
+        rows = slice(self._n, self._n + n)
+        self.bar[rows] = bar
+        self.side[rows] = side
+        self.price[rows] = price
+        self.shares[rows] = shares
+        self.amount[rows] = amount
+        self.pnl[rows] = pnl
+        self.entry[rows] = 0.0
+        self.reason[rows] = self._reason_code(reason)
+        self.ticker[rows] = ticker if ticker is not None else -1
+        self._n += n
+        self._records = None
+
+    @classmethod
+    def from_arrays(cls, labels, bar, side, price, shares, amount, pnl, entry,
+                    reason_codes=None, reason_names=None) -> 'TradeLog':
+        """
+        由既有陣列建立（例如 kernels.simulate 的輸出），不逐筆寫入
+
+        Args:
+            reason_codes: 各筆交易的原因代碼
+            reason_names: {代碼: 原因字串}，代碼 0 / None 表示沒有原因
+        """
+        n = len(bar)
+        log = cls(labels, capacity=max(n, 1))
+        log.bar[:n] = bar
+        log.side[:n] = side
+        log.price[:n] = price
+        log.shares[:n] = shares
+        log.amount[:n] = amount
+        log.pnl[:n] = pnl
+        log.entry[:n] = entry
+        log.ticker[:n] = -1
+        if reason_codes is None:
+            log.reason[:n] = 0
+        else:
+            mapping = np.zeros(max(int(np.max(reason_codes, initial=0)) + 1, 1), dtype=np.uint8)
+            for code, name in (reason_names or {}).items():
+                if code < len(mapping):
+                    mapping[code] = log._reason_code(name)
+            log.reason[:n] = mapping[np.asarray(reason_codes, dtype=np.int64)]
+        log._n = n
+        return log
+
+    # ========== 陣列存取 ==========
+
+    def column(self, name: str) -> np.ndarray:
+        """取得某欄位的陣列（唯讀檢視）"""
+        if name not in self._FIELDS:
+            raise KeyError(name)
+        view = getattr(self, name)[:self._n]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def is_portfolio(self) -> bool:
+        return self.tickers is not None
+
+    def sell_mask(self) -> np.ndarray:
+        return self.side[:self._n] == SIDE_SELL
+
+    def profits(self) -> np.ndarray:
+        """
+        績效統計用的損益序列（與 dict 格式中帶 'profit' 的交易一致）
+
+        - 單股回測：只有賣出交易，取到小數 2 位
+        - 投資組合：每筆交易（買入為 0）
+        """
+        if self.is_portfolio:
+            return self.pnl[:self._n].copy()
+        return np.round(self.pnl[:self._n][self.sell_mask()], 2)
+
+    # ========== 轉換（API 邊界） ==========
+
+    def _dates(self, start: int, stop: int) -> list:
+        bars = self.bar[start:stop]
+        if self.labels is None:
+            values = bars.tolist()
+        elif isinstance(self.labels, pd.Series):
+            values = self.labels.iloc[bars].tolist()
+        else:
+            values = np.asarray(self.labels, dtype=object)[bars].tolist()
+        if self.is_portfolio:
+            return values
+        return [str(v)[:10] for v in values]
+
+    def _build(self, start: int, stop: int) -> list:
+        """把 [start, stop) 的交易整理成 dict"""
+        n = stop - start
+        dates = self._dates(start, stop)
+        side = self.side[start:stop].tolist()
+        price = self.price[start:stop].tolist()
+        shares = self.shares[start:stop].tolist()
+        amount = self.amount[start:stop].tolist()
+        pnl = self.pnl[start:stop].tolist()
+        reason = [self._reasons[c] for c in self.reason[start:stop].tolist()]
+
+        records = []
+        if self.is_portfolio:
+            tickers = [self.tickers[i] for i in self.ticker[start:stop].tolist()]
+            for k in range(n):
+                records.append({
+                    'date': dates[k],
+                    'ticker': tickers[k],
+                    'type': SIDE_NAMES[side[k]],
+                    'shares': shares[k],
+                    'price': price[k],
+                    'amount': amount[k],
+                    'profit': pnl[k],
+                    'reason': reason[k]
+                })
+        else:
+            entry = self.entry[start:stop].tolist()
+            for k in range(n):
+                if side[k] == SIDE_BUY:
+                    records.append({
+                        'type': 'BUY',
+                        'date': dates[k],
+                        'price': round(price[k], 2),
+                        'shares': shares[k],
+                        'cost': round(amount[k], 2)
+                    })
+                else:
+                    record = {
+                        'type': 'SELL',
+                        'date': dates[k],
+                        'price': round(price[k], 2),
+                        'shares': shares[k],
+                        'revenue': round(amount[k], 2),
+                        'profit': round(pnl[k], 2),
+                        'return': round(pnl[k] / (entry[k] * shares[k]), 4)
+                    }
+                    if reason[k]:
+                        record['reason'] = reason[k]
+                    records.append(record)
+        return records
+
+    def to_dicts(self) -> list:
+        """轉成 list of dict（結果會快取，TradeLog 再寫入時失效）"""
+        if self._records is None:
+            self._records = self._build(0, self._n)
+        return self._records
+
+    def record(self, k: int) -> dict:
+        """單筆交易的 dict（不轉換整份紀錄）"""
+        if k < 0:
+            k += self._n
+        if not 0 <= k < self._n:
+            raise IndexError("交易紀錄索引超出範圍")
+        return self._build(k, k + 1)[0]
+
+    def tail(self, n: int) -> list:
+        """最後 n 筆交易的 dict"""
+        return self._build(max(self._n - n, 0), self._n)
+
+    def to_frame(self) -> pd.DataFrame:
+        """轉成 DataFrame（欄位同 to_dicts）"""
+        if self.is_portfolio:
+            columns = ['date', 'ticker', 'type', 'shares', 'price', 'amount', 'profit', 'reason']
+            return pd.DataFrame(self.to_dicts(), columns=columns)
+        return pd.DataFrame(self.to_dicts())
+
+    def __getstate__(self):
+        # 序列化（多行程回傳結果）時只帶有效長度，不帶 dict 快取
+        state = self.__dict__.copy()
+        for name in self._FIELDS:
+            state[name] = state[name][:self._n].copy()
+        state['_records'] = None
+        return state
+
+    # ========== list 相容介面 ==========
+
+    def __len__(self):
+        return self._n
+
+    def __bool__(self):
+        return self._n > 0
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+    def __getitem__(self, key):
+        return self.to_dicts()[key]
+
+    def __eq__(self, other):
+        if isinstance(other, TradeLog):
+            return self.to_dicts() == other.to_dicts()
+        if isinstance(other, list):
+            return self.to_dicts() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        kind = '投資組合' if self.is_portfolio else '單股'
+        return f"<TradeLog {kind}: {self._n} 筆>"
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+交易日曆
+
+回測時間軸上的日期只解析一次，預先算好年、月、日、星期與週期，
+提供「每週/每月/每季第一個交易日」、「某日（含）之後第 n 個交易日」等查詢。
+
+投資組合策略用 `schedule(calendar)` 登記需要被呼叫的交易日，
+PortfolioEngine 只在這些日子呼叫 `rebalance_signal`，其餘日子只更新市值。
+"""
+from datetime import datetime
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+FREQ_WEEKLY = 'weekly'
+FREQ_MONTHLY = 'monthly'
+FREQ_QUARTERLY = 'quarterly'
+
+
+class TradingCalendar:
+    """
+    交易日曆
+
+    用法：
+        calendar = TradingCalendar(['2024-01-02', '2024-01-03', ...])
+        calendar.period_starts('monthly')       # 每月第一個交易日（bool 遮罩）
+        calendar.month_days_on_or_after(10)     # 每月 10 號（含）之後第一個交易日
+        calendar.on_or_after('2024-06-01', 3)   # 2024-06-01（含）之後的前 3 個交易日位置
+    """
+
+    def __init__(self, dates: list):
+        """
+        Args:
+            dates: 由舊到新排序的日期字串（YYYY-MM-DD 開頭）
+        """
+        self.dates = list(dates)
+        self._keys = np.array([str(d)[:10] for d in self.dates], dtype=str)
+        self._index = {d: i for i, d in enumerate(self.dates)}
+
+    def __len__(self):
+        return len(self.dates)
+
+    # ========== 日期欄位（第一次使用時才解析） ==========
+
+    @cached_property
+    def _parsed(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(pd.to_datetime(self._keys, format='%Y-%m-%d'))
+
+    @cached_property
+    def year(self) -> np.ndarray:
+        return self._parsed.year.to_numpy()
+
+    @cached_property
+    def month(self) -> np.ndarray:
+        return self._parsed.month.to_numpy()
+
+    @cached_property
+    def day(self) -> np.ndarray:
+        return self._parsed.day.to_numpy()
+
+    @cached_property
+    def weekday(self) -> np.ndarray:
+        """星期（週一 = 0）"""
+        return self._parsed.weekday.to_numpy()
+
+    def period_key(self, freq: str) -> np.ndarray:
+        """
+        各交易日所屬週期的整數代碼
+
+        Args:
+            freq: weekly（ISO 週）、monthly、quarterly
+        """
+        if freq == FREQ_WEEKLY:
+            iso = self._parsed.isocalendar()
+            return iso['year'].to_numpy().astype(np.int64) * 100 + iso['week'].to_numpy()
+        if freq == FREQ_QUARTERLY:
+            return self.year * 10 + (self.month - 1) // 3
+        if freq == FREQ_MONTHLY:
+            return self.year * 100 + self.month
+        raise ValueError(f"不支援的週期: {freq}")
+
+    # ========== 查詢 ==========
+
+    def index(self, date) -> int:
+        """日期在時間軸上的位置（不是交易日時丟出 KeyError）"""
+        return self._index[date]
+
+    def to_datetime(self, day: int) -> datetime:
+        """第 day 個交易日的 datetime"""
+        return self._parsed[day].to_pydatetime()
+
+    def on_or_after(self, date, n: int = 1) -> np.ndarray:
+        """
+        某日（含）之後的前 n 個交易日位置
+
+        Args:
+            date: 日期字串（YYYY-MM-DD）
+            n: 個數
+        """
+        start = int(np.searchsorted(self._keys, str(date)[:10], side='left'))
+        return np.arange(start, min(start + n, len(self.dates)))
+
+    # ========== 事件遮罩 ==========
+
+    def mask(self, days=()) -> np.ndarray:
+        """把交易日位置轉成 bool 遮罩"""
+        result = np.zeros(len(self.dates), dtype=bool)
+        result[np.asarray(days, dtype=np.int64)] = True
+        return result
+
+    def first_day(self) -> np.ndarray:
+        """時間軸第一天"""
+        return self.mask([0] if len(self.dates) else [])
+
+    def period_starts(self, freq: str) -> np.ndarray:
+        """每週 / 每月 / 每季的第一個交易日"""
+        key = self.period_key(freq)
+        starts = np.ones(len(key), dtype=bool)
+        starts[1:] = key[1:] != key[:-1]
+        return starts
+
+    def weekdays(self, weekday: int) -> np.ndarray:
+        """星期幾（週一 = 0）的交易日"""
+        return self.weekday == weekday
+
+    def month_days_on_or_after(self, day: int, nth: int = 1) -> np.ndarray:
+        """
+        每月在 day 號（含）之後的第 nth 個交易日（該月沒有的話就沒有）
+
+        Args:
+            day: 每月的日期（1-31）
+            nth: 第幾個交易日
+        """
+        days = np.flatnonzero(self.day >= day)
+        key = self.period_key(FREQ_MONTHLY)[days]
+        position = np.arange(len(days))
+        new_month = np.ones(len(days), dtype=bool)
+        new_month[1:] = key[1:] != key[:-1]
+        # 每個交易日在該月符合條件的交易日中排第幾（0 起算）
+        rank = position - np.maximum.accumulate(np.where(new_month, position, 0))
+        return self.mask(days[rank == nth - 1])
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+滾動前進（Walk-Forward）優化
+
+把歷史切成多段「訓練 → 測試」視窗：每段用訓練視窗做參數優化，選出的參數只在緊接著的
+測試視窗回測，最後把各段測試期的權益曲線串起來，得到樣本外績效。
+每段測試期的最後一根 K 棒強制平倉（扣賣出成本），樣本外的交易統計都來自完整的一買一賣。
+
+所有參數組合需要的指標欄位只在完整歷史上算一次，各視窗直接切片使用（不會每段重算均線，
+測試視窗開頭的均線也不會因為資料被切斷而變成缺值）。
+"""
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool, cpu_count
+
+from .engine import BacktestEngine
+from .features import ensure_features, strategy_features
+from .metrics import calculate_metrics
+from .optimizer import MASweep, _evaluate_combos, _share_frame, _init_worker, _worker
+from .search import default_constraint
+
+
+def walk_forward_windows(n_bars: int, train_bars: int, test_bars: int,
+                         anchored: bool = False) -> list:
+    """
+    切出訓練 / 測試視窗
+
+    Args:
+        n_bars: 總 K 棒數
+        train_bars: 訓練視窗長度（anchored=True 時為第一段的長度）
+        test_bars: 測試視窗長度（也是每段往前移動的距離）
+        anchored: True 時訓練視窗固定從第一根開始（擴張視窗），False 為固定長度滾動
+
+    Returns:
+        list: [(train_start, train_end, test_start, test_end), ...]（左閉右開）
+    """
+    if train_bars <= 0 or test_bars <= 0:
+        raise ValueError("train_bars 與 test_bars 必須大於 0")
+
+    windows = []
+    test_start = train_bars
+    while test_start < n_bars:
+        test_end = min(test_start + test_bars, n_bars)
+        if test_end - test_start < 2:
+            # 少於 2 根無法計算報酬
+            break
+        train_start = 0 if anchored else test_start - train_bars
+        windows.append((train_start, test_start, test_start, test_end))
+        test_start = test_end
+    return windows
+
+
+def _select_best(outcomes: list, metric: str, min_trades: int):
+    """
+    從一段訓練視窗的結果中選出最佳參數
+
+    交易次數達 min_trades 的組合優先；目標指標取最大（max_drawdown 為負值，越接近 0 越好），
+    同分時取網格中較前面的組合。
+    """
+    valid = [(params, metrics) for params, metrics, _ in outcomes if metrics is not None]
+    if not valid:
+        return None, None
+    qualified = [item for item in valid if item[1].get('trade_count', 0) >= min_trades]
+    candidates = qualified or valid
+    best_params, best_metrics = candidates[0]
+    for params, metrics in candidates[1:]:
+        if metrics.get(metric, 0) > best_metrics.get(metric, 0):
+            best_params, best_metrics = params, metrics
+    return best_params, best_metrics
+
+
+def _run_test_window(engine: BacktestEngine, df: pd.DataFrame, strategy) -> dict:
+    """
+    測試視窗回測：最後一根 K 棒強制平倉
+
+    賣出照常扣手續費、證交稅與滑價並留下 SELL 交易，每段的交易都是完整的一買一賣；
+    權益曲線最後一根是賣出後的現金，下一段從這筆現金開始。
+    """
+    df = engine._prepare(df, strategy.required_features())
+    signals = pd.Series(np.asarray(strategy.generate_signals(df), dtype=float), index=df.index)
+    signals.iloc[-1] = -1
+    return engine._run_signals(df, strategy, signals, 1.0, False)
+
+
+def _worker_fold(task) -> list:
+    start, stop, combos = task
+    df = _worker['df'].iloc[start:stop]
+    sweep = MASweep.for_strategy(df, _worker['engine'], _worker['strategy_class'])
+    return _evaluate_combos(_worker['engine'], df, _worker['strategy_class'],
+                            _worker['param_names'], combos, sweep)
+
+
+class WalkForward:
+    """
+    滾動前進優化
+
+    用法：
+        wf = WalkForward(MACrossStrategy,
+                         {'short_period': [5, 10, 20], 'long_period': [20, 60, 120]},
+                         train_bars=500, test_bars=120)
+        result = wf.run(df)
+        result['folds']          # 各段選出的參數與訓練/測試績效
+        result['equity_curve']   # 串接的樣本外權益曲線
+        result['metrics']        # 樣本外績效
+    """
+
+    def __init__(self, strategy_class, param_grid: dict,
+                 train_bars: int = 500,
+                 test_bars: int = 120,
+                 anchored: bool = False,
+                 metric: str = 'sharpe_ratio',
+                 min_trades: int = 3,
+                 initial_capital: float = 1_000_000,
+                 engine: BacktestEngine = None,
+                 num_workers: int = 1):
+        """
+        Args:
+            strategy_class: 策略類別
+            param_grid: 參數網格（同 grid_search；short_period >= long_period 的組合會略過）
+            train_bars: 訓練視窗 K 棒數
+            test_bars: 測試視窗 K 棒數
+            anchored: 訓練視窗是否固定從頭開始
+            metric: 優化目標指標
+            min_trades: 訓練期最低交易次數
+            initial_capital: 初始資金
+            engine: 回測引擎（預設向量化模式）
+            num_workers: 各段訓練平行執行的行程數（1 為單行程，0 為 CPU 核心數）
+        """
+        self.strategy_class = strategy_class
+        self.param_grid = param_grid
+        self.train_bars = train_bars
+        self.test_bars = test_bars
+        self.anchored = anchored
+        self.metric = metric
+        self.min_trades = min_trades
+        self.engine = engine or BacktestEngine(initial_capital=initial_capital, mode='vectorized')
+        self.num_workers = num_workers
+
+    def _combinations(self) -> tuple:
+        param_names = list(self.param_grid.keys())
+        combos = [combo for combo in product(*self.param_grid.values())
+                  if default_constraint(dict(zip(param_names, combo)))]
+        return param_names, combos
+
+    def _optimize_folds(self, df: pd.DataFrame, windows: list, param_names: list,
+                        combos: list, verbose: bool) -> list:
+        """各段訓練視窗的全部組合結果（順序同 windows）"""
+        tasks = [(train_start, train_end, combos) for train_start, train_end, _, _ in windows]
+        num_workers = self.num_workers
+        if num_workers is None or num_workers <= 0:
+            num_workers = cpu_count()
+        num_workers = min(num_workers, len(tasks))
+
+        fold_outcomes = []
+        if num_workers <= 1:
+            for k, (start, stop, chunk) in enumerate(tasks, 1):
+                train = df.iloc[start:stop]
+                sweep = MASweep.for_strategy(train, self.engine, self.strategy_class)
+                fold_outcomes.append(_evaluate_combos(self.engine, train, self.strategy_class,
+                                                      param_names, chunk, sweep))
+                if verbose:
+                    print(f"   訓練進度: {k}/{len(tasks)}")
+            return fold_outcomes
+
+        shm, spec = _share_frame(df)
+        try:
+            with Pool(processes=num_workers, initializer=_init_worker,
+                      initargs=(spec, self.engine, self.strategy_class, param_names)) as pool:
+                for k, outcomes in enumerate(pool.imap(_worker_fold, tasks), 1):
+                    fold_outcomes.append(outcomes)
+                    if verbose:
+                        print(f"   訓練進度: {k}/{len(tasks)}")
+        finally:
+            shm.close()
+            shm.unlink()
+        return fold_outcomes
+
+    def run(self, df: pd.DataFrame, verbose: bool = True) -> dict:
+        """
+        執行滾動前進優化
+
+        Args:
+            df: 股價 DataFrame
+            verbose: 是否印出進度
+
+        Returns:
+            dict: {
+                'folds': 各段結果 DataFrame,
+                'equity_curve': 樣本外權益曲線（各段報酬串接，有 date 欄位時以日期為索引）,
+                'metrics': 樣本外績效指標,
+                'trades': 樣本外交易明細（list of dict）
+            }
+        """
+        df = df.copy()
+        df.columns = [c.lower() for c in df.columns]
+        df = df.reset_index(drop=True)
+
+        param_names, combos = self._combinations()
+        if not combos:
+            raise ValueError("參數網格沒有有效組合")
+
+        windows = walk_forward_windows(len(df), self.train_bars, self.test_bars, self.anchored)
+        if not windows:
+            raise ValueError(f"資料長度 {len(df)} 不足以切出訓練 {self.train_bars} + 測試視窗")
+
+        # 所有組合需要的指標只在完整歷史上算一次，各視窗直接切片
+        try:
+            specs = strategy_features(self.strategy_class(**dict(zip(param_names, combo)))
+                                      for combo in combos)
+        except Exception:
+            specs = []
+        ensure_features(df, specs)
+
+        if verbose:
+            mode = '擴張' if self.anchored else '滾動'
+            print(f"🔁 滾動前進優化: {len(windows)} 段（{mode}視窗），每段 {len(combos)} 種組合")
+
+        fold_outcomes = self._optimize_folds(df, windows, param_names, combos, verbose)
+
+        dates = df['date'] if 'date' in df.columns else pd.Series(df.index)
+        initial_capital = self.engine.initial_capital
+        capital = initial_capital
+        segments = []
+        trades = []
+        folds = []
+
+        for k, ((train_start, train_end, test_start, test_end), outcomes) in enumerate(
+                zip(windows, fold_outcomes), 1):
+            params, train_metrics = _select_best(outcomes, self.metric, self.min_trades)
+            record = {
+                'fold': k,
+                'train_start': str(dates.iloc[train_start])[:10],
+                'train_end': str(dates.iloc[train_end - 1])[:10],
+                'test_start': str(dates.iloc[test_start])[:10],
+                'test_end': str(dates.iloc[test_end - 1])[:10],
+            }
+            if params is None:
+                # 整段訓練都失敗：測試期空手
+                equity = np.full(test_end - test_start, float(initial_capital))
+                record.update({name: None for name in param_names})
+                record.update({f'train_{self.metric}': None, f'test_{self.metric}': 0,
+                               'test_return': 0.0, 'test_trades': 0})
+            else:
+                result = _run_test_window(self.engine, df.iloc[test_start:test_end],
+                                          self.strategy_class(**params))
+                equity = result['equity_curve'].to_numpy(dtype=float)
+                test_metrics = result['metrics']
+                trades.extend(result['trades'])
+                record.update(params)
+                record.update({
+                    f'train_{self.metric}': train_metrics.get(self.metric),
+                    f'test_{self.metric}': test_metrics.get(self.metric),
+                    'test_return': test_metrics['total_return'],
+                    'test_trades': test_metrics['trade_count'],
+                })
+
+            # 每段從初始資金開始回測，依前一段結束時的資金比例縮放後串接
+            segments.append(equity / initial_capital * capital)
+            capital = segments[-1][-1]
+            folds.append(record)
+
+        test_index = np.concatenate([np.arange(start, stop) for _, _, start, stop in windows])
+        if 'date' in df.columns:
+            index = pd.DatetimeIndex(pd.to_datetime(dates.iloc[test_index]), name='date')
+        else:
+            index = df.index[test_index]
+        equity_curve = pd.Series(np.concatenate(segments), index=index)
+        metrics = calculate_metrics(trades, equity_curve, initial_capital)
+        metrics['strategy'] = f"{self.strategy_class.__name__} 滾動前進"
+        metrics['folds'] = len(windows)
+
+        if verbose:
+            print(f"✅ 樣本外報酬 {metrics['total_return']:.2%} | 夏普 {metrics['sharpe_ratio']:.2f} | "
+                  f"最大回撤 {metrics['max_drawdown']:.2%}")
+
+        return {
+            'folds': pd.DataFrame(folds),
+            'equity_curve': equity_curve,
+            'metrics': metrics,
+            'trades': trades,
+        }
@@ -4,36 +4,245 @@
 整合股價、法人、融資融券資料
 """
 import os
+import csv
 import json
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 from glob import glob
 from tqdm import tqdm
 
+import data_store
+
 # ========== 路徑設定 ==========
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STOCK_DIR = os.path.join(BASE_DIR, "data", "tw-share", "dayK")
 INSTITUTIONAL_DIR = os.path.join(BASE_DIR, "data", "institutional")
 MARGIN_DIR = os.path.join(BASE_DIR, "data", "margin")
 
+# 載入快取上限（MB），可用環境變數 TWQ_CACHE_MB 調整
+CACHE_MAX_BYTES = int(os.environ.get("TWQ_CACHE_MB", "256")) * 1024 * 1024
+
+
+def get_catalog_entry(ticker: str) -> dict:
+    """從欄式儲存的目錄索引取得股票摘要（名稱、市場別、筆數、日期範圍、均量、來源檔），沒有則回傳 None"""
+    return data_store.load_catalog().get(ticker)
+
 
 def find_stock_file(ticker: str) -> str:
-    """根據股票代碼找到對應的 CSV 檔案"""
-    # 嘗試直接匹配
-    pattern = os.path.join(STOCK_DIR, f"{ticker}_*.csv")
-    matches = glob(pattern)
-    if matches:
-        return matches[0]
-    
-    # 嘗試不同格式
-    pattern = os.path.join(STOCK_DIR, f"*{ticker}*.csv")
-    matches = glob(pattern)
-    if matches:
-        return matches[0]
+    """
+    根據股票代碼找到對應的 CSV 檔案
+    
+    先查目錄索引；索引沒有的（尚未轉入欄式儲存）才用檔名比對。
+    沒有市場別的代碼（如 2330）依序嘗試 .TW、.TWO
+    """
+    candidates = [ticker] if '.' in ticker else [f"{ticker}.TW", f"{ticker}.TWO"]
+    
+    for tkr in candidates:
+        entry = get_catalog_entry(tkr)
+        if entry and entry.get('source'):
+            path = os.path.join(STOCK_DIR, entry['source'])
+            if os.path.exists(path):
+                return path
+    
+    for tkr in candidates:
+        matches = glob(os.path.join(STOCK_DIR, f"{tkr}_*.csv"))
+        if matches:
+            return sorted(matches)[0]
     
     return None
 
 
+def is_catalog_fresh(entry: dict, csv_path: str) -> bool:
+    """索引摘要是否對應目前的 CSV（CSV 沒有在寫入後被改動）"""
+    source_mtime = entry.get('source_mtime') if entry else None
+    if source_mtime is None:
+        return False
+    try:
+        return os.path.getmtime(csv_path) <= source_mtime
+    except OSError:
+        return False
+
+
+def prefilter_stock_files(csv_paths: list, min_volume: float = 0,
+                          min_rows: int = 0) -> list:
+    """
+    用目錄索引的均量與筆數預先排除不合格的股票，不必打開檔案
+    
+    索引沒有或已過期的檔案一律保留，交給呼叫端讀檔後再判斷
+    
+    Args:
+        csv_paths: dayK CSV 路徑清單
+        min_volume: 最低平均成交量
+        min_rows: 最少資料筆數
+    
+    Returns:
+        list: 保留的路徑（維持原順序）
+    """
+    catalog = data_store.load_catalog()
+    kept = []
+    for path in csv_paths:
+        entry = catalog.get(parse_stock_filename(path)[0])
+        if entry and is_catalog_fresh(entry, path):
+            avg_volume = entry.get('avg_volume')
+            if avg_volume is not None and avg_volume < min_volume:
+                continue
+            if entry.get('rows', 0) < min_rows:
+                continue
+        kept.append(path)
+    return kept
+
+
+def parse_stock_filename(path: str) -> tuple:
+    """從 CSV 檔名拆出 (ticker, name)，檔名格式為 {ticker}_{name}.csv"""
+    basename = os.path.basename(path).replace('.csv', '')
+    ticker, _, name = basename.partition('_')
+    return ticker, name
+
+
+def read_stock_file(csv_path: str, columns: list = None, start: int = 0) -> pd.DataFrame:
+    """
+    讀取單檔股價（欄式儲存較新時直接讀取，否則退回解析 CSV）
+    
+    Args:
+        csv_path: dayK CSV 路徑
+        columns: 只讀取指定欄位（None = 全部），date 欄一定會附上
+        start: 從第幾列開始讀（index 仍是整份資料的列號）；讀欄式儲存時前面的列不會載入
+    
+    Returns:
+        DataFrame: 與 data_store.read_stock 相同的格式（欄位小寫、date 為 datetime64、
+                   只有數值欄位、依日期排序；有指定 columns 時依指定順序）
+    """
+    ticker, _ = parse_stock_filename(csv_path)
+    meta = data_store.read_meta(ticker)
+    
+    if meta is not None and data_store.is_fresh(ticker, csv_path, meta):
+        try:
+            return data_store.read_stock(ticker, columns, meta, start=start)
+        except (KeyError, ValueError, OSError):
+            pass  # 儲存檔損毀時退回 CSV
+    
+    usecols = None
+    if columns is not None:
+        wanted = {c.lower() for c in columns} | {'date'}
+        usecols = lambda c: c.lower() in wanted
+    
+    # 和寫入欄式儲存時同樣整理，兩條路徑讀到的欄位與型別才會一致
+    df = data_store.normalize_frame(pd.read_csv(csv_path, usecols=usecols))
+    if columns is not None:
+        columns = [c.lower() for c in columns]
+        if 'date' in df.columns and 'date' not in columns:
+            columns = ['date'] + columns
+        df = df[[c for c in dict.fromkeys(columns) if c in df.columns]]
+    return df.iloc[start:] if start else df
+
+
+def load_stock_data(ticker: str, columns: list = None) -> pd.DataFrame:
+    """
+    依股票代碼載入股價
+    
+    Args:
+        ticker: 股票代碼（如 2330.TW）
+        columns: 只讀取指定欄位（None = 全部）
+    
+    Returns:
+        DataFrame: 欄位小寫、date 為 datetime64
+    """
+    csv_path = find_stock_file(ticker)
+    if csv_path:
+        return read_stock_file(csv_path, columns)
+    
+    # 只有欄式儲存、沒有 CSV
+    df = data_store.read_stock(ticker, columns)
+    if df is None:
+        raise FileNotFoundError(f"找不到股票 {ticker} 的資料檔案")
+    return df
+
+
+def save_stock_file(csv_path: str, df: pd.DataFrame, name: str = None):
+    """
+    寫回單檔股價：同時更新 CSV 與欄式儲存
+    
+    Args:
+        csv_path: dayK CSV 路徑
+        df: 股價 DataFrame
+        name: 股票名稱（省略則取自檔名）
+    """
+    ticker, file_name = parse_stock_filename(csv_path)
+    df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+    data_store.write_stock(ticker, df, name=name or file_name,
+                           source=os.path.basename(csv_path))
+
+
+def _csv_header(csv_path: str) -> list:
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def _truncate_last_lines(csv_path: str, n_lines: int) -> bool:
+    """刪除檔案最後 n_lines 行（檔案需以換行結尾），成功回傳 True"""
+    with open(csv_path, 'r+b') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        if pos == 0:
+            return False
+        f.seek(pos - 1)
+        if f.read(1) != b'\n':
+            return False
+        
+        # 從尾端往前找第 n_lines + 1 個換行，截斷在它之後
+        found = 0
+        while pos > 0:
+            step = min(65536, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            idx = len(chunk)
+            while True:
+                idx = chunk.rfind(b'\n', 0, idx)
+                if idx < 0:
+                    break
+                found += 1
+                if found == n_lines + 1:
+                    f.truncate(pos + idx + 1)
+                    return True
+    return False
+
+
+def save_stock_tail(csv_path: str, df: pd.DataFrame, n_tail: int, name: str = None):
+    """
+    只改寫最後 n_tail 列（前面的列不動，省去整份重寫）：CSV 截斷尾端後附加，欄式儲存只改寫各欄尾端
+    
+    CSV 欄位與 df 不一致、或檔案列數不足時退回 save_stock_file 整份寫入
+    （df 只有尾段時，前面的列由 read_stock_file 補齊）
+    
+    Args:
+        csv_path: dayK CSV 路徑（列數需與整份資料相同）
+        df: 股價 DataFrame；可以只含尾段，index 為整份資料的列號（read_stock_file 的 start）
+        n_tail: 要改寫的尾端列數
+        name: 股票名稱（省略則取自檔名）
+    """
+    ticker, file_name = parse_stock_filename(csv_path)
+    start = len(df) - n_tail + (int(df.index[0]) if len(df) else 0)
+    if (n_tail <= 0 or start <= 0 or not os.path.exists(csv_path)
+            or _csv_header(csv_path) != list(df.columns)
+            or not _truncate_last_lines(csv_path, n_tail)):
+        if len(df) and df.index[0] > 0:
+            head = read_stock_file(csv_path).iloc[:int(df.index[0])]
+            df = pd.concat([head, df])
+        return save_stock_file(csv_path, df.reset_index(drop=True), name)
+    
+    df.tail(n_tail).to_csv(csv_path, mode='a', header=False, index=False, encoding='utf-8')
+    try:
+        data_store.write_stock_tail(ticker, df.tail(n_tail), start, name=name or file_name,
+                                    source=os.path.basename(csv_path))
+    except ValueError:
+        # 儲存的欄位與 CSV 對不上：CSV 已是完整的新內容，直接整份轉入
+        data_store.write_stock(ticker, pd.read_csv(csv_path), name=name or file_name,
+                               source=os.path.basename(csv_path))
+
+
 def load_institutional_data() -> dict:
     """
     載入所有法人歷史資料
@@ -55,6 +264,63 @@ def load_institutional_data() -> dict:
     return all_data
 
 
+def _daily_json_frame(daily_data: dict, ticker: str, fields: list) -> pd.DataFrame:
+    """把 {date_str: {ticker: {...}}} 轉成單一股票的逐日 DataFrame（缺資料補 0）"""
+    rows = []
+    for date_str, day in daily_data.items():
+        stock_data = day.get(ticker, {})
+        rows.append([date_str] + [stock_data.get(k, 0) for k in fields])
+    
+    df = pd.DataFrame(rows, columns=['date'] + fields)
+    df['date'] = pd.to_datetime(df['date'], format='%Y%m%d').astype('datetime64[ns]')
+    return df.sort_values('date', ignore_index=True)
+
+
+def load_institutional_source() -> tuple:
+    """
+    開啟法人資料：cube 涵蓋所有每日 JSON 時只開 cube，過期（或不存在）時才讀逐日 JSON
+    
+    Returns:
+        tuple: (cube, inst_data, dates)
+            cube: data_store.load_institutional_cube() 的結果
+            inst_data: cube 過期時的 load_institutional_data() 結果，cube 最新時為 None
+            dates: 有資料的日期（YYYYMMDD，已排序）
+    """
+    cube = data_store.load_institutional_cube(INSTITUTIONAL_DIR)
+    if data_store.institutional_cube_is_fresh(cube[0], INSTITUTIONAL_DIR):
+        return cube, None, sorted(cube[0])
+    inst_data = load_institutional_data()
+    return cube, inst_data, sorted(inst_data)
+
+
+def load_institutional_frame(ticker: str, cube: tuple = None,
+                             inst_data: dict = None) -> pd.DataFrame:
+    """
+    載入單一股票的法人買賣超
+    
+    優先從法人 cube 切出該股票的區段；cube 不存在或過期時退回逐日 JSON
+    
+    Args:
+        ticker: 股票代碼
+        cube: 已載入的 data_store.load_institutional_cube() 結果
+        inst_data: 已載入的 load_institutional_data() 結果（退回 JSON 時使用，避免重讀）
+    
+    Returns:
+        DataFrame: date, foreign, trust, dealer, total（每個有資料的交易日一列）
+    """
+    if cube is None:
+        cube = data_store.load_institutional_cube(INSTITUTIONAL_DIR)
+    dates = cube[0]
+    
+    if data_store.institutional_cube_is_fresh(dates, INSTITUTIONAL_DIR):
+        return data_store.read_institutional(ticker, cube=cube)
+    
+    # 退回逐日 JSON
+    if inst_data is None:
+        inst_data = load_institutional_data()
+    return _daily_json_frame(inst_data, ticker, data_store.INSTITUTIONAL_FIELDS)
+
+
 def load_margin_data() -> dict:
     """
     載入所有融資融券歷史資料
@@ -76,48 +342,119 @@ def load_margin_data() -> dict:
     return all_data
 
 
+def load_margin_frame(ticker: str, margin_data: dict = None) -> pd.DataFrame:
+    """
+    載入單一股票的融資融券餘額與增減
+    
+    增減以「前一個融資融券資料日」為基準（第一天以 0 為基準）
+    
+    Args:
+        ticker: 股票代碼
+        margin_data: 已載入的 load_margin_data() 結果
+    
+    Returns:
+        DataFrame: date, margin_balance, short_balance, margin_change, short_change
+    """
+    if margin_data is None:
+        margin_data = load_margin_data()
+    return _daily_json_frame(margin_data, ticker, ['margin_balance', 'short_balance'])
+
+
+def _align_by_date(df: pd.DataFrame, frame: pd.DataFrame) -> tuple:
+    """
+    將逐日資料以日期 left-join 到股價
+    
+    Returns:
+        tuple: (對齊後的 DataFrame（缺日補 0）, 該日是否有資料的布林陣列)
+    """
+    keys = pd.to_datetime(df['date']).dt.normalize().astype('datetime64[ns]').values
+    flow = frame.set_index('date')
+    flow = flow[~flow.index.duplicated(keep='last')]
+    matched = pd.Index(keys).isin(flow.index)
+    aligned = flow.reindex(keys, fill_value=0)
+    aligned.index = df.index
+    return aligned, matched
+
+
+def merge_institutional(df: pd.DataFrame, ticker: str,
+                        inst_frame: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    合併法人買賣超到股價資料（以日期 left-join，沒有資料的日期補 0）
+    
+    Args:
+        df: 股價資料（需有 date 欄）
+        ticker: 股票代碼
+        inst_frame: 已載入的 load_institutional_frame() 結果
+    
+    Returns:
+        DataFrame: 加上 foreign, trust, dealer, inst_total 欄位的新 DataFrame
+    """
+    if inst_frame is None:
+        inst_frame = load_institutional_frame(ticker)
+    
+    aligned, _ = _align_by_date(df, inst_frame)
+    
+    df = df.copy()
+    df['foreign'] = aligned['foreign']
+    df['trust'] = aligned['trust']
+    df['dealer'] = aligned['dealer']
+    df['inst_total'] = aligned['total']
+    return df
+
+
+def merge_margin(df: pd.DataFrame, ticker: str,
+                 margin_frame: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    合併融資融券到股價資料（以日期 left-join，沒有資料的日期補 0）
+    
+    margin_change / short_change 為與上一個「有融資融券資料的交易日」的差額
+    
+    Args:
+        df: 股價資料（需有 date 欄）
+        ticker: 股票代碼
+        margin_frame: 已載入的 load_margin_frame() 結果
+    
+    Returns:
+        DataFrame: 加上 margin_balance, short_balance, margin_change, short_change 欄位的新 DataFrame
+    """
+    if margin_frame is None:
+        margin_frame = load_margin_frame(ticker)
+    
+    aligned, matched = _align_by_date(df, margin_frame)
+    
+    df = df.copy()
+    df['margin_balance'] = aligned['margin_balance']
+    df['short_balance'] = aligned['short_balance']
+    
+    # 只在有資料的日期間做差分，其餘日期增減為 0
+    for col in ['margin', 'short']:
+        balance = aligned[f'{col}_balance'][matched]
+        change = pd.Series(0, index=df.index, dtype=balance.dtype)
+        change[matched] = balance.diff().fillna(balance).astype(balance.dtype)
+        df[f'{col}_change'] = change
+    
+    return df
+
+
 def load_stock_with_institutional(ticker: str, 
-                                   include_margin: bool = False) -> pd.DataFrame:
+                                   include_margin: bool = False,
+                                   columns: list = None) -> pd.DataFrame:
     """
     載入股票資料並合併法人資料
     
     Args:
         ticker: 股票代碼（如 2330.TW）
         include_margin: 是否包含融資融券資料
+        columns: 只讀取指定的股價欄位（None = 全部）
     
     Returns:
         DataFrame: 包含 OHLCV + 技術指標 + 法人資料
     """
     # 載入股價資料
-    csv_path = find_stock_file(ticker)
-    if not csv_path:
-        raise FileNotFoundError(f"找不到股票 {ticker} 的資料檔案")
-    
-    df = pd.read_csv(csv_path)
-    df.columns = [c.lower() for c in df.columns]
-    
-    # 處理日期
-    df['date'] = pd.to_datetime(df['date']).dt.tz_localize(None)
-    df['date_str'] = df['date'].dt.strftime('%Y%m%d')
-    
-    # 載入法人資料
-    inst_data = load_institutional_data()
-    
-    # 初始化法人欄位
-    df['foreign'] = 0
-    df['trust'] = 0
-    df['dealer'] = 0
-    df['inst_total'] = 0
+    df = load_stock_data(ticker, columns)
     
     # 合併法人資料
-    for i, row in df.iterrows():
-        date_str = row['date_str']
-        if date_str in inst_data:
-            stock_data = inst_data[date_str].get(ticker, {})
-            df.at[i, 'foreign'] = stock_data.get('foreign', 0)
-            df.at[i, 'trust'] = stock_data.get('trust', 0)
-            df.at[i, 'dealer'] = stock_data.get('dealer', 0)
-            df.at[i, 'inst_total'] = stock_data.get('total', 0)
+    df = merge_institutional(df, ticker)
     
     # 計算法人累計
     df['foreign_5d'] = df['foreign'].rolling(5).sum()
@@ -126,35 +463,242 @@ def load_stock_with_institutional(ticker: str,
     
     # 融資融券資料（可選）
     if include_margin:
-        margin_data = load_margin_data()
+        df = merge_margin(df, ticker)
+    
+    return df
+
+
+# ========== 載入快取 ==========
+
+_cache = OrderedDict()   # key -> (signature, df, nbytes)
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def _file_signature(path: str) -> tuple:
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _source_signature(ticker: str, include_institutional: bool,
+                      include_margin: bool) -> tuple:
+    """
+    資料來源的 (路徑, mtime, size)，任何一個變動都代表快取失效
+    
+    股價看 CSV 與欄式儲存的 meta.json；法人/融資融券看資料目錄（新增每日 JSON 會改變目錄 mtime）
+    """
+    sig = [_file_signature(find_stock_file(ticker)),
+           _file_signature(data_store.meta_path(ticker))]
+    if include_institutional:
+        sig.append(_file_signature(INSTITUTIONAL_DIR))
+        sig.append(_file_signature(data_store.institutional_cube_file(INSTITUTIONAL_DIR)))
+    if include_margin:
+        sig.append(_file_signature(MARGIN_DIR))
+    return tuple(sig)
+
+
+def load_stock_cached(ticker: str, columns: list = None,
+                      include_institutional: bool = False,
+                      include_margin: bool = False) -> pd.DataFrame:
+    """
+    載入股價（含選用的法人/融資融券），結果放在行程內的 LRU 快取
+    
+    - 來源檔案的 mtime/size 變動（下載或重算指標後）會自動重新載入
+    - 快取總大小超過 CACHE_MAX_BYTES 時淘汰最久未使用的資料
+    - 回傳的是複本，呼叫端可以自由修改
+    - df.attrs['ticker'] 記錄股票代碼（供指標快取辨識）
+    
+    Args:
+        ticker: 股票代碼（如 2330.TW）
+        columns: 只讀取指定的股價欄位（None = 全部）
+        include_institutional: 是否合併法人資料
+        include_margin: 是否合併融資融券資料
+    
+    Returns:
+        DataFrame: 欄位小寫、date 為 datetime64
+    """
+    global _cache_bytes
+    
+    key = (ticker, tuple(columns) if columns is not None else None,
+           include_institutional, include_margin)
+    sig = _source_signature(ticker, include_institutional, include_margin)
+    
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == sig:
+            _cache.move_to_end(key)
+            return entry[1].copy()
+    
+    if include_institutional:
+        df = load_stock_with_institutional(ticker, include_margin, columns)
+    else:
+        df = load_stock_data(ticker, columns)
+        if include_margin:
+            df = merge_margin(df, ticker)
+    df.attrs['ticker'] = ticker
+    
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= old[2]
+        if nbytes <= CACHE_MAX_BYTES:
+            _cache[key] = (sig, df, nbytes)
+            _cache_bytes += nbytes
+            while _cache_bytes > CACHE_MAX_BYTES:
+                _, (_, _, evicted) = _cache.popitem(last=False)
+                _cache_bytes -= evicted
+    
+    return df.copy()
+
+
+def clear_stock_cache():
+    """清空載入快取"""
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+
+def stock_cache_info() -> dict:
+    """快取狀態：筆數與佔用位元組"""
+    with _cache_lock:
+        return {'entries': len(_cache), 'bytes': _cache_bytes,
+                'max_bytes': CACHE_MAX_BYTES}
+
+
+# ========== 股價面板 ==========
+
+PANEL_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class PricePanel:
+    """
+    多檔股票對齊成 (日期 × 股票) 的二維陣列
+    
+    每個欄位（open/high/low/close/volume 及計算出的指標）一個 float64 陣列，
+    股票在該日沒有資料時為 NaN
+    
+    Attributes:
+        dates: datetime64[ns] 日期陣列（遞增）
+        tickers: 股票代碼清單
+        fields: {欄位: ndarray (len(dates), len(tickers))}
+    """
+    
+    def __init__(self, dates: np.ndarray, tickers: list, fields: dict):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.tickers = list(tickers)
+        self.fields = fields
+        self.ticker_index = {t: i for i, t in enumerate(self.tickers)}
+    
+    @property
+    def shape(self) -> tuple:
+        return (len(self.dates), len(self.tickers))
+    
+    @property
+    def valid(self) -> np.ndarray:
+        """該股票在該日是否有資料（以收盤價判斷）"""
+        return ~np.isnan(self.fields['close'])
+    
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self.fields[field]
+    
+    def __setitem__(self, field: str, values: np.ndarray):
+        self.fields[field] = values
+    
+    def __contains__(self, field: str) -> bool:
+        return field in self.fields
+    
+    def column(self, ticker: str, field: str) -> np.ndarray:
+        """單一股票單一欄位的時間序列（含沒有資料的 NaN 日）"""
+        return self.fields[field][:, self.ticker_index[ticker]]
+    
+    def frame(self, ticker: str, fields: list = None) -> pd.DataFrame:
+        """
+        切出單一股票的 DataFrame（只保留有資料的日期），可直接丟給回測引擎
         
-        df['margin_balance'] = 0
-        df['short_balance'] = 0
-        df['margin_change'] = 0
-        df['short_change'] = 0
+        Args:
+            ticker: 股票代碼
+            fields: 要的欄位（None = 全部）
+        """
+        j = self.ticker_index[ticker]
+        rows = ~np.isnan(self.fields['close'][:, j])
+        data = {'date': self.dates[rows]}
+        for name in (fields or self.fields):
+            data[name] = self.fields[name][rows, j]
+        return pd.DataFrame(data)
+    
+    def cross_section(self, date=-1, fields: list = None) -> pd.DataFrame:
+        """
+        某一天全部股票的橫截面
         
-        prev_margin = 0
-        prev_short = 0
+        Args:
+            date: 日期或列索引（預設最後一天）
+            fields: 要的欄位（None = 全部）
         
-        for i, row in df.iterrows():
-            date_str = row['date_str']
-            if date_str in margin_data:
-                stock_data = margin_data[date_str].get(ticker, {})
-                curr_margin = stock_data.get('margin_balance', 0)
-                curr_short = stock_data.get('short_balance', 0)
-                
-                df.at[i, 'margin_balance'] = curr_margin
-                df.at[i, 'short_balance'] = curr_short
-                df.at[i, 'margin_change'] = curr_margin - prev_margin
-                df.at[i, 'short_change'] = curr_short - prev_short
-                
-                prev_margin = curr_margin
-                prev_short = curr_short
-    
-    # 移除暫存欄位
-    df = df.drop(columns=['date_str'])
+        Returns:
+            DataFrame: index 為股票代碼
+        """
+        if isinstance(date, (int, np.integer)):
+            i = date
+        else:
+            i = int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date), 'ns')))
+            if i >= len(self.dates) or self.dates[i] != np.datetime64(pd.Timestamp(date), 'ns'):
+                raise KeyError(f"面板中沒有日期 {date}")
+        data = {name: self.fields[name][i] for name in (fields or self.fields)}
+        return pd.DataFrame(data, index=pd.Index(self.tickers, name='ticker'))
+
+
+def load_price_panel(tickers: list = None, columns: list = None,
+                     start_date: str = None, end_date: str = None) -> PricePanel:
+    """
+    載入多檔股票並以日期聯集對齊成 PricePanel
     
-    return df
+    Args:
+        tickers: 股票代碼清單（None = 全部）
+        columns: 要載入的欄位（預設 open/high/low/close/volume）
+        start_date: 開始日期（含）
+        end_date: 結束日期（含）
+    
+    Returns:
+        PricePanel
+    """
+    if tickers is None:
+        tickers = get_all_tickers()
+    columns = [c for c in (columns or PANEL_COLUMNS) if c != 'date']
+    if 'close' not in columns:
+        columns = ['close'] + columns
+    
+    frames = {}
+    for ticker in tickers:
+        try:
+            df = load_stock_data(ticker, columns)
+        except FileNotFoundError:
+            continue
+        df = df.drop_duplicates(subset=['date'], keep='last').sort_values('date')
+        if start_date:
+            df = df[df['date'] >= pd.Timestamp(start_date)]
+        if end_date:
+            df = df[df['date'] <= pd.Timestamp(end_date)]
+        frames[ticker] = df
+    
+    all_dates = [df['date'].values.astype('datetime64[ns]') for df in frames.values()]
+    dates = np.unique(np.concatenate(all_dates)) if all_dates else np.array([], dtype='datetime64[ns]')
+    
+    names = list(frames)
+    fields = {c: np.full((len(dates), len(names)), np.nan) for c in columns}
+    for j, ticker in enumerate(names):
+        df = frames[ticker]
+        rows = np.searchsorted(dates, df['date'].values.astype('datetime64[ns]'))
+        for c in columns:
+            if c in df.columns:
+                fields[c][rows, j] = df[c].values
+    
+    return PricePanel(dates, names, fields)
 
 
 def get_all_tickers() -> list:
@@ -0,0 +1,596 @@
+# -*- coding: utf-8 -*-
+"""
+欄式股價儲存模組
+每檔股票的日K 依欄位存成獨立的二進位檔，搭配目錄索引 (catalog)，
+讀取時只載入需要的欄位，不必再解析整份 CSV 文字
+
+檔案佈局:
+    data/tw-share/store/
+        catalog.json            全部股票的摘要索引 {ticker: {name, suffix, rows, 日期範圍, avg_volume, source}}
+        2330.TW/
+            meta.json           欄位型別、筆數、來源 CSV
+            indicators.json     增量計算技術指標用的狀態（EMA 末值、視窗尾段、OBV 累計）
+            date.bin            日期 (datetime64[ns])
+            close.bin ...       每欄一個原始二進位檔，可直接 np.memmap
+
+    data/institutional/cube/
+        index.json              {dates: [YYYYMMDD...], tickers: [...], skipped: [無法讀取的 JSON 日期]}
+        values.npy              int64 陣列 (tickers × dates × 4)，依股票連續存放
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+import filelock
+
+# ========== 路徑設定 ==========
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(BASE_DIR, "data", "tw-share", "store")
+CATALOG_FILE = os.path.join(STORE_DIR, "catalog.json")
+CATALOG_LOCK = os.path.join(STORE_DIR, "catalog.lock")
+
+META_FILE = "meta.json"
+INDICATOR_STATE_FILE = "indicators.json"
+
+INSTITUTIONAL_DIR = os.path.join(BASE_DIR, "data", "institutional")
+INSTITUTIONAL_FIELDS = ['foreign', 'trust', 'dealer', 'total']
+
+
+# ========== 格式轉換 ==========
+
+def to_naive_datetime(values) -> pd.Series:
+    """把日期欄轉成不含時區的 datetime64（保留台北當地日期）"""
+    dates = pd.to_datetime(pd.Series(values))
+    if getattr(dates.dt, 'tz', None) is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.astype('datetime64[ns]')
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    整理成儲存格式：欄位小寫、日期轉 datetime64、只保留數值欄位、依日期排序
+
+    Returns:
+        DataFrame: 可直接寫入欄式儲存的資料
+    """
+    df = df.copy()
+    df.columns = [c.lower() for c in df.columns]
+
+    if 'date' in df.columns:
+        df['date'] = to_naive_datetime(df['date']).values
+
+    keep = []
+    for col in df.columns:
+        if col == 'date' or pd.api.types.is_numeric_dtype(df[col]):
+            keep.append(col)
+    df = df[keep]
+
+    # 布林/整數以外的數值一律存成 float64，方便之後補 NaN
+    for col in keep:
+        if col == 'date':
+            continue
+        if not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype('float64')
+
+    if 'date' in df.columns:
+        df = df.sort_values('date')
+    return df.reset_index(drop=True)
+
+
+# ========== 目錄索引 ==========
+
+def _ticker_dir(ticker: str) -> str:
+    return os.path.join(STORE_DIR, ticker)
+
+
+def _write_json_atomic(path: str, data: dict):
+    """先寫暫存檔再取代，避免讀者讀到寫一半的 JSON"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+_catalog_memo = {'sig': None, 'catalog': {}}
+
+
+def _read_catalog_file() -> dict:
+    if not os.path.exists(CATALOG_FILE):
+        return {}
+    try:
+        with open(CATALOG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_catalog() -> dict:
+    """
+    讀取目錄索引（檔案沒變動時沿用上次解析的結果，回傳值請勿修改）
+
+    Returns:
+        dict: {ticker: {name, suffix, rows, first_date, last_date, avg_volume,
+                        source, source_mtime}}
+    """
+    try:
+        st = os.stat(CATALOG_FILE)
+    except OSError:
+        return {}
+    sig = (st.st_mtime_ns, st.st_size)
+    if _catalog_memo['sig'] != sig:
+        _catalog_memo['catalog'] = _read_catalog_file()
+        _catalog_memo['sig'] = sig
+    return _catalog_memo['catalog']
+
+
+def _catalog_entry(meta: dict, df: pd.DataFrame) -> dict:
+    """由 meta 和資料產生索引摘要"""
+    ticker = meta['ticker']
+    entry = {
+        'name': meta.get('name'),
+        'suffix': ticker.rpartition('.')[2] if '.' in ticker else None,
+        'rows': meta['rows'],
+        'source': meta.get('source'),
+        'source_mtime': meta.get('source_mtime'),
+        'first_date': None,
+        'last_date': None,
+        'avg_volume': None,
+    }
+    if 'date' in df.columns and len(df) > 0:
+        entry['first_date'] = df['date'].iloc[0].strftime('%Y-%m-%d')
+        entry['last_date'] = df['date'].iloc[-1].strftime('%Y-%m-%d')
+    if 'volume' in df.columns and len(df) > 0:
+        avg_volume = float(df['volume'].mean())
+        entry['avg_volume'] = avg_volume if np.isfinite(avg_volume) else None
+    return entry
+
+
+def update_catalog(entries: dict):
+    """
+    合併更新索引（跨進程加鎖）
+
+    Args:
+        entries: {ticker: entry}，批次寫入時一次更新可避免反覆改寫整份索引
+    """
+    if not entries:
+        return
+    os.makedirs(STORE_DIR, exist_ok=True)
+    with filelock.FileLock(CATALOG_LOCK, timeout=30):
+        catalog = _read_catalog_file()
+        catalog.update(entries)
+        _write_json_atomic(CATALOG_FILE, catalog)
+
+
+# ========== 讀寫 API ==========
+
+def write_stock(ticker: str, df: pd.DataFrame, name: str = None,
+                source: str = None, catalog_updates: dict = None) -> dict:
+    """
+    寫入單檔股票的全部欄位
+
+    Args:
+        ticker: 股票代碼（如 2330.TW）
+        df: 股價 DataFrame（會自動整理欄位與日期）
+        name: 股票名稱
+        source: 對應的 CSV 檔名（供新舊比對）
+        catalog_updates: 批次模式用的暫存 dict，有給時只記錄索引、不立即寫檔
+
+    Returns:
+        dict: 寫入後的 meta
+    """
+    df = normalize_frame(df)
+
+    ticker_dir = _ticker_dir(ticker)
+    os.makedirs(ticker_dir, exist_ok=True)
+
+    columns = {}
+    for col in df.columns:
+        values = np.ascontiguousarray(df[col].values)
+        path = os.path.join(ticker_dir, f"{col}.bin")
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        values.tofile(tmp_path)
+        os.replace(tmp_path, path)
+        columns[col] = values.dtype.str
+
+    meta = {
+        'ticker': ticker,
+        'name': name,
+        'rows': len(df),
+        'columns': columns,
+        'source': source,
+    }
+    return _commit_meta(meta, df, catalog_updates)
+
+
+def write_stock_tail(ticker: str, df: pd.DataFrame, start: int, name: str = None,
+                     source: str = None, catalog_updates: dict = None) -> dict:
+    """
+    只改寫第 start 列之後的資料（前面的列不動），各欄截斷後接上新值
+
+    Args:
+        ticker: 股票代碼
+        df: 第 start 列起的全部資料，欄位與型別需與既有資料相同
+        start: 起始列（不可超過既有筆數）
+        name: 股票名稱（省略則沿用 meta）
+        source: 對應的 CSV 檔名（省略則沿用 meta）
+        catalog_updates: 同 write_stock
+
+    Returns:
+        dict: 寫入後的 meta
+
+    Raises:
+        ValueError: 尚未寫入過、起始列超過既有筆數、或欄位/型別不同（改用 write_stock 整份寫入）
+    """
+    meta = read_meta(ticker)
+    if meta is None or not 0 <= start <= meta['rows']:
+        raise ValueError(f"{ticker} 無法從第 {start} 列接續寫入")
+
+    df = normalize_frame(df)
+    values = {col: np.ascontiguousarray(df[col].values) for col in df.columns}
+    if {col: v.dtype.str for col, v in values.items()} != meta['columns']:
+        raise ValueError(f"{ticker} 的欄位或型別與既有資料不同")
+
+    ticker_dir = _ticker_dir(ticker)
+    for col, v in values.items():
+        with open(os.path.join(ticker_dir, f"{col}.bin"), 'r+b') as f:
+            f.seek(start * v.itemsize)
+            f.write(v.tobytes())
+            f.truncate()
+
+    meta.update(rows=start + len(df), name=name or meta.get('name'),
+                source=source or meta.get('source'))
+    meta.pop('source_mtime', None)
+    # 摘要需要第一天與整欄均量，只讀這兩欄
+    return _commit_meta(meta, read_stock(ticker, ['volume'], meta), catalog_updates)
+
+
+def _commit_meta(meta: dict, df: pd.DataFrame, catalog_updates: dict = None) -> dict:
+    """記錄來源 CSV 的 mtime、寫入 meta 並更新目錄索引"""
+    ticker = meta['ticker']
+    source = meta.get('source')
+    if source:
+        source_path = os.path.join(os.path.dirname(STORE_DIR), "dayK", source)
+        if os.path.exists(source_path):
+            meta['source_mtime'] = os.path.getmtime(source_path)
+
+    # meta 最後寫入，讀者只會看到完整的一組欄位
+    _write_json_atomic(os.path.join(_ticker_dir(ticker), META_FILE), meta)
+
+    entry = _catalog_entry(meta, df)
+    if catalog_updates is not None:
+        catalog_updates[ticker] = entry
+    else:
+        update_catalog({ticker: entry})
+
+    return meta
+
+
+def meta_path(ticker: str) -> str:
+    """單檔股票 meta.json 的路徑（每次寫入都會更新，可用來判斷資料是否變動）"""
+    return os.path.join(_ticker_dir(ticker), META_FILE)
+
+
+def read_meta(ticker: str) -> dict:
+    """讀取單檔股票的 meta，不存在則回傳 None"""
+    path = meta_path(ticker)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_indicator_state(ticker: str) -> dict:
+    """讀取技術指標增量計算狀態，不存在則回傳 None"""
+    path = os.path.join(_ticker_dir(ticker), INDICATOR_STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_indicator_state(ticker: str, state: dict):
+    """寫入技術指標增量計算狀態"""
+    ticker_dir = _ticker_dir(ticker)
+    os.makedirs(ticker_dir, exist_ok=True)
+    _write_json_atomic(os.path.join(ticker_dir, INDICATOR_STATE_FILE), state)
+
+
+def read_column(ticker: str, column: str, meta: dict = None,
+                mmap: bool = False, start: int = 0) -> np.ndarray:
+    """
+    讀取單一欄位
+
+    Args:
+        ticker: 股票代碼
+        column: 欄位名稱（小寫）
+        meta: 已讀取的 meta（省略則自動讀取）
+        mmap: True 時回傳唯讀 np.memmap，不把整欄載入記憶體
+        start: 從第幾列開始讀（之前的列不讀）
+
+    Returns:
+        np.ndarray: 欄位資料
+    """
+    meta = meta or read_meta(ticker)
+    if meta is None or column not in meta['columns']:
+        raise KeyError(f"{ticker} 沒有 {column} 欄位")
+
+    path = os.path.join(_ticker_dir(ticker), f"{column}.bin")
+    dtype = np.dtype(meta['columns'][column])
+    rows = meta['rows']
+    start = min(max(int(start), 0), rows)
+
+    if mmap:
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(rows,))[start:]
+
+    values = np.fromfile(path, dtype=dtype, count=rows - start, offset=start * dtype.itemsize)
+    if len(values) != rows - start:
+        raise ValueError(f"{ticker} 的 {column} 欄位不完整")
+    return values
+
+
+def read_stock(ticker: str, columns: list = None, meta: dict = None,
+               start: int = 0) -> pd.DataFrame:
+    """
+    讀取單檔股票
+
+    Args:
+        ticker: 股票代碼
+        columns: 要讀取的欄位（None = 全部）；date 欄一定會附上
+        meta: 已讀取的 meta（省略則自動讀取）
+        start: 從第幾列開始讀；回傳的 index 仍是整份資料的列號
+
+    Returns:
+        DataFrame: 不存在時回傳 None
+    """
+    meta = meta or read_meta(ticker)
+    if meta is None:
+        return None
+
+    if columns is None:
+        columns = list(meta['columns'])
+    else:
+        columns = [c.lower() for c in columns]
+        if 'date' in meta['columns'] and 'date' not in columns:
+            columns = ['date'] + columns
+
+    data = {}
+    for col in columns:
+        if col in meta['columns']:
+            data[col] = read_column(ticker, col, meta, start=start)
+
+    df = pd.DataFrame(data)
+    if start and len(df):
+        df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def is_fresh(ticker: str, csv_path: str = None, meta: dict = None) -> bool:
+    """
+    檢查儲存內容是否比 CSV 新（CSV 被外部改寫過就視為過期）
+    """
+    meta = meta or read_meta(ticker)
+    if meta is None:
+        return False
+    if csv_path is None or not os.path.exists(csv_path):
+        return True
+    source_mtime = meta.get('source_mtime')
+    if source_mtime is None:
+        return False
+    return os.path.getmtime(csv_path) <= source_mtime
+
+
+def import_csv_dir(csv_dir: str = None, force: bool = False) -> int:
+    """
+    把既有的 dayK CSV 轉入欄式儲存
+
+    Args:
+        csv_dir: CSV 目錄，預設 data/tw-share/dayK
+        force: True 時全部重建，否則只轉換過期的檔案
+
+    Returns:
+        int: 轉換的檔案數
+    """
+    from glob import glob
+    from tqdm import tqdm
+
+    csv_dir = csv_dir or os.path.join(os.path.dirname(STORE_DIR), "dayK")
+    files = sorted(glob(os.path.join(csv_dir, "*.csv")))
+    converted = 0
+    catalog_updates = {}
+
+    for path in tqdm(files, desc="轉換欄式儲存"):
+        basename = os.path.basename(path)
+        ticker, _, name = basename[:-4].partition('_')
+        if not force and is_fresh(ticker, path):
+            continue
+        try:
+            df = pd.read_csv(path)
+            write_stock(ticker, df, name=name or None, source=basename,
+                        catalog_updates=catalog_updates)
+            converted += 1
+        except Exception as e:
+            print(f"轉換失敗 {basename}: {e}")
+
+    update_catalog(catalog_updates)
+    return converted
+
+
+# ========== 法人資料 cube ==========
+
+def _cube_paths(inst_dir: str = None) -> tuple:
+    cube_dir = os.path.join(inst_dir or INSTITUTIONAL_DIR, "cube")
+    return (cube_dir,
+            os.path.join(cube_dir, "index.json"),
+            os.path.join(cube_dir, "values.npy"))
+
+
+def institutional_cube_file(inst_dir: str = None) -> str:
+    """法人 cube 陣列檔路徑（每次更新都會整檔替換）"""
+    return _cube_paths(inst_dir)[2]
+
+
+def load_institutional_cube(inst_dir: str = None, mmap: bool = True) -> tuple:
+    """
+    載入法人 cube
+
+    Args:
+        inst_dir: 法人資料目錄，預設 data/institutional
+        mmap: True 時以唯讀 memmap 開啟，只有實際讀到的股票才會載入
+
+    Returns:
+        tuple: (dates, tickers, values)，不存在時回傳 (None, None, None)
+            dates: YYYYMMDD 字串清單
+            tickers: {股票代碼: 列索引}
+            values: (tickers × dates × 4) 陣列，最後一維依 INSTITUTIONAL_FIELDS
+    """
+    _, index_path, values_path = _cube_paths(inst_dir)
+    if not (os.path.exists(index_path) and os.path.exists(values_path)):
+        return None, None, None
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        values = np.load(values_path, mmap_mode='r' if mmap else None)
+    except (OSError, ValueError):
+        return None, None, None
+
+    dates = index['dates']
+    tickers = {t: i for i, t in enumerate(index['tickers'])}
+    if values.shape != (len(tickers), len(dates), len(INSTITUTIONAL_FIELDS)):
+        return None, None, None  # 寫入中途，index 與陣列不一致
+    return dates, tickers, values
+
+
+def _read_cube_index(inst_dir: str = None) -> dict:
+    _, index_path, _ = _cube_paths(inst_dir)
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def institutional_cube_is_fresh(dates: list, inst_dir: str = None) -> bool:
+    """cube 是否已涵蓋所有每日 JSON（上次更新時無法讀取、記在 index.json 的檔案除外）"""
+    if dates is None:
+        return False
+    missing = set(institutional_json_dates(inst_dir)).difference(dates)
+    if missing:
+        missing.difference_update(_read_cube_index(inst_dir).get('skipped', []))
+    return not missing
+
+
+def institutional_json_dates(inst_dir: str = None) -> list:
+    """列出法人 JSON 檔的日期（已排序）"""
+    inst_dir = inst_dir or INSTITUTIONAL_DIR
+    if not os.path.isdir(inst_dir):
+        return []
+    return sorted(name[:-5] for name in os.listdir(inst_dir) if name.endswith('.json'))
+
+
+def update_institutional_cube(inst_dir: str = None) -> int:
+    """
+    把新的每日法人 JSON 併入 cube（只讀取 cube 裡還沒有的日期）
+
+    無法讀取的 JSON 記在 index.json 的 skipped，下次更新時重試。
+
+    Args:
+        inst_dir: 法人資料目錄，預設 data/institutional
+
+    Returns:
+        int: 新併入的天數
+    """
+    inst_dir = inst_dir or INSTITUTIONAL_DIR
+    cube_dir, index_path, values_path = _cube_paths(inst_dir)
+
+    old_dates, old_tickers, old_values = load_institutional_cube(inst_dir, mmap=False)
+    old_dates = old_dates or []
+    old_tickers = list(old_tickers or [])
+
+    # 上次無法讀取的日期不在 cube 裡，會跟著新日期一起重試
+    old_skipped = _read_cube_index(inst_dir).get('skipped', []) if old_values is not None else None
+
+    known = set(old_dates)
+    new_dates = [d for d in institutional_json_dates(inst_dir) if d not in known]
+    if not new_dates and not old_skipped:
+        return 0
+
+    # 讀取新日期
+    daily = {}
+    skipped = []
+    for date_str in new_dates:
+        try:
+            with open(os.path.join(inst_dir, f"{date_str}.json"), 'r', encoding='utf-8') as f:
+                daily[date_str] = json.load(f)
+        except (OSError, ValueError):
+            skipped.append(date_str)
+    if not daily and skipped == old_skipped:
+        return 0
+
+    new_ticker_set = set()
+    for data in daily.values():
+        new_ticker_set.update(data.keys())
+
+    dates = sorted(known | set(daily))
+    tickers = old_tickers + sorted(new_ticker_set - set(old_tickers))
+    date_pos = {d: i for i, d in enumerate(dates)}
+    ticker_pos = {t: i for i, t in enumerate(tickers)}
+
+    values = np.zeros((len(tickers), len(dates), len(INSTITUTIONAL_FIELDS)), dtype=np.int64)
+    if old_values is not None and len(old_dates) > 0:
+        old_cols = np.array([date_pos[d] for d in old_dates])
+        values[:len(old_tickers), old_cols, :] = old_values
+
+    for date_str, data in daily.items():
+        col = date_pos[date_str]
+        for ticker, row in data.items():
+            values[ticker_pos[ticker], col] = [row.get(k, 0) for k in INSTITUTIONAL_FIELDS]
+
+    os.makedirs(cube_dir, exist_ok=True)
+    tmp_path = f"{values_path}.tmp{os.getpid()}.npy"
+    np.save(tmp_path, values)
+    os.replace(tmp_path, values_path)
+    _write_json_atomic(index_path, {'dates': dates, 'tickers': tickers, 'skipped': skipped})
+
+    return len(daily)
+
+
+def read_institutional(ticker: str, inst_dir: str = None, cube: tuple = None) -> pd.DataFrame:
+    """
+    取出單一股票的法人買賣超（只讀該股票的連續區段）
+
+    Args:
+        ticker: 股票代碼
+        inst_dir: 法人資料目錄
+        cube: 已載入的 (dates, tickers, values)，批次處理時可重複使用
+
+    Returns:
+        DataFrame: date, foreign, trust, dealer, total；cube 不存在時回傳 None
+    """
+    dates, tickers, values = cube or load_institutional_cube(inst_dir)
+    if dates is None:
+        return None
+
+    if ticker in tickers:
+        row = values[tickers[ticker]]
+    else:
+        row = np.zeros((len(dates), len(INSTITUTIONAL_FIELDS)), dtype=np.int64)
+
+    df = pd.DataFrame(np.asarray(row), columns=INSTITUTIONAL_FIELDS)
+    df.insert(0, 'date', pd.to_datetime(dates, format='%Y%m%d').astype('datetime64[ns]'))
+    return df
+
+
+if __name__ == '__main__':
+    import sys
+
+    force = '--force' in sys.argv
+    count = import_csv_dir(force=force)
+    print(f"✅ 已轉換 {count} 檔，索引共 {len(load_catalog())} 檔")
@@ -5,6 +5,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import institutional  # 匯入法人資料模組
+from data_loader import read_stock_file, save_stock_file
 import time
 import random
 import requests
@@ -74,8 +75,8 @@ def download_stock_data(item):
         
         if os.path.exists(out_path) and os.path.getsize(out_path) > 500:
             try:
-                existing_df = pd.read_csv(out_path)
-                existing_df['date'] = pd.to_datetime(existing_df['date']).dt.tz_localize(None)
+                # 優先讀欄式儲存，日期已轉成不含時區
+                existing_df = read_stock_file(out_path)
                 last_date = existing_df['date'].max()
                 
                 # 取得今天日期（不含時間）
@@ -112,10 +113,10 @@ def download_stock_data(item):
                         combined_df = pd.concat([existing_df, hist], ignore_index=True)
                         combined_df = combined_df.drop_duplicates(subset=['date'], keep='last')
                         combined_df = combined_df.sort_values('date').reset_index(drop=True)
-                        combined_df.to_csv(out_path, index=False, encoding='utf-8-sig')
+                        save_stock_file(out_path, combined_df, name=safe_name)
                         return {"status": "updated", "tkr": yf_tkr}
                     else:
-                        hist.to_csv(out_path, index=False, encoding='utf-8-sig')
+                        save_stock_file(out_path, hist, name=safe_name)
                         return {"status": "success", "tkr": yf_tkr}
                 
                 # 如果是 Empty，可能是該代號真的沒資料
@@ -2,6 +2,9 @@
 """
 技術指標計算模組
 計算常用技術分析指標並加入 CSV 檔案
+
+每日更新只多幾列時走增量模式：從欄式儲存裡的狀態（EMA 末值、視窗尾段、OBV 累計）
+接著算新列，只改寫 CSV 尾端；歷史資料被改動時自動退回全量重算
 """
 import os
 import pandas as pd
@@ -9,6 +12,9 @@ import numpy as np
 from glob import glob
 from tqdm import tqdm
 
+import data_store
+from data_loader import read_stock_file, save_stock_file, save_stock_tail, parse_stock_filename
+
 # ========== 資料路徑設定 ==========
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data", "tw-share", "dayK")
@@ -87,17 +93,25 @@ def calc_williams_r(df, period=14):
 
 # ========== 成交量指標 ==========
 
+def obv_steps(close_diff, volume):
+    """
+    OBV 每日增減：收盤上漲 +量、下跌 -量、持平（或無法比較）0
+    
+    Args:
+        close_diff: 收盤價與前一日的差
+        volume: 成交量
+    """
+    close_diff = np.asarray(close_diff, dtype=float)
+    volume = np.asarray(volume)
+    direction = np.where(close_diff > 0, 1, np.where(close_diff < 0, -1, 0))
+    return np.where(direction == 0, 0, direction * volume)
+
+
 def calc_obv(df):
     """計算 OBV 能量潮"""
-    obv = [0]
-    for i in range(1, len(df)):
-        if df['close'].iloc[i] > df['close'].iloc[i-1]:
-            obv.append(obv[-1] + df['volume'].iloc[i])
-        elif df['close'].iloc[i] < df['close'].iloc[i-1]:
-            obv.append(obv[-1] - df['volume'].iloc[i])
-        else:
-            obv.append(obv[-1])
-    df['obv'] = obv
+    steps = obv_steps(df['close'].diff(), df['volume'])
+    # 依序累加（與逐筆相加的結果一致）
+    df['obv'] = np.cumsum(steps)
     return df
 
 
@@ -121,6 +135,325 @@ def calc_atr(df, period=14):
     return df
 
 
+# ========== 增量計算 ==========
+
+STATE_VERSION = 1
+STATE_TAIL_ROWS = 80          # 保留的視窗尾段（最長回看 60 日 + 緩衝）
+STATE_RAW_COLUMNS = ['high', 'low', 'close', 'volume']
+INDICATOR_COLUMNS = [
+    'ma5', 'ma10', 'ma20', 'ma60', 'ema12', 'ema26', 'macd', 'macd_signal', 'macd_hist',
+    'bb_middle', 'bb_upper', 'bb_lower', 'rsi', 'k', 'd', 'williams_r', 'obv',
+    'vol_ma5', 'vol_ma20', 'atr',
+]
+
+
+def _ewm_continue(prev, values, span):
+    """
+    接續 ewm(span, adjust=False) 的遞迴
+    
+    運算順序與 pandas 相同：((1-α)·前值 + α·x) / ((1-α) + α)，結果與全量計算一致；
+    pandas 遇到缺值會沿用前值並衰減權重，這裡不處理，有缺值時需全量重算（見 can_extend）
+    """
+    alpha = 2.0 / (span + 1.0)
+    old_wt = 1.0 - alpha
+    out = np.empty(len(values))
+    weighted = prev
+    for i, cur in enumerate(values):
+        weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        out[i] = weighted
+    return out
+
+
+def build_indicator_state(df, first_date=None):
+    """
+    由已算好指標的 DataFrame 產生增量狀態
+    
+    Args:
+        df: 完整資料，或 index 為整份資料列號的尾段（需至少 STATE_TAIL_ROWS 列）
+        first_date: 整份資料第一列的日期（df 只有尾段時必須提供）
+    """
+    tail = df.tail(STATE_TAIL_ROWS)
+    return {
+        'version': STATE_VERSION,
+        'rows': int(df.index[-1]) + 1,
+        'first_date': str(df['date'].iloc[0] if first_date is None else first_date),
+        'tail_dates': [str(d) for d in tail['date']],
+        'tail': {c: tail[c].astype(float).tolist() for c in STATE_RAW_COLUMNS},
+        'ema12': float(df['ema12'].iloc[-1]),
+        'ema26': float(df['ema26'].iloc[-1]),
+        'macd_signal': float(df['macd_signal'].iloc[-1]),
+        'obv': float(df['obv'].iloc[-1]),
+    }
+
+
+def state_tail_start(state):
+    """增量計算需要從第幾列開始讀（狀態尾段的第一列；沒有可用狀態時為 0）"""
+    if not state or state.get('version') != STATE_VERSION:
+        return 0
+    return max(state['rows'] - len(state['tail_dates']), 0)
+
+
+def state_matches(state, df, first_date=None):
+    """
+    狀態是否仍對應目前的資料（已處理的列沒有被改動）
+    
+    比對起始日、總列數，以及狀態保存的尾段原始值
+    
+    Args:
+        df: 完整資料，或 index 為整份資料列號、從 state_tail_start() 開始的尾段
+        first_date: 整份資料第一列的日期（df 只有尾段時必須提供）
+    """
+    if not state or state.get('version') != STATE_VERSION or len(df) == 0:
+        return False
+    if first_date is None:
+        first_date = df['date'].iloc[0]
+    rows = state['rows']
+    if rows > int(df.index[-1]) + 1 or str(first_date) != state['first_date']:
+        return False
+    if any(c not in df.columns for c in INDICATOR_COLUMNS + STATE_RAW_COLUMNS):
+        return False
+    
+    n_tail = len(state['tail_dates'])
+    if n_tail < min(rows, STATE_TAIL_ROWS) or rows - n_tail < df.index[0]:
+        return False
+    old = df.loc[rows - n_tail:rows - 1]
+    if [str(d) for d in old['date']] != state['tail_dates']:
+        return False
+    return all(np.array_equal(old[c].astype(float).values, np.asarray(state['tail'][c], dtype=float))
+               for c in STATE_RAW_COLUMNS)
+
+
+def can_extend(state, df):
+    """
+    新增列能否接續 EMA 遞迴（需先通過 state_matches()）
+    
+    新增列的收盤價有缺值、或狀態的末值本身是 NaN 時，pandas 的 ewm 會跳過缺值並衰減權重，
+    _ewm_continue 無法重現，要全量重算
+    """
+    new_close = df.loc[state['rows']:, 'close'].to_numpy(dtype=float)
+    ends = [state['ema12'], state['ema26'], state['macd_signal']]
+    return bool(np.isfinite(ends).all() and not np.isnan(new_close).any())
+
+
+def extend_indicators(df, state):
+    """
+    只計算 state['rows'] 之後新增列的指標
+    
+    Args:
+        df: 完整資料或尾段（index 為整份資料的列號，前面的列已有指標）
+        state: build_indicator_state() 的結果，需先通過 state_matches() 與 can_extend()
+    
+    Returns:
+        df: 新增列已填入指標的 DataFrame
+    """
+    rows = state['rows']
+    new = df.loc[rows:]
+    
+    # 視窗類指標：尾段 + 新列重算，只取新列
+    window = pd.concat([pd.DataFrame(state['tail']), new[STATE_RAW_COLUMNS]], ignore_index=True)
+    window = calc_ma(window)
+    window = calc_bollinger(window)
+    window = calc_rsi(window)
+    window = calc_kd(window)
+    window = calc_williams_r(window)
+    window = calc_volume_ma(window)
+    window = calc_atr(window)
+    window_new = window.tail(len(new))
+    
+    # 遞迴類指標：接續上次的末值
+    close = new['close'].values.astype(float)
+    ema12 = _ewm_continue(state['ema12'], close, 12)
+    ema26 = _ewm_continue(state['ema26'], close, 26)
+    macd = ema12 - ema26
+    macd_signal = _ewm_continue(state['macd_signal'], macd, 9)
+    
+    prev_close = np.concatenate([[state['tail']['close'][-1]], close[:-1]])
+    steps = obv_steps(close - prev_close, new['volume'].values)
+    obv = np.cumsum(np.concatenate([[state['obv']], steps]))[1:]
+    
+    df = df.copy()
+    idx = new.index
+    for col in ['ma5', 'ma10', 'ma20', 'ma60', 'bb_middle', 'bb_upper', 'bb_lower',
+                'rsi', 'k', 'd', 'williams_r', 'vol_ma5', 'vol_ma20', 'atr']:
+        df.loc[idx, col] = window_new[col].values
+    df.loc[idx, 'ema12'] = ema12
+    df.loc[idx, 'ema26'] = ema26
+    df.loc[idx, 'macd'] = macd
+    df.loc[idx, 'macd_signal'] = macd_signal
+    df.loc[idx, 'macd_hist'] = macd - macd_signal
+    df.loc[idx, 'obv'] = obv
+    return df
+
+
+# ========== 面板（多股票）指標 ==========
+
+def _rolling_reduce(x, n, ufunc, transform=None):
+    """
+    沿時間軸（axis 0）的滑動視窗累積：把 n 個錯位切片逐一用 ufunc 合併
+    
+    每次都是整塊連續陣列運算，視窗不滿或含 NaN 時為 NaN
+    """
+    out = np.full(x.shape, np.nan)
+    m = len(x) - n + 1
+    if m <= 0:
+        return out
+    part = (lambda k: transform(x[k:k + m], k)) if transform else (lambda k: x[k:k + m])
+    acc = np.array(part(0), dtype=float)
+    for k in range(1, n):
+        ufunc(acc, part(k), out=acc)
+    out[n - 1:] = acc
+    return out
+
+
+def _rolling_means(x, periods):
+    """
+    以累積和相減求多個視窗長度的平均（累積和只算一次），視窗內有 NaN 時為 NaN
+    
+    Returns:
+        dict: {n: 平均陣列}
+    """
+    nan = np.isnan(x)
+    has_nan = nan.any()
+    csum = np.cumsum(np.where(nan, 0.0, x) if has_nan else x, axis=0)
+    cnan = np.cumsum(nan, axis=0, dtype=np.int32) if has_nan else None
+    
+    means = {}
+    for n in periods:
+        out = np.full(x.shape, np.nan)
+        if len(x) >= n:
+            total = csum[n - 1:].copy()
+            total[1:] -= csum[:-n]
+            total /= n
+            if has_nan:
+                bad = cnan[n - 1:].copy()
+                bad[1:] -= cnan[:-n]
+                total[bad > 0] = np.nan
+            out[n - 1:] = total
+        means[n] = out
+    return means
+
+
+def _rolling_mean(x, n):
+    return _rolling_means(x, [n])[n]
+
+
+def _rolling_std(x, n):
+    """樣本標準差（ddof=1），先求視窗平均再累加離差平方"""
+    mean = _rolling_reduce(x, n, np.add)[n - 1:] / n
+    ss = _rolling_reduce(x, n, np.add, lambda part, k: (part - mean) ** 2)
+    return np.sqrt(ss / (n - 1))
+
+
+def _rolling_min(x, n):
+    return _rolling_reduce(x, n, np.minimum)
+
+
+def _rolling_max(x, n):
+    return _rolling_reduce(x, n, np.maximum)
+
+
+def _ewm(x, span):
+    """沿時間軸的 ewm(span, adjust=False)，逐日遞迴、所有股票一起算"""
+    alpha = 2.0 / (span + 1.0)
+    old_wt = 1.0 - alpha
+    out = np.empty(x.shape)
+    if len(x) == 0:
+        return out
+    weighted = x[0].copy()
+    out[0] = weighted
+    for t in range(1, len(x)):
+        weighted = (old_wt * weighted + alpha * x[t]) / (old_wt + alpha)
+        out[t] = weighted
+    return out
+
+
+def _panel_indicators(close, high, low, volume):
+    """對「每欄由上而下都是有效資料」的 (日 × 股) 陣列計算全部指標"""
+    out = {}
+    
+    # 趨勢指標
+    close_means = _rolling_means(close, [5, 10, 20, 60])
+    for p in [5, 10, 20, 60]:
+        out[f'ma{p}'] = close_means[p]
+    ema12 = _ewm(close, 12)
+    ema26 = _ewm(close, 26)
+    out['ema12'] = ema12
+    out['ema26'] = ema26
+    out['macd'] = ema12 - ema26
+    out['macd_signal'] = _ewm(out['macd'], 9)
+    out['macd_hist'] = out['macd'] - out['macd_signal']
+    
+    rolling_std = _rolling_std(close, 20)
+    out['bb_middle'] = close_means[20]
+    out['bb_upper'] = out['bb_middle'] + rolling_std * 2
+    out['bb_lower'] = out['bb_middle'] - rolling_std * 2
+    
+    # 動能指標
+    delta = np.full(close.shape, np.nan)
+    delta[1:] = close[1:] - close[:-1]
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    rs = _rolling_mean(gain, 14) / _rolling_mean(loss, 14)
+    out['rsi'] = 100 - (100 / (1 + rs))
+    
+    low_min = _rolling_min(low, 9)
+    high_max = _rolling_max(high, 9)
+    out['k'] = 100 * (close - low_min) / (high_max - low_min)
+    out['d'] = _rolling_mean(out['k'], 3)
+    
+    high_max = _rolling_max(high, 14)
+    low_min = _rolling_min(low, 14)
+    out['williams_r'] = -100 * (high_max - close) / (high_max - low_min)
+    
+    # 成交量指標
+    out['obv'] = np.cumsum(obv_steps(delta, volume), axis=0)
+    volume_means = _rolling_means(volume, [5, 20])
+    for p in [5, 20]:
+        out[f'vol_ma{p}'] = volume_means[p]
+    
+    # 波動率指標
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[1:] = close[:-1]
+    true_range = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+    out['atr'] = _rolling_mean(true_range, 14)
+    
+    return out
+
+
+def calculate_panel_indicators(panel):
+    """
+    對 PricePanel 的全部股票一次計算技術指標（欄位名稱與 calculate_all_indicators 相同）
+    
+    每檔股票只用自己有資料的日期計算（停牌、尚未上市的日子不佔視窗），
+    做法是先把每欄的有效列往上收攏，用二維陣列運算後再放回原日期
+    
+    Args:
+        panel: data_loader.PricePanel，需有 high/low/close/volume
+    
+    Returns:
+        panel: 加入指標欄位的同一個 PricePanel
+    """
+    valid = panel.valid
+    order = np.argsort(~valid, axis=0, kind='stable')
+    packed_valid = np.take_along_axis(valid, order, axis=0)
+    
+    def pack(name):
+        x = np.take_along_axis(panel[name].astype(float), order, axis=0)
+        x[~packed_valid] = np.nan
+        return x
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        results = _panel_indicators(pack('close'), pack('high'), pack('low'), pack('volume'))
+    
+    for name, packed in results.items():
+        values = np.full(packed.shape, np.nan)
+        np.put_along_axis(values, order, packed, axis=0)
+        values[~valid] = np.nan
+        panel[name] = values
+    
+    return panel
+
+
 # ========== 主要函數 ==========
 
 def calculate_all_indicators(df):
@@ -157,38 +490,63 @@ def calculate_all_indicators(df):
     return df
 
 
-def add_indicators_to_csv(csv_path):
+def add_indicators_to_csv(csv_path, incremental=True):
     """
-    讀取 CSV，計算指標，覆寫回原檔案
+    讀取股價，計算指標，寫回原檔案（CSV 與欄式儲存）
     
     Args:
         csv_path: CSV 檔案路徑
+        incremental: 有可用的增量狀態時只計算新增列；False 則全量重算
     
     Returns:
         bool: 是否成功
     """
     try:
-        df = pd.read_csv(csv_path)
-        df = calculate_all_indicators(df)
-        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+        ticker, _ = parse_stock_filename(csv_path)
+        state = data_store.read_indicator_state(ticker) if incremental else None
+        
+        # 增量模式只讀狀態尾段之後的列，另外只讀日期欄比對起始日
+        start = state_tail_start(state)
+        df = read_stock_file(csv_path, start=start)
+        first_date = read_stock_file(csv_path, ['date'])['date'].iloc[0] if start else None
+        
+        if state_matches(state, df, first_date) and can_extend(state, df):
+            n_new = int(df.index[-1]) + 1 - state['rows']
+            if n_new == 0:
+                return True
+            df = extend_indicators(df, state)
+            save_stock_tail(csv_path, df, n_new)
+        else:
+            if start:
+                df = read_stock_file(csv_path)
+            first_date = None
+            df = calculate_all_indicators(df)
+            save_stock_file(csv_path, df)
+        
+        data_store.write_indicator_state(ticker, build_indicator_state(df, first_date))
         return True
     except Exception as e:
         print(f"處理失敗 {csv_path}: {e}")
         return False
 
 
-def process_all_stocks():
-    """批次處理所有股票的 CSV 檔案"""
+def process_all_stocks(incremental=True):
+    """
+    批次處理所有股票的 CSV 檔案
+    
+    Args:
+        incremental: 只計算新增列（歷史被改動的股票會自動全量重算）；False 則全部重算
+    """
     files = glob(os.path.join(DATA_DIR, "*.csv"))
     
-    print(f"📊 開始計算技術指標...")
+    print(f"📊 開始計算技術指標{'（增量）' if incremental else '（全量）'}...")
     print(f"📁 共 {len(files)} 個檔案")
     
     success = 0
     failed = 0
     
     for f in tqdm(files, desc="計算進度"):
-        if add_indicators_to_csv(f):
+        if add_indicators_to_csv(f, incremental):
             success += 1
         else:
             failed += 1
@@ -209,4 +567,5 @@ def process_all_stocks():
 
 
 if __name__ == "__main__":
-    process_all_stocks()
+    import sys
+    process_all_stocks(incremental='--full' not in sys.argv)
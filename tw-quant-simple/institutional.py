@@ -260,6 +260,23 @@ def download_institutional_history(start_date, end_date=None, save_dir=None):
 
 
     print("=" * 50)
+    
+    # 把新的日期併入法人 cube
+    update_cube(save_dir)
+
+
+def update_cube(save_dir=None):
+    """
+    將每日 JSON 併入法人 cube（data_store），只處理 cube 尚未包含的日期
+    
+    Args:
+        save_dir: 法人資料目錄，預設為 data/institutional/
+    """
+    import data_store
+    
+    merged = data_store.update_institutional_cube(save_dir)
+    if merged:
+        print(f"🧊 法人 cube 已更新: 新增 {merged} 天")
 
 
 def auto_update():
@@ -301,6 +318,7 @@ def auto_update():
     # 如果起始日已經晚於結束日，代表不用更新
     if start_date > end_date:
         print(f"✅ 法人資料已是最新 ({end_date})")
+        update_cube(save_dir)
         return
         
     print(f"🔄 自動更新法人資料: {start_date} -> {end_date}")
@@ -315,6 +333,9 @@ if __name__ == '__main__':
         if cmd == 'auto':
             # 自動更新模式
             auto_update()
+        elif cmd == 'cube':
+            # 只重建法人 cube
+            update_cube()
         else:
             # 手動指定日期模式
             start = sys.argv[1]
@@ -334,4 +355,5 @@ if __name__ == '__main__':
         print("💡 下載歷史資料用法:")
         print("   python institutional.py auto              (自動更新)")
         print("   python institutional.py 20240101 20241224 (手動指定範圍)")
+        print("   python institutional.py cube              (重建法人 cube)")
 
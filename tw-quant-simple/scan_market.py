@@ -20,6 +20,7 @@ v2.0 優化項目：
     python scan_market.py           # 完整掃描
     python scan_market.py --fast    # 快速模式（只掃描活躍股票）
     python scan_market.py --resume  # 從上次中斷處繼續
+    python scan_market.py --panel   # 面板模式（全市場一次載入、一次回測）
 
 報告輸出：
     reports/market_scan_all_strategies.html
@@ -51,7 +52,16 @@ from backtest import (
     TurtleStrategy,
     InstitutionalFollowStrategy,
 )
-from data_loader import load_institutional_data, load_stock_with_institutional
+from backtest.panel import MarketPanel, run_panel
+import data_store
+from data_loader import (
+    load_institutional_frame,
+    load_institutional_source,
+    merge_institutional,
+    parse_stock_filename,
+    read_stock_file,
+    prefilter_stock_files,
+)
 
 # 資料目錄
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -88,18 +98,39 @@ def get_all_strategies(include_institutional=True, institutional_data=None):
     return strategies
 
 
-def process_single_stock(args):
+def _is_institutional(strategy_name: str) -> bool:
+    return '連買' in strategy_name or '連賣' in strategy_name
+
+
+def build_strategies(strategy_configs) -> list:
+    """策略配置 → [(strategy_name, 策略實例)]，無法建立的策略略過"""
+    strategies = []
+    for strategy_name, strategy_type, strategy_params in strategy_configs:
+        try:
+            strategies.append((strategy_name, create_strategy(strategy_type, strategy_params)))
+        except Exception:
+            continue
+    return strategies
+
+
+def scan_stock(csv_path, strategies, min_volume, min_days, cube=None, inst_data=None):
     """
-    處理單一股票的回測（供多進程呼叫）
+    單一股票跑所有策略
+    
+    Args:
+        csv_path: dayK CSV 路徑
+        strategies: build_strategies() 的結果
+        min_volume: 最低平均成交量
+        min_days: 最低數據天數
+        cube: 已載入的法人 cube（None 則由 load_institutional_frame 自行載入）
+        inst_data: 已載入的法人逐日 JSON（cube 過期時使用）
     
     Returns:
-        dict: {strategy_name: [result_dict, ...]}
+        dict: {strategy_name: [result_dict, ...]}，沒有任何有效結果時為 None
     """
-    csv_path, strategy_configs, min_volume, min_days = args
-    
     try:
         # 讀取股價資料
-        df = pd.read_csv(csv_path)
+        df = read_stock_file(csv_path)
         
         # 基本過濾
         if len(df) < min_days:
@@ -109,36 +140,41 @@ def process_single_stock(args):
             return None
         
         # 股票資訊
-        ticker = os.path.basename(csv_path).split('_')[0]
-        name = os.path.basename(csv_path).replace('.csv', '').split('_', 1)[-1]
+        ticker, name = parse_stock_filename(csv_path)
         
-        # 嘗試載入法人資料
+        # 依使用的資料分組：同一份資料的策略一次回測（資料只整理一次）
+        groups = {'price': [], 'institutional': []}
+        for strategy_name, strategy in strategies:
+            group = 'institutional' if _is_institutional(strategy_name) else 'price'
+            groups[group].append((strategy_name, strategy))
+        
+        # 嘗試合併法人資料（沿用已讀取的股價）
         df_with_inst = None
-        try:
-            df_with_inst = load_stock_with_institutional(ticker)
-        except:
-            pass
+        if groups['institutional']:
+            try:
+                inst_frame = load_institutional_frame(ticker, cube=cube, inst_data=inst_data)
+                df_with_inst = merge_institutional(df, ticker, inst_frame)
+            except Exception:
+                pass
         
-        # 初始化回測引擎
-        engine = BacktestEngine()
+        # 初始化回測引擎（向量化模式，結果與逐列模擬相同）
+        engine = BacktestEngine(mode='vectorized')
         stock_results = {}
         
-        # 執行各策略回測
-        for strategy_name, strategy_type, strategy_params in strategy_configs:
+        runs = []
+        for group, run_df in (('price', df), ('institutional', df_with_inst)):
+            if not groups[group] or run_df is None or run_df.empty:
+                continue
+            names = [strategy_name for strategy_name, _ in groups[group]]
+            results = engine.run_many(run_df, [strategy for _, strategy in groups[group]],
+                                      verbose=False, skip_errors=True)
+            runs.extend(zip(names, results))
+        
+        # 整理各策略結果
+        for strategy_name, result in runs:
             try:
-                # 重建策略實例（因為多進程不能序列化策略物件）
-                strategy = create_strategy(strategy_type, strategy_params)
-                
-                # 選擇資料
-                if '連買' in strategy_name or '連賣' in strategy_name:
-                    if df_with_inst is None or df_with_inst.empty:
-                        continue
-                    run_df = df_with_inst
-                else:
-                    run_df = df
-                
-                # 執行回測
-                result = engine.run(run_df, strategy, verbose=False)
+                if result is None:
+                    continue
                 m = result['metrics']
                 
                 # 篩選有效結果
@@ -164,6 +200,53 @@ def process_single_stock(args):
         return None
 
 
+def process_single_stock(args):
+    """
+    處理單一股票的回測
+    
+    Args:
+        args: (csv_path, strategy_configs, min_volume, min_days)
+    
+    Returns:
+        dict: {strategy_name: [result_dict, ...]}
+    """
+    csv_path, strategy_configs, min_volume, min_days = args
+    return scan_stock(csv_path, build_strategies(strategy_configs), min_volume, min_days)
+
+
+# ========== 多進程工作行程 ==========
+
+# 每個工作行程只載入一次的唯讀狀態（_init_scan_worker 設定）
+_scan_state = {}
+
+
+def _init_scan_worker(strategy_configs, min_volume, min_days):
+    """工作行程初始化：建立策略、開啟法人 cube（cube 過期時才讀逐日 JSON）"""
+    strategies = build_strategies(strategy_configs)
+    cube = inst_data = None
+    if any(_is_institutional(strategy_name) for strategy_name, _ in strategies):
+        try:
+            cube, inst_data, _ = load_institutional_source()
+        except Exception:
+            cube, inst_data = data_store.load_institutional_cube(), {}
+    _scan_state.update(strategies=strategies, min_volume=min_volume, min_days=min_days,
+                       cube=cube, inst_data=inst_data)
+
+
+def _scan_file(csv_path):
+    """工作行程的任務：回傳 (csv_path, 結果)，主行程依路徑記錄進度"""
+    return csv_path, scan_stock(csv_path, **_scan_state)
+
+
+def scan_chunksize(n_tasks: int, num_workers: int) -> int:
+    """
+    每次派給工作行程的任務數
+    
+    每個行程約分到 8 批（負載平衡），上限 32 檔（進度顯示與中斷時遺失的量不會太大）
+    """
+    return max(1, min(32, n_tasks // (num_workers * 8)))
+
+
 def create_strategy(strategy_type, params):
     """根據類型和參數建立策略實例"""
     strategy_map = {
@@ -180,7 +263,11 @@ def create_strategy(strategy_type, params):
 
 
 def get_strategy_configs(include_institutional=True, institutional_data=None):
-    """取得策略配置（可序列化版本）"""
+    """
+    取得策略配置（可序列化版本）
+    
+    institutional_data 為已載入的法人資料（逐日 JSON 或 (cube, inst_data)），None 表示無法載入、不含法人策略
+    """
     configs = [
         ("MA5x20", "MACross", (5, 20)),
         ("MA5x60", "MACross", (5, 60)),
@@ -302,12 +389,13 @@ def market_scan_all_strategies(top_n=30, min_volume=500, min_days=60,
         resume: 從上次中斷處繼續
         num_workers: 並行工作數（預設為 CPU 核心數）
     """
-    # 載入法人資料
-    institutional_data = None
+    # 載入法人資料（cube 最新時不讀逐日 JSON；工作行程各自開啟 cube）
+    institutional = None
     try:
-        institutional_data = load_institutional_data()
-        print(f"✅ 已載入法人資料: {len(institutional_data)} 天")
-    except:
+        cube, inst_data, inst_dates = load_institutional_source()
+        institutional = (cube, inst_data)
+        print(f"✅ 已載入法人資料: {len(inst_dates)} 天")
+    except Exception:
         print("⚠️ 無法載入法人資料，法人策略將跳過")
     
     # 取得所有股票檔案
@@ -319,7 +407,7 @@ def market_scan_all_strategies(top_n=30, min_volume=500, min_days=60,
         print("⚡ 快速模式：只掃描高成交量股票")
     
     # 取得策略配置
-    strategy_configs = get_strategy_configs(True, institutional_data)
+    strategy_configs = get_strategy_configs(True, institutional)
     
     # 初始化結果
     results = {name: [] for name, _, _ in strategy_configs}
@@ -335,8 +423,9 @@ def market_scan_all_strategies(top_n=30, min_volume=500, min_days=60,
                     results[name] = data
             print(f"📂 從上次進度恢復，已處理 {len(processed_files)} 檔")
     
-    # 過濾已處理的檔案
+    # 過濾已處理的檔案，並用目錄索引先排除成交量/天數不足的股票
     files_to_process = [f for f in all_files if f not in processed_files]
+    files_to_process = prefilter_stock_files(files_to_process, min_volume, min_days)
     
     # 統計資訊
     total_strategies = len(strategy_configs)
@@ -353,11 +442,12 @@ def market_scan_all_strategies(top_n=30, min_volume=500, min_days=60,
     if num_workers is None:
         num_workers = min(cpu_count(), 6)  # 最多用 6 核心
     
-    print(f"🚀 使用 {num_workers} 個進程並行處理...")
+    chunksize = scan_chunksize(len(files_to_process), num_workers)
+    print(f"🚀 使用 {num_workers} 個進程並行處理（每批 {chunksize} 檔）...")
     print()
     
-    # 準備任務參數
-    tasks = [(f, strategy_configs, min_volume, min_days) for f in files_to_process]
+    # 任務只帶檔案路徑；策略與法人資料由各行程初始化時載入一次
+    tasks = files_to_process
     
     # 開始時間
     start_time = time.time()
@@ -365,20 +455,21 @@ def market_scan_all_strategies(top_n=30, min_volume=500, min_days=60,
     
     # 使用多進程處理
     try:
-        with Pool(processes=num_workers) as pool:
-            # 使用 imap_unordered 以便即時更新進度
-            for i, stock_result in enumerate(tqdm(
-                pool.imap_unordered(process_single_stock, tasks),
+        with Pool(processes=num_workers, initializer=_init_scan_worker,
+                  initargs=(strategy_configs, min_volume, min_days)) as pool:
+            # 使用 imap_unordered 以便即時更新進度（完成順序不固定，以回傳的路徑記錄進度）
+            for csv_path, stock_result in tqdm(
+                pool.imap_unordered(_scan_file, tasks, chunksize=chunksize),
                 total=len(tasks),
                 desc="掃描中",
                 unit="檔"
-            )):
+            ):
                 if stock_result:
                     for strategy_name, strategy_results in stock_result.items():
                         results[strategy_name].extend(strategy_results)
                 
                 processed_count += 1
-                processed_files.add(files_to_process[i] if i < len(files_to_process) else "")
+                processed_files.add(csv_path)
                 
                 # 每 100 檔儲存一次進度
                 if processed_count % 100 == 0:
@@ -417,6 +508,125 @@ def market_scan_all_strategies(top_n=30, min_volume=500, min_days=60,
     return results, overall_ranking
 
 
+def load_market_panel(csv_paths: list, strategies: list, min_volume=500, min_days=60,
+                      institutional=None) -> tuple:
+    """
+    載入全市場成 MarketPanel（篩選條件同 process_single_stock）
+
+    只保留策略用得到的欄位：OHLCV、策略宣告的指標欄位與法人買賣超。
+
+    Args:
+        csv_paths: dayK CSV 路徑清單
+        strategies: 策略物件列表
+        min_volume: 最低平均成交量
+        min_days: 最低數據天數
+        institutional: 已開啟的法人資料 (cube, inst_data)，見 load_institutional_source
+                       （None 時有法人策略才自行開啟）
+
+    Returns:
+        tuple: (MarketPanel, {ticker: name})
+    """
+    columns = ['open', 'high', 'low', 'close', 'volume']
+    for strategy in strategies:
+        for spec in strategy.required_features():
+            columns.extend(spec.inputs)
+            columns.extend(spec.columns)
+    inst_columns = [s.inst_type for s in strategies if isinstance(s, InstitutionalFollowStrategy)]
+    columns = list(dict.fromkeys(columns + inst_columns))
+
+    cube = inst_data = None
+    if inst_columns:
+        cube, inst_data = institutional or load_institutional_source()[:2]
+    frames = {}
+    names = {}
+    for csv_path in tqdm(csv_paths, desc="載入中", unit="檔"):
+        try:
+            df = read_stock_file(csv_path)
+        except Exception:
+            continue
+        if len(df) < min_days or df['volume'].mean() < min_volume:
+            continue
+
+        ticker, name = parse_stock_filename(csv_path)
+        if inst_columns:
+            try:
+                inst_frame = load_institutional_frame(ticker, cube=cube, inst_data=inst_data)
+                df = merge_institutional(df, ticker, inst_frame)
+            except Exception:
+                pass  # 沒有法人資料：法人策略在這檔股票沒有訊號
+        frames[ticker] = df[[c for c in columns if c in df.columns]]
+        names[ticker] = name
+
+    return MarketPanel.from_frames(frames, columns), names
+
+
+def market_scan_panel(top_n=30, min_volume=500, min_days=60, fast_mode=False):
+    """
+    全市場掃描所有策略（面板模式）
+
+    整個市場只載入一次成 (K 棒 × 股票) 面板，每個策略的訊號、交易模擬與績效一次對所有股票計算；
+    結果與 market_scan_all_strategies 相同（各策略 TOP N 與跨策略總排名）。
+
+    Args:
+        top_n: 每個策略取前 N 名
+        min_volume: 最低平均成交量，低於此值跳過
+        min_days: 最低數據天數
+        fast_mode: 快速模式（提高成交量門檻）
+    """
+    # cube 最新時不讀逐日 JSON
+    institutional = None
+    try:
+        cube, inst_data, inst_dates = load_institutional_source()
+        institutional = (cube, inst_data)
+        print(f"✅ 已載入法人資料: {len(inst_dates)} 天")
+    except Exception:
+        print("⚠️ 無法載入法人資料，法人策略將跳過")
+
+    all_files = sorted(glob(os.path.join(STOCK_DIR, "*.csv")))
+    if fast_mode:
+        min_volume = max(min_volume, 2000)
+        print("⚡ 快速模式：只掃描高成交量股票")
+
+    strategy_configs = get_strategy_configs(True, institutional)
+    strategies = [create_strategy(strategy_type, params)
+                  for _, strategy_type, params in strategy_configs]
+    files = prefilter_stock_files(all_files, min_volume, min_days)
+
+    print(f"\n🔍 全市場掃描（面板模式）")
+    print(f"   股票數: {len(all_files)} 檔（待處理: {len(files)} 檔）")
+    print(f"   策略數: {len(strategies)} 種")
+    print()
+
+    start_time = time.time()
+    panel, names = load_market_panel(files, strategies, min_volume, min_days, institutional)
+    print(f"   面板: {panel.shape[0]} 根 K 棒 × {panel.shape[1]} 檔")
+
+    engine = BacktestEngine(mode='vectorized')
+    results = {}
+    for (strategy_name, _, _), strategy in zip(strategy_configs, strategies):
+        try:
+            table = run_panel(panel, strategy, engine)
+        except Exception as e:
+            print(f"   ⚠️ {strategy_name} 失敗: {e}")
+            results[strategy_name] = pd.DataFrame()
+            continue
+
+        table = table[table['trade_count'] >= 3].reset_index()
+        if table.empty:
+            results[strategy_name] = pd.DataFrame()
+            continue
+        table.insert(1, 'name', table['ticker'].map(names))
+        table = table[['ticker', 'name', 'total_return', 'sharpe_ratio',
+                       'max_drawdown', 'win_rate', 'trade_count']]
+        results[strategy_name] = table.sort_values('sharpe_ratio', ascending=False).head(top_n)
+
+    total_time = time.time() - start_time
+    print(f"\n⏱️ 總耗時: {total_time:.1f} 秒")
+
+    overall_ranking = compute_overall_ranking(results)
+    return results, overall_ranking
+
+
 def generate_scan_report(results: dict, overall_ranking=None, save_path: str = None, scan_time=None):
     """產生掃描報告 HTML"""
     
@@ -546,6 +756,7 @@ if __name__ == '__main__':
     parser.add_argument('--resume', action='store_true', help='從上次中斷處繼續')
     parser.add_argument('--workers', type=int, default=None, help='並行工作數')
     parser.add_argument('--min-volume', type=int, default=500, help='最低成交量（預設 500）')
+    parser.add_argument('--panel', action='store_true', help='面板模式（全市場一次載入、一次回測，不支援 --resume）')
     args = parser.parse_args()
     
     # 使用檔案鎖防止重複執行
@@ -559,13 +770,20 @@ if __name__ == '__main__':
             start_time = time.time()
             
             # 執行掃描
-            results, overall_ranking = market_scan_all_strategies(
-                top_n=30,
-                min_volume=args.min_volume,
-                fast_mode=args.fast,
-                resume=args.resume,
-                num_workers=args.workers
-            )
+            if args.panel:
+                results, overall_ranking = market_scan_panel(
+                    top_n=30,
+                    min_volume=args.min_volume,
+                    fast_mode=args.fast
+                )
+            else:
+                results, overall_ranking = market_scan_all_strategies(
+                    top_n=30,
+                    min_volume=args.min_volume,
+                    fast_mode=args.fast,
+                    resume=args.resume,
+                    num_workers=args.workers
+                )
             
             scan_time = (time.time() - start_time) / 60
             
@@ -34,16 +34,24 @@ from backtest import (
     ChipTechStrategy,
 )
 
-# 法人資料載入
+from data_loader import (
+    load_stock_cached,
+    parse_stock_filename,
+    prefilter_stock_files,
+    load_institutional_frame,
+    merge_institutional,
+)
+
+# 法人資料載入（cube 最新時只開 cube，過期才讀逐日 JSON）
 try:
-    from data_loader import load_institutional_data
-    INSTITUTIONAL_DATA = load_institutional_data()
-    HAS_INSTITUTIONAL = len(INSTITUTIONAL_DATA) > 0
+    from data_loader import load_institutional_source
+    INSTITUTIONAL_CUBE, INSTITUTIONAL_DATA, INSTITUTIONAL_DATES = load_institutional_source()
+    HAS_INSTITUTIONAL = len(INSTITUTIONAL_DATES) > 0
     # 取得法人資料的日期範圍
-    INSTITUTIONAL_DATES = sorted(INSTITUTIONAL_DATA.keys()) if INSTITUTIONAL_DATA else []
     INSTITUTIONAL_LATEST = INSTITUTIONAL_DATES[-1] if INSTITUTIONAL_DATES else None
-    print(f"✅ 已載入法人資料: {len(INSTITUTIONAL_DATA)} 天 (最新: {INSTITUTIONAL_LATEST})")
+    print(f"✅ 已載入法人資料: {len(INSTITUTIONAL_DATES)} 天 (最新: {INSTITUTIONAL_LATEST})")
 except:
+    INSTITUTIONAL_CUBE = None
     INSTITUTIONAL_DATA = {}
     HAS_INSTITUTIONAL = False
     INSTITUTIONAL_DATES = []
@@ -113,6 +121,16 @@ STRATEGY_INFO = {
 }
 
 
+def with_institutional(df, ticker):
+    """
+    截到法人資料最新日，並合併該股票的法人買賣超
+    """
+    latest = pd.Timestamp(INSTITUTIONAL_LATEST) + pd.Timedelta(days=1)
+    df_with_inst = df[pd.to_datetime(df['date']) < latest]
+    inst_frame = load_institutional_frame(ticker, INSTITUTIONAL_CUBE, INSTITUTIONAL_DATA)
+    return merge_institutional(df_with_inst, ticker, inst_frame)
+
+
 def calculate_dynamic_ranking(sample_size=50):
     """
     動態計算策略排名
@@ -143,12 +161,14 @@ def calculate_dynamic_ranking(sample_size=50):
             ("投信連買", InstitutionalFollowStrategy('trust', 3, threshold=5)),  # 極低門檻
         ]
     
-    engine = BacktestEngine()
+    engine = BacktestEngine(mode='vectorized')
     strategy_scores = {name: [] for name, _ in tech_strategies + inst_strategies}
     
+    sample_files = prefilter_stock_files(sample_files, MIN_VOLUME_THRESHOLD)
+    
     for csv_path in sample_files:
         try:
-            df = pd.read_csv(csv_path)
+            df = load_stock_cached(parse_stock_filename(csv_path)[0])
             if df['volume'].mean() < MIN_VOLUME_THRESHOLD:
                 continue
             
@@ -156,51 +176,28 @@ def calculate_dynamic_ranking(sample_size=50):
             df_recent = df.tail(60)
             ticker = os.path.basename(csv_path).split('_')[0]
             
-            # 技術分析策略
-            for name, strategy in tech_strategies:
-                try:
-                    result = engine.run(df_recent, strategy, verbose=False)
-                    if result['metrics']['trade_count'] > 0:
-                        strategy_scores[name].append(result['metrics']['sharpe_ratio'])
-                except:
-                    continue
+            # 技術分析策略（同一份資料一次回測）
+            results = engine.run_many(df_recent, [s for _, s in tech_strategies], skip_errors=True)
+            for (name, _), result in zip(tech_strategies, results):
+                if result and result['metrics']['trade_count'] > 0:
+                    strategy_scores[name].append(result['metrics']['sharpe_ratio'])
             
             # 法人策略（需要合併法人資料）
             if HAS_INSTITUTIONAL and INSTITUTIONAL_LATEST:
                 try:
-                    df_full = df.copy()
-                    df_full['date_str'] = pd.to_datetime(df_full['date']).dt.strftime('%Y%m%d')
-                    df_with_inst = df_full[df_full['date_str'] <= INSTITUTIONAL_LATEST].copy()
+                    df_with_inst = with_institutional(df, ticker)
                     
                     if len(df_with_inst) < 30:
                         continue
                     
-                    # 初始化法人欄位
-                    df_with_inst['foreign'] = 0
-                    df_with_inst['trust'] = 0
-                    df_with_inst['dealer'] = 0
-                    df_with_inst['inst_total'] = 0
-                    
-                    # 填入法人資料
-                    for i, row in df_with_inst.iterrows():
-                        date_str = row['date_str']
-                        if date_str in INSTITUTIONAL_DATA:
-                            stock_data = INSTITUTIONAL_DATA[date_str].get(ticker, {})
-                            df_with_inst.at[i, 'foreign'] = stock_data.get('foreign', 0)
-                            df_with_inst.at[i, 'trust'] = stock_data.get('trust', 0)
-                            df_with_inst.at[i, 'dealer'] = stock_data.get('dealer', 0)
-                            df_with_inst.at[i, 'inst_total'] = stock_data.get('total', 0)
-                    
                     # 只用最近 60 天
                     df_inst_recent = df_with_inst.tail(60)
                     
-                    for name, strategy in inst_strategies:
-                        try:
-                            result = engine.run(df_inst_recent, strategy, verbose=False)
-                            if result['metrics']['trade_count'] > 0:
-                                strategy_scores[name].append(result['metrics']['sharpe_ratio'])
-                        except:
-                            continue
+                    results = engine.run_many(df_inst_recent, [s for _, s in inst_strategies],
+                                              skip_errors=True)
+                    for (name, _), result in zip(inst_strategies, results):
+                        if result and result['metrics']['trade_count'] > 0:
+                            strategy_scores[name].append(result['metrics']['sharpe_ratio'])
                 except:
                     continue
         except:
@@ -242,7 +239,10 @@ def scan_recent_signals(days=5):
     回傳所有訊號 + 成交量資訊
     """
     STOCK_DIR = 'data/tw-share/dayK'
-    files = glob(os.path.join(STOCK_DIR, "*.csv"))
+    all_files = glob(os.path.join(STOCK_DIR, "*.csv"))
+    
+    # 用目錄索引先排除成交量太低的（不必讀檔）
+    files = prefilter_stock_files(all_files, MIN_VOLUME_THRESHOLD)
     
     # 技術分析策略
     strategies = [
@@ -262,13 +262,13 @@ def scan_recent_signals(days=5):
     signals_found = []
     
     print(f"\n🔍 掃描最近 {days} 個交易日的買入訊號...")
-    print(f"   股票數: {len(files)} 檔")
+    print(f"   股票數: {len(all_files)} 檔（成交量預篩後 {len(files)} 檔）")
     print(f"   成交量門檻: {MIN_VOLUME_THRESHOLD} 張/日")
     print()
     
     for csv_path in tqdm(files, desc="掃描中"):
         try:
-            df = pd.read_csv(csv_path)
+            df = load_stock_cached(parse_stock_filename(csv_path)[0])
             
             # 計算平均成交量
             avg_volume = df['volume'].mean()
@@ -308,33 +308,13 @@ def scan_recent_signals(days=5):
             
             # ===== 法人策略掃描 =====
             if HAS_INSTITUTIONAL and INSTITUTIONAL_LATEST:
-                # 合併法人資料到 DataFrame
+                # 合併法人資料到 DataFrame（只保留有法人資料的日期範圍）
                 # 使用完整資料而非 tail，因為法人資料可能只有到較早的日期
-                df_full = df.copy()
-                df_full['date_str'] = pd.to_datetime(df_full['date']).dt.strftime('%Y%m%d')
-                
-                # 只保留有法人資料的日期範圍
-                df_with_inst = df_full[df_full['date_str'] <= INSTITUTIONAL_LATEST].copy()
+                df_with_inst = with_institutional(df, ticker)
                 
                 if len(df_with_inst) < 10:
                     continue  # 資料太少，跳過
                 
-                # 初始化法人欄位
-                df_with_inst['foreign'] = 0
-                df_with_inst['trust'] = 0
-                df_with_inst['dealer'] = 0
-                df_with_inst['inst_total'] = 0
-                
-                # 填入法人資料
-                for i, row in df_with_inst.iterrows():
-                    date_str = row['date_str']
-                    if date_str in INSTITUTIONAL_DATA:
-                        stock_data = INSTITUTIONAL_DATA[date_str].get(ticker, {})
-                        df_with_inst.at[i, 'foreign'] = stock_data.get('foreign', 0)
-                        df_with_inst.at[i, 'trust'] = stock_data.get('trust', 0)
-                        df_with_inst.at[i, 'dealer'] = stock_data.get('dealer', 0)
-                        df_with_inst.at[i, 'inst_total'] = stock_data.get('total', 0)
-                
                 # 用法人策略掃描（只用有法人資料的部分）
                 for strategy_name, strategy in institutional_strategies:
                     try:
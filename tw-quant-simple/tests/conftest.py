@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+測試共用設定：專案根目錄加入 import 路徑，提供不依賴 data/ 的合成股價資料、暫存的欄式儲存與回測結果比對
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def day_k_dir(tmp_path, monkeypatch):
+    """把欄式儲存導向暫存目錄，回傳對應的 dayK 目錄（CSV 放這裡才能比對 source_mtime）"""
+    import data_store
+    store_dir = tmp_path / 'tw-share' / 'store'
+    monkeypatch.setattr(data_store, 'STORE_DIR', str(store_dir))
+    monkeypatch.setattr(data_store, 'CATALOG_FILE', str(store_dir / 'catalog.json'))
+    monkeypatch.setattr(data_store, 'CATALOG_LOCK', str(store_dir / 'catalog.lock'))
+    day_k = tmp_path / 'tw-share' / 'dayK'
+    day_k.mkdir(parents=True)
+    return day_k
+
+
+def make_ohlcv(n: int = 400, seed: int = 0, start: str = '2020-01-01', drift: float = 0.0003) -> pd.DataFrame:
+    """隨機漫步的日 K 資料（date 為字串，由舊到新）"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(drift, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, n))
+    dates = pd.bdate_range(start, periods=n).strftime('%Y-%m-%d')
+    return pd.DataFrame({
+        'date': dates,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.integers(1_000, 50_000, n) * 1000,
+    })
+
+
+TRADE_FIELDS = ['bar', 'side', 'price', 'shares', 'amount', 'pnl', 'entry']
+
+
+def assert_same_result(result: dict, expected: dict):
+    """兩個 BacktestEngine 結果的交易紀錄逐欄、權益曲線逐點、績效指標逐項相同（NaN 視為相等）"""
+    for name in TRADE_FIELDS:
+        np.testing.assert_array_equal(result['trades'].column(name), expected['trades'].column(name),
+                                      err_msg=name)
+    assert [t.get('reason') for t in result['trades']] == [t.get('reason') for t in expected['trades']]
+    assert np.array_equal(np.asarray(result['equity_curve'], dtype=float),
+                          np.asarray(expected['equity_curve'], dtype=float), equal_nan=True)
+    assert result['equity_curve'].index.equals(expected['equity_curve'].index)
+    assert result['metrics'].keys() == expected['metrics'].keys()
+    for key, value in expected['metrics'].items():
+        other = result['metrics'][key]
+        if isinstance(value, float) and np.isnan(value):
+            assert isinstance(other, float) and np.isnan(other), key
+        else:
+            assert other == value, key
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+read_stock_file：欄式儲存與 CSV 兩條路徑回傳的資料必須完全相同
+"""
+import pandas as pd
+import pytest
+
+import data_loader
+import data_store
+
+CSV_TEXT = (
+    "\ufeffDate,Open,High,Low,Close,Volume,Name,Stock Splits\n"
+    "2024-01-03 00:00:00+08:00,101,103,100,102.5,2000,台積電,0.0\n"
+    "2024-01-02 00:00:00+08:00,100,102,99,101.0,1000,台積電,0.0\n"
+    "2024-01-04 00:00:00+08:00,102,104,101,,1500,台積電,0.0\n"
+)
+
+
+@pytest.fixture
+def store(day_k_dir):
+    csv_path = day_k_dir / '2330.TW_台積電.csv'
+    csv_path.write_text(CSV_TEXT, encoding='utf-8')
+    return str(csv_path)
+
+
+@pytest.mark.parametrize('columns', [None, ['close', 'volume'], ['Volume', 'date', 'close'],
+                                     ['close', 'name', 'missing']])
+def test_store_and_csv_return_same_frame(store, columns):
+    from_csv = data_loader.read_stock_file(store, columns)
+
+    data_store.write_stock('2330.TW', pd.read_csv(store), source='2330.TW_台積電.csv')
+    assert data_store.is_fresh('2330.TW', store)
+    from_store = data_loader.read_stock_file(store, columns)
+
+    pd.testing.assert_frame_equal(from_csv, from_store)
+    assert from_csv['date'].is_monotonic_increasing
+    assert 'name' not in from_csv.columns
+
+
+def test_start_keeps_row_labels(store):
+    from_csv = data_loader.read_stock_file(store, ['close'], start=1)
+    data_store.write_stock('2330.TW', pd.read_csv(store), source='2330.TW_台積電.csv')
+    from_store = data_loader.read_stock_file(store, ['close'], start=1)
+
+    pd.testing.assert_frame_equal(from_csv, from_store)
+    assert list(from_store.index) == [1, 2]
+
+
+def test_institutional_source_reads_json_only_when_cube_is_stale(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, 'INSTITUTIONAL_DIR', str(tmp_path))
+    for d in ['20240102', '20240103']:
+        (tmp_path / f'{d}.json').write_text('{"2330.TW": {"foreign": 1}}', encoding='utf-8')
+
+    cube, inst_data, dates = data_loader.load_institutional_source()
+    assert sorted(inst_data) == dates == ['20240102', '20240103']
+
+    data_store.update_institutional_cube(str(tmp_path))
+    monkeypatch.setattr(data_loader, 'load_institutional_data', lambda: pytest.fail("cube 最新時不應讀 JSON"))
+    cube, inst_data, dates = data_loader.load_institutional_source()
+    assert inst_data is None
+    assert dates == ['20240102', '20240103']
+    assert data_loader.load_institutional_frame('2330.TW', cube)['foreign'].tolist() == [1, 1]
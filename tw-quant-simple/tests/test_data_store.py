@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import json
+
+import data_store
+
+
+def write_day(inst_dir, date_str, rows):
+    (inst_dir / f"{date_str}.json").write_text(json.dumps(rows), encoding='utf-8')
+
+
+def cube_dates(inst_dir):
+    return data_store.load_institutional_cube(str(inst_dir))[0]
+
+
+def test_cube_freshness_compares_dates(tmp_path):
+    for d in ['20240102', '20240103', '20240104']:
+        write_day(tmp_path, d, {'2330': {'foreign': 1, 'trust': 2, 'dealer': 3, 'total': 6}})
+    assert data_store.update_institutional_cube(str(tmp_path)) == 3
+    assert data_store.institutional_cube_is_fresh(cube_dates(tmp_path), str(tmp_path))
+
+    # 補抓較早的日期、同時移除一個檔案：JSON 天數沒有變多、最後一天也沒變，但 cube 缺了補抓的那天
+    (tmp_path / '20240103.json').unlink()
+    write_day(tmp_path, '20231229', {'2330': {'foreign': 9}})
+    assert not data_store.institutional_cube_is_fresh(cube_dates(tmp_path), str(tmp_path))
+
+    assert data_store.update_institutional_cube(str(tmp_path)) == 1
+    assert cube_dates(tmp_path) == ['20231229', '20240102', '20240103', '20240104']
+    assert data_store.institutional_cube_is_fresh(cube_dates(tmp_path), str(tmp_path))
+
+
+def test_unreadable_json_is_recorded_and_retried(tmp_path):
+    write_day(tmp_path, '20240102', {'2330': {'foreign': 1}})
+    (tmp_path / '20240103.json').write_text('{壞掉', encoding='utf-8')
+    assert data_store.update_institutional_cube(str(tmp_path)) == 1
+
+    # 壞掉的檔案記在 index.json，cube 仍視為最新（不會每次都退回讀逐日 JSON）
+    index = json.loads((tmp_path / 'cube' / 'index.json').read_text(encoding='utf-8'))
+    assert index['skipped'] == ['20240103']
+    assert data_store.institutional_cube_is_fresh(cube_dates(tmp_path), str(tmp_path))
+    assert data_store.update_institutional_cube(str(tmp_path)) == 0
+
+    # 檔案修好後下次更新會併入
+    write_day(tmp_path, '20240103', {'2330': {'foreign': 5}})
+    assert data_store.update_institutional_cube(str(tmp_path)) == 1
+    assert cube_dates(tmp_path) == ['20240102', '20240103']
+    df = data_store.read_institutional('2330', str(tmp_path))
+    assert df['foreign'].tolist() == [1, 5]
+    index = json.loads((tmp_path / 'cube' / 'index.json').read_text(encoding='utf-8'))
+    assert index['skipped'] == []
+
+
+def test_only_unreadable_json(tmp_path):
+    (tmp_path / '20240102.json').write_text('', encoding='utf-8')
+    assert data_store.update_institutional_cube(str(tmp_path)) == 0
+    dates = cube_dates(tmp_path)
+    assert dates == []
+    assert data_store.institutional_cube_is_fresh(dates, str(tmp_path))
+    assert data_store.read_institutional('2330', str(tmp_path)).empty
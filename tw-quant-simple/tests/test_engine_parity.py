@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+BacktestEngine 三種模式（loop / vectorized / kernel）的結果必須完全一致；
+停損停利、部位規模與冷靜期等路徑相依規則（kernels.simulate）則與以 RiskManager、
+PositionSizer 物件逐日計算的參考迴圈比對。
+"""
+import numpy as np
+import pytest
+
+from backtest import kernels
+from backtest.engine import BacktestEngine
+from backtest.risk import RiskManager, PositionSizer
+from backtest.strategy import MACrossStrategy, RSIStrategy, BollingerStrategy, TurtleStrategy
+from backtest.tradelog import SIDE_BUY, SIDE_SELL
+from conftest import make_ohlcv, assert_same_result, TRADE_FIELDS
+
+MODES = ['loop', 'vectorized', 'kernel']
+
+
+def random_signals(n: int, seed: int, p_trade: float = 0.1) -> np.ndarray:
+    """隨機的 1 / -1 / 0 訊號（約 p_trade 比例的 K 棒有買或賣訊號）"""
+    rng = np.random.default_rng(seed)
+    return rng.choice([1.0, -1.0, 0.0], size=n, p=[p_trade / 2, p_trade / 2, 1 - p_trade])
+
+
+def run_all_modes(close, signals, position_size=1.0, **engine_kwargs) -> dict:
+    return {mode: BacktestEngine(mode=mode, **engine_kwargs).run_arrays(
+                close, signals, position_size=position_size)
+            for mode in MODES}
+
+
+def assert_modes_agree(results):
+    for mode in MODES[1:]:
+        assert_same_result(results[mode], results['loop'])
+
+
+# ========== 三種模式 ==========
+
+@pytest.mark.parametrize('seed', range(8))
+@pytest.mark.parametrize('position_size', [1.0, 0.5])
+def test_random_signals(seed, position_size):
+    close = make_ohlcv(500, seed=seed)['close'].to_numpy()
+    signals = random_signals(len(close), seed + 100)
+    results = run_all_modes(close, signals, position_size)
+    assert len(results['loop']['trades']) > 4
+    assert_modes_agree(results)
+
+
+@pytest.mark.parametrize('strategy', [MACrossStrategy(5, 20), RSIStrategy(), BollingerStrategy(),
+                                      TurtleStrategy()], ids=lambda s: s.name)
+def test_strategies(strategy):
+    df = make_ohlcv(600, seed=11)
+    results = {mode: BacktestEngine(mode=mode).run(df, strategy) for mode in MODES}
+    assert_modes_agree(results)
+
+
+@pytest.mark.parametrize('value', [0.0, 1.0, -1.0])
+def test_constant_signals(value):
+    close = make_ohlcv(200, seed=1)['close'].to_numpy()
+    results = run_all_modes(close, np.full(len(close), value))
+    assert len(results['loop']['trades']) == (1 if value == 1 else 0)
+    assert_modes_agree(results)
+
+
+def test_capital_too_small_for_one_share():
+    # 價格約 100，資金 150：有時買得起一股，跌價後的賣出收入不夠時就買不起
+    close = make_ohlcv(400, seed=5)['close'].to_numpy()
+    signals = random_signals(len(close), 7, p_trade=0.3)
+    results = run_all_modes(close, signals, initial_capital=150)
+    assert_modes_agree(results)
+
+    results = run_all_modes(close, signals, initial_capital=50)
+    assert len(results['loop']['trades']) == 0
+    assert_modes_agree(results)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_missing_prices_do_not_trade(seed):
+    close = make_ohlcv(300, seed=seed)['close'].to_numpy().copy()
+    rng = np.random.default_rng(seed)
+    close[rng.choice(len(close) - 1, 30, replace=False)] = np.nan
+    signals = random_signals(len(close), seed + 50, p_trade=0.3)
+    results = run_all_modes(close, signals)
+
+    trades = results['loop']['trades']
+    assert len(trades) > 0
+    assert not np.isnan(trades.column('price')).any()
+    assert_modes_agree(results)
+
+
+# ========== 路徑相依規則（一律走 kernel） ==========
+
+def reference_run(close, signals, risk_manager=None, position_sizer=None, cooldown=0,
+                  initial_capital=1_000_000, commission=0.001425, tax=0.003, slippage=0.001) -> dict:
+    """以 RiskManager.check_exit 與 PositionSizer.get_shares 逐日計算的參考實作"""
+    capital = initial_capital
+    position = 0
+    entry_price = 0.0
+    last_exit = None
+    closed = []
+    trades = {name: [] for name in ['bar', 'side', 'price', 'shares', 'amount', 'pnl', 'entry']}
+    reasons = []
+    equity = []
+
+    def record(bar, side, price, shares, amount, pnl, entry, reason):
+        for name, value in zip(trades, (bar, side, price, shares, amount, pnl, entry)):
+            trades[name].append(value)
+        reasons.append(reason)
+
+    for i, (price, signal) in enumerate(zip(close.tolist(), signals.tolist())):
+        equity.append(capital + position * price)
+        reason = None
+        if position > 0 and price > 0 and risk_manager is not None:
+            reason = risk_manager.check_exit(entry_price, price)
+        if position > 0 and price > 0 and (reason is not None or signal == -1):
+            sell_price = price * (1 - slippage)
+            revenue = position * sell_price
+            net_revenue = revenue - revenue * commission - revenue * tax
+            profit = net_revenue - entry_price * position
+            record(i, SIDE_SELL, sell_price, position, net_revenue, profit, entry_price, reason)
+            capital += net_revenue
+            position = 0
+            entry_price = 0.0
+            last_exit = i
+            closed.append(profit)
+        elif (signal == 1 and position == 0 and price > 0
+              and (last_exit is None or i - last_exit >= cooldown)):
+            buy_price = price * (1 + slippage)
+            if position_sizer is None:
+                shares = int(capital / buy_price)
+            else:
+                wins = [p for p in closed if p > 0]
+                losses = [p for p in closed if p < 0]
+                win_rate = len(wins) / len(closed) if closed else 0
+                ratio = abs((sum(wins) / len(wins)) / (sum(losses) / len(losses))) if wins and losses else 0
+                shares = position_sizer.get_shares(capital, buy_price, win_rate, ratio)
+            if shares > 0:
+                cost = shares * buy_price
+                capital -= cost + cost * commission
+                position = shares
+                entry_price = buy_price
+                if risk_manager is not None:
+                    risk_manager.reset()
+                record(i, SIDE_BUY, buy_price, shares, cost + cost * commission, 0.0, 0.0, None)
+
+    equity[-1] = capital + position * close[-1]
+    return {'trades': trades, 'reasons': reasons, 'equity': np.array(equity)}
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('rules', [
+    {'stop_loss_pct': 0.05},
+    {'take_profit_pct': 0.05},
+    {'trailing_stop_pct': 0.06},
+    {'stop_loss_pct': 0.04, 'take_profit_pct': 0.1, 'trailing_stop_pct': 0.05},
+], ids=['stop', 'take', 'trailing', 'all'])
+def test_risk_exits_match_reference(seed, rules):
+    close = make_ohlcv(500, seed=seed)['close'].to_numpy()
+    signals = random_signals(len(close), seed + 200, p_trade=0.04)
+    expected = reference_run(close, signals, RiskManager(**rules))
+
+    results = {mode: BacktestEngine(mode=mode, risk_manager=RiskManager(**rules)).run_arrays(close, signals)
+               for mode in MODES}
+    assert_modes_agree(results)
+    assert_matches_reference(results['loop'], expected)
+    assert any(expected['reasons']), "停損停利規則應該要被觸發"
+
+
+def assert_matches_reference(result, expected):
+    trades = result['trades']
+    for name in TRADE_FIELDS:
+        np.testing.assert_array_equal(trades.column(name), expected['trades'][name], err_msg=name)
+    sell_reasons = [r for r, side in zip(expected['reasons'], expected['trades']['side']) if side == SIDE_SELL]
+    assert [t.get('reason') for t in trades if t['type'] == 'SELL'] == sell_reasons
+    np.testing.assert_array_equal(np.asarray(result['equity_curve']), expected['equity'])
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('sizer', [('percent', 0.3), ('fixed_amount', 250_000), ('kelly', 0)],
+                         ids=lambda s: s[0])
+@pytest.mark.parametrize('cooldown', [0, 5])
+def test_sizing_and_cooldown_match_reference(seed, sizer, cooldown):
+    close = make_ohlcv(600, seed=seed, drift=0.001)['close'].to_numpy()
+    signals = random_signals(len(close), seed + 300, p_trade=0.2)
+    rules = {'stop_loss_pct': 0.05, 'trailing_stop_pct': 0.08}
+    expected = reference_run(close, signals, RiskManager(**rules), PositionSizer(*sizer), cooldown)
+
+    engine = BacktestEngine(risk_manager=RiskManager(**rules), position_sizer=PositionSizer(*sizer),
+                            cooldown_days=cooldown)
+    result = engine.run_arrays(close, signals)
+    assert len(result['trades']) >= 4
+    assert_matches_reference(result, expected)
+
+    if cooldown:
+        trades = result['trades']
+        bars, sides = trades.column('bar'), trades.column('side')
+        sells = bars[:-1][sides[:-1] == SIDE_SELL]
+        next_buys = bars[1:][sides[:-1] == SIDE_SELL]
+        assert (next_buys - sells >= cooldown).all()
+
+
+@pytest.mark.skipif(not kernels.NUMBA_AVAILABLE, reason="未安裝 numba")
+@pytest.mark.parametrize('seed', range(3))
+def test_compiled_kernel_matches_python(seed):
+    close = make_ohlcv(500, seed=seed)['close'].to_numpy()
+    signals = random_signals(len(close), seed + 400, p_trade=0.2)
+    args = (close, signals, 1_000_000, 0.001425, 0.003, 0.001)
+    kwargs = dict(position_sizer=PositionSizer('kelly', 0),
+                  risk_manager=RiskManager(stop_loss_pct=0.05, trailing_stop_pct=0.08), cooldown=3)
+    compiled = kernels.simulate(*args, use_numba=True, **kwargs)
+    python = kernels.simulate(*args, use_numba=False, **kwargs)
+    assert compiled.keys() == python.keys()
+    for key in python:
+        np.testing.assert_array_equal(compiled[key], python[key], err_msg=key)
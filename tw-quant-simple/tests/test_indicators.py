@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+技術指標增量計算：每天接上新列後的結果必須與整份重算相同
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loader
+import data_store
+import indicators
+from conftest import make_ohlcv
+
+
+@pytest.fixture
+def raw():
+    df = make_ohlcv(400, seed=3)
+    df['date'] = pd.to_datetime(df['date'])
+    return df
+
+
+def append_rows(csv_path, raw, stop):
+    """模擬每日下載：舊資料接上新列後整份寫回（新列的指標欄為 NaN）"""
+    old = data_loader.read_stock_file(csv_path)
+    combined = pd.concat([old, data_store.normalize_frame(raw.iloc[len(old):stop])], ignore_index=True)
+    data_loader.save_stock_file(csv_path, combined)
+
+
+def run_daily(day_k_dir, raw, stops):
+    csv_path = str(day_k_dir / '2330.TW_台積電.csv')
+    data_loader.save_stock_file(csv_path, raw.iloc[:stops[0]])
+    assert indicators.add_indicators_to_csv(csv_path)
+    for stop in stops[1:]:
+        append_rows(csv_path, raw, stop)
+        assert indicators.add_indicators_to_csv(csv_path)
+    return csv_path
+
+
+def assert_matches_full(csv_path, raw):
+    expected = data_store.normalize_frame(indicators.calculate_all_indicators(raw.copy()))
+    got = data_loader.read_stock_file(csv_path)
+    # 視窗類指標以滑動和計算，起點不同只差在捨入；接上新列時 obv 會由 int64 變成 float64
+    pd.testing.assert_frame_equal(got, expected, check_exact=False, rtol=1e-9, check_dtype=False)
+    pd.testing.assert_frame_equal(data_store.normalize_frame(pd.read_csv(csv_path)), got,
+                                  check_exact=False, rtol=1e-12)
+    assert data_store.read_indicator_state('2330.TW')['rows'] == len(raw)
+
+
+def test_incremental_matches_full(day_k_dir, raw):
+    csv_path = run_daily(day_k_dir, raw, [300, 303, 340, 400])
+    assert_matches_full(csv_path, raw)
+
+
+@pytest.mark.parametrize('nan_rows', [[380], [341, 399]])
+def test_missing_close_falls_back_to_full(day_k_dir, raw, nan_rows):
+    # pandas 的 ewm 會跳過缺值；接續遞迴會讓 EMA / MACD 之後全變 NaN
+    raw.loc[nan_rows, 'close'] = np.nan
+    csv_path = run_daily(day_k_dir, raw, [300, 340, 400])
+    assert_matches_full(csv_path, raw)
+    assert not data_loader.read_stock_file(csv_path)['ema12'].iloc[-1:].isna().any()
+
+
+def test_incremental_reads_only_the_tail(day_k_dir, raw, monkeypatch):
+    csv_path = run_daily(day_k_dir, raw, [300])
+    append_rows(csv_path, raw, 305)
+
+    reads = []
+    read_column = data_store.read_column
+    with monkeypatch.context() as m:
+        m.setattr(data_store, 'read_column', lambda ticker, column, meta=None, mmap=False, start=0: (
+            reads.append((column, start)) or read_column(ticker, column, meta, mmap, start)))
+        m.setattr(data_store, 'write_stock', lambda *args, **kwargs: pytest.fail("不應整份改寫"))
+        assert indicators.add_indicators_to_csv(csv_path)
+
+    start = 300 - indicators.STATE_TAIL_ROWS
+    # 整欄只讀日期（比對起始日、目錄索引的日期範圍）與成交量（目錄索引的均量）
+    assert {s for column, s in reads if column not in ('date', 'volume')} == {start}
+    assert {s for column, s in reads if column in ('date', 'volume')} == {0, start}
+    assert_matches_full(csv_path, raw.iloc[:305])
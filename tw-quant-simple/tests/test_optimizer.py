@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""MASweep 的均線交叉掃描結果必須與 BacktestEngine.run(MACrossStrategy) 相同"""
+from itertools import product
+
+import numpy as np
+import pytest
+
+from backtest.engine import BacktestEngine
+from backtest.optimizer import MASweep, evaluate_grid
+from backtest.risk import RiskManager
+from backtest.strategy import MACrossStrategy
+from conftest import make_ohlcv, assert_same_result
+
+GRID = [(3, 20), (5, 20), (10, 60), (20, 120), (7, 9), (20, 5)]
+
+
+@pytest.mark.parametrize('mode', ['vectorized', 'loop', 'kernel'])
+@pytest.mark.parametrize('seed', range(3))
+def test_sweep_matches_run(mode, seed):
+    df = make_ohlcv(600, seed=seed)
+    engine = BacktestEngine(mode=mode)
+    sweep = MASweep(df, engine)
+    for short_period, long_period in GRID:
+        strategy = MACrossStrategy(short_period, long_period)
+        expected = engine.run(df, strategy)
+        result = sweep.run(strategy)
+        assert_same_result(result, expected)
+        np.testing.assert_array_equal(result['signals'], expected['signals'].to_numpy())
+
+
+def test_sweep_uses_existing_columns_like_run():
+    # 欄位大寫、且已有（刻意與收盤價無關的）ma5 欄位時，兩者都沿用既有欄位
+    df = make_ohlcv(400, seed=5).rename(columns=str.upper)
+    df['MA5'] = np.linspace(90, 130, len(df))
+    engine = BacktestEngine(mode='vectorized')
+    assert_same_result(MASweep(df, engine).run(MACrossStrategy(5, 20)),
+                       engine.run(df, MACrossStrategy(5, 20)))
+
+
+def test_sweep_with_path_dependent_engine():
+    df = make_ohlcv(600, seed=6)
+    engine = BacktestEngine(risk_manager=RiskManager(stop_loss_pct=0.05, trailing_stop_pct=0.1))
+    sweep = MASweep(df, engine)
+    for short_period, long_period in GRID:
+        strategy = MACrossStrategy(short_period, long_period)
+        assert_same_result(sweep.run(strategy), engine.run(df, strategy))
+
+
+def test_grid_matches_individual_runs():
+    df = make_ohlcv(600, seed=7)
+    engine = BacktestEngine(mode='vectorized')
+    combos = list(product([3, 5, 10], [20, 60]))
+    outcomes = evaluate_grid(engine, df, MACrossStrategy, ['short_period', 'long_period'], combos,
+                             progress=False)
+    assert [params for params, _, _ in outcomes] == [
+        {'short_period': s, 'long_period': l} for s, l in combos]
+    for params, metrics, error in outcomes:
+        assert error is None
+        assert metrics == engine.run(df, MACrossStrategy(**params))['metrics']
+
+    best = engine.optimize(df, MACrossStrategy, {'short_period': [3, 5, 10], 'long_period': [20, 60]})
+    scores = [metrics['sharpe_ratio'] for _, metrics, _ in outcomes]
+    assert best['best_params'] == outcomes[int(np.argmax(scores))][0]
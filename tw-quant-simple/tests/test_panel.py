@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""全市場面板（MarketPanel / run_panel）的指標、訊號與績效必須與逐檔計算相同"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest.engine import BacktestEngine
+from backtest.features import Feature, ATR, MA, RSI, KD, MACD, BBANDS, EMA, VolumeMA, ensure_features
+from backtest.panel import MarketPanel, run_panel, PANEL_METRICS, PANEL_STRATEGIES
+from backtest.risk import RiskManager
+from backtest.strategy import (MACrossStrategy, RSIStrategy, KDStrategy, MACDStrategy, BollingerStrategy,
+                               InstitutionalFollowStrategy, MomentumBreakoutStrategy,
+                               VolumeBreakoutStrategy, TurtleStrategy, MeanReversionStrategy)
+from conftest import make_ohlcv
+
+STRATEGIES = [
+    MACrossStrategy(5, 20), MACrossStrategy(10, 60), RSIStrategy(), KDStrategy(), MACDStrategy(),
+    BollingerStrategy(), InstitutionalFollowStrategy('foreign', 3, 100),
+    MomentumBreakoutStrategy(20, 1.2), VolumeBreakoutStrategy(1.5, 0.01), TurtleStrategy(20, 10),
+    MeanReversionStrategy(),
+]
+
+
+def make_frames() -> dict:
+    """長度不同的幾檔股票；其中一檔已有（與收盤價無關的）ma5 欄位"""
+    frames = {}
+    for k, n in enumerate([500, 320, 500, 40, 410]):
+        df = make_ohlcv(n, seed=k, start=f'201{k}-01-01')
+        df['foreign'] = np.random.default_rng(k).integers(-2000, 2000, n)
+        frames[f'{1100 + k}.TW'] = df
+    frames['1102.TW']['ma5'] = np.linspace(80, 120, 500)
+    return frames
+
+
+def prepared(df: pd.DataFrame, strategy) -> pd.DataFrame:
+    df = df.copy()
+    ensure_features(df, strategy.required_features())
+    return df
+
+
+def test_strategy_list_covers_panel_strategies():
+    assert set(PANEL_STRATEGIES) <= {type(s) for s in STRATEGIES}
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES, ids=lambda s: s.name)
+def test_signals_match_generate_signals(strategy):
+    frames = make_frames()
+    panel = MarketPanel.from_frames(frames).ensure_features(strategy.required_features())
+    signals = panel.signals(strategy)
+    for j, df in enumerate(frames.values()):
+        expected = strategy.generate_signals(prepared(df, strategy)).to_numpy()
+        np.testing.assert_array_equal(signals[:len(df), j], expected)
+        assert not signals[len(df):, j].any()
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES, ids=lambda s: s.name)
+@pytest.mark.parametrize('engine', [BacktestEngine(mode='vectorized'),
+                                    BacktestEngine(initial_capital=3000),
+                                    BacktestEngine(risk_manager=RiskManager(stop_loss_pct=0.05))],
+                         ids=['vectorized', 'small_capital', 'risk'])
+def test_run_panel_matches_engine_run(strategy, engine):
+    frames = make_frames()
+    table = run_panel(MarketPanel.from_frames(frames), strategy, engine)
+    for ticker, df in frames.items():
+        metrics = engine.run(df, strategy)['metrics']
+        assert table.loc[ticker].tolist() == [metrics[name] for name in PANEL_METRICS], ticker
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES, ids=lambda s: s.name)
+def test_run_panel_with_missing_close(strategy):
+    # 進出場當天收盤價缺值的股票改逐檔模擬（逐列不成交，之後的訊號再嘗試）
+    frames = make_frames()
+    rng = np.random.default_rng(7)
+    for k, df in enumerate(frames.values()):
+        if k != 3:
+            df.loc[rng.choice(len(df) - 1, 15, replace=False), 'close'] = np.nan
+    frames['1101.TW'].loc[[10, 11], 'close'] = [0.0, -1.0]
+    engine = BacktestEngine(mode='vectorized')
+
+    table = run_panel(MarketPanel.from_frames(frames), strategy, engine)
+    for ticker, df in frames.items():
+        metrics = engine.run(df, strategy)['metrics']
+        assert table.loc[ticker].tolist() == [metrics[name] for name in PANEL_METRICS], ticker
+
+
+def test_missing_close_on_entry_bar():
+    df = make_ohlcv(400, seed=1)
+    df['foreign'] = np.random.default_rng(1).integers(-2000, 2000, 400)
+    df.loc[49, 'close'] = np.nan
+    strategy = InstitutionalFollowStrategy('foreign', 3, 100)
+    engine = BacktestEngine(mode='vectorized')
+
+    metrics = engine.run(df, strategy)['metrics']
+    table = run_panel(MarketPanel.from_frames({'1101.TW': df}), strategy, engine)
+    assert np.isfinite(table.loc['1101.TW', 'final_capital'])
+    assert table.loc['1101.TW'].tolist() == [metrics[name] for name in PANEL_METRICS]
+
+
+def test_subclass_uses_its_own_generate_signals():
+    class Inverted(MACrossStrategy):
+        def generate_signals(self, df):
+            return -super().generate_signals(df)
+
+    frames = make_frames()
+    strategy = Inverted(5, 20)
+    panel = MarketPanel.from_frames(frames).ensure_features(strategy.required_features())
+    signals = panel.signals(strategy)
+    for j, df in enumerate(frames.values()):
+        np.testing.assert_array_equal(signals[:len(df), j],
+                                      strategy.generate_signals(prepared(df, strategy)).to_numpy())
+
+
+class Spread(Feature):
+    """跨欄位運算、沒有宣告 columnwise 的自訂指標"""
+
+    inputs = ('high', 'low')
+
+    @property
+    def columns(self):
+        return ('spread',)
+
+    def compute(self, frame):
+        both = pd.concat([frame['high'], frame['low']], axis=1)
+        return {'spread': both.max(axis=1) - both.min(axis=1)}
+
+
+@pytest.mark.parametrize('spec', [MA(5), MA(60), EMA(12), RSI(), RSI(6), KD(), MACD(), BBANDS(),
+                                  VolumeMA(20), ATR(), ATR(5), Spread()], ids=repr)
+def test_ensure_features_matches_per_ticker(spec):
+    frames = make_frames()
+    panel = MarketPanel.from_frames(frames).ensure_features([spec])
+    for j, df in enumerate(frames.values()):
+        df = df.copy()
+        ensure_features(df, [spec])
+        for col in spec.columns:
+            np.testing.assert_array_equal(panel[col][:len(df), j], df[col].to_numpy(dtype=float),
+                                          err_msg=col)
+
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+compare_portfolio_strategies：每個策略的結果必須與各自單獨執行 PortfolioEngine.run 相同
+"""
+import numpy as np
+import pytest
+
+from backtest.portfolio import PortfolioEngine, PortfolioData
+from backtest.portfolio_batch import compare_portfolio_strategies, COMPARE_COLUMNS
+from backtest.strategy_portfolio import EqualWeightMonthlyStrategy, BuyAndHoldStrategy, DCAStrategy
+from conftest import make_ohlcv
+
+UNIVERSE = {f'{2000 + k}.TW': make_ohlcv(220, seed=60 + k).iloc[k * 7:].reset_index(drop=True)
+            for k in range(5)}
+
+STRATEGIES = {
+    '等權重 每月': lambda: EqualWeightMonthlyStrategy(freq='monthly'),
+    '等權重 每週': lambda: EqualWeightMonthlyStrategy(freq='weekly', top_n=3),
+    '停損停利後買回': lambda: BuyAndHoldStrategy(stop_loss=-0.05, take_profit=0.08, mode='rebuy',
+                                          cooldown_days=5),
+    '定期定額': lambda: DCAStrategy(buy_day=10, monthly_amount=30000),
+}
+
+
+def assert_same_run(result, expected, name):
+    np.testing.assert_array_equal(result['equity_curve'].to_numpy(), expected['equity_curve'].to_numpy(),
+                                  err_msg=name)
+    assert result['trades'].equals(expected['trades']), name
+    assert result['metrics'] == expected['metrics'], name
+    assert result['positions'] == expected['positions'], name
+
+
+@pytest.mark.parametrize('num_workers', [1, 2])
+def test_matches_separate_runs(num_workers, capsys):
+    engine = PortfolioEngine(initial_capital=500_000)
+    result = compare_portfolio_strategies({t: df.copy() for t, df in UNIVERSE.items()},
+                                          {name: make() for name, make in STRATEGIES.items()},
+                                          engine=engine, num_workers=num_workers)
+
+    assert list(result['table'].index) == list(STRATEGIES)
+    assert list(result['table'].columns) == COMPARE_COLUMNS
+    assert list(result['equity_curves'].columns) == list(STRATEGIES)
+    for name, make in STRATEGIES.items():
+        expected = engine.run({t: df.copy() for t, df in UNIVERSE.items()}, make())
+        assert_same_run(result['results'][name], expected, name)
+        np.testing.assert_array_equal(result['equity_curves'][name].to_numpy(),
+                                      expected['equity_curve'].to_numpy())
+        assert result['table'].loc[name, 'total_return'] == expected['metrics']['total_return']
+
+
+def test_each_run_starts_from_a_fresh_copy(capsys):
+    # 同一個（會記錄再平衡狀態的）策略物件出現兩次：兩次結果相同，原物件不被改動
+    strategy = DCAStrategy(buy_day=10, monthly_amount=30000)
+    result = compare_portfolio_strategies(PortfolioData({t: df.copy() for t, df in UNIVERSE.items()}),
+                                          [strategy, strategy])
+
+    assert list(result['results']) == [strategy.name, f'{strategy.name} #2']
+    first, second = result['results'].values()
+    assert_same_run(second, first, strategy.name)
+    assert strategy.last_buy_month is None and strategy.is_first_buy
+
+
+def test_no_strategies():
+    with pytest.raises(ValueError):
+        compare_portfolio_strategies(UNIVERSE, {})
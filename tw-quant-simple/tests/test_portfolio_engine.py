@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+PortfolioEngine（對齊後的陣列狀態 + 唯讀檢視）與逐日、逐檔以 dict 計算的參考實作結果必須完全相同
+"""
+import numpy as np
+import pytest
+
+from backtest.portfolio import PortfolioEngine, PortfolioData
+from backtest.strategy_portfolio import (
+    EqualWeightMonthlyStrategy,
+    BuyAndHoldStrategy,
+    DCAStrategy,
+    StrategyDrivenPortfolio,
+)
+from conftest import make_ohlcv
+
+
+def make_universe() -> dict:
+    """錯開上市日、隨機缺日、偶有收盤價缺值的股票池，外加一檔不交易的指數（代碼以 _ 開頭）"""
+    rng = np.random.default_rng(21)
+    data = {}
+    for k in range(6):
+        df = make_ohlcv(260, seed=30 + k).iloc[int(rng.integers(1, 30)) if k else 0:]
+        df = df.drop(df.sample(frac=0.05, random_state=k).index).reset_index(drop=True)
+        if k == 2:
+            df.loc[rng.choice(len(df), 5, replace=False), 'close'] = np.nan
+        df['ma5'] = df['close'].rolling(5).mean()
+        df['ma20'] = df['close'].rolling(20).mean()
+        data[f'{2000 + k}.TW'] = df
+    data['_IDX'] = make_ohlcv(260, seed=99).iloc[5:].reset_index(drop=True)
+    return data
+
+
+def reference_run(data_map, strategy, initial_capital=1_000_000, commission=0.001425, tax=0.003,
+                  slippage=0.001, lot_size=1) -> dict:
+    """每天以 {ticker: dict} 的資料列與 {ticker: dict} 的持倉呼叫策略，逐檔先賣後買"""
+    lookup = {t: df.set_index('date').to_dict('index') for t, df in data_map.items()}
+    dates = sorted(set().union(*lookup.values()))
+    tickers = list(data_map)
+    cash = initial_capital
+    positions = {t: {'shares': 0, 'avg_cost': 0.0} for t in tickers}
+    last_price = {t: 0.0 for t in tickers}
+    equity = []
+    trades = []
+
+    def buy(date, t, shares, price, reason):
+        nonlocal cash
+        cost = shares * price
+        total_cost = cost + cost * commission
+        if cash < total_cost:
+            return
+        cash -= total_cost
+        old = positions[t]
+        new_shares = old['shares'] + shares
+        positions[t] = {'shares': new_shares,
+                        'avg_cost': (old['shares'] * old['avg_cost'] + total_cost) / new_shares}
+        trades.append((date, t, 'BUY', shares, price, total_cost, 0.0, reason))
+
+    for date in dates:
+        rows = {t: lookup[t][date] for t in tickers if date in lookup[t]}
+        for t, row in rows.items():
+            if not np.isnan(row['close']):
+                last_price[t] = row['close']
+        market_value = 0.0
+        for t in tickers:
+            market_value += positions[t]['shares'] * last_price[t]
+        total_equity = cash + market_value
+        equity.append(total_equity)
+        if not rows:
+            continue
+
+        weights = strategy.rebalance_signal(date, list(rows), rows, positions)
+        if weights is None:
+            continue
+        tradable = [t for t in rows if not t.startswith('_') and rows[t]['close'] > 0]
+
+        if weights.pop('_dca_mode', False):
+            amount = weights.pop('_monthly_amount', 0)
+            first = weights.pop('_is_first_buy', False)
+            if first:
+                budget = cash
+            else:
+                cash += amount
+                budget = amount
+            if budget <= 0:
+                continue
+            per_ticker = budget / len(rows)
+            for t in tradable:
+                price = rows[t]['close'] * (1 + slippage)
+                shares = int(per_ticker / (price * (1 + commission + slippage)))
+                shares -= shares % lot_size
+                if shares > 0:
+                    buy(date, t, shares, price, '初始資金買入' if first else '定期定額買入')
+            continue
+
+        for t in tradable:
+            price = rows[t]['close']
+            target = int(total_equity * weights.get(t, 0.0) / price)
+            target -= target % lot_size
+            held = positions[t]['shares']
+            if target < held:
+                shares = held - target
+                sell_price = price * (1 - slippage)
+                revenue = shares * sell_price
+                net_revenue = revenue - revenue * commission - revenue * tax
+                pnl = net_revenue - shares * positions[t]['avg_cost']
+                cash += net_revenue
+                positions[t] = {'shares': target, 'avg_cost': positions[t]['avg_cost'] if target else 0.0}
+                trades.append((date, t, 'SELL', shares, sell_price, net_revenue, pnl, '再平衡賣出'))
+        for t in tradable:
+            price = rows[t]['close']
+            target = int(total_equity * weights.get(t, 0.0) / (price * (1 + commission + slippage)))
+            target -= target % lot_size
+            if target > positions[t]['shares']:
+                buy(date, t, target - positions[t]['shares'], price * (1 + slippage), '再平衡買入')
+
+    return {
+        'equity': equity,
+        'trades': trades,
+        'positions': {t: p['shares'] for t, p in positions.items() if p['shares'] > 0},
+        'final_prices': {t: last_price[t] for t, p in positions.items() if p['shares'] > 0},
+        'cash': cash,
+    }
+
+
+UNIVERSE = make_universe()
+
+STRATEGIES = {
+    'ew_monthly': lambda: EqualWeightMonthlyStrategy(freq='monthly'),
+    'ew_weekly_top3': lambda: EqualWeightMonthlyStrategy(freq='weekly', top_n=3),
+    'diamond': lambda: BuyAndHoldStrategy(mode='diamond'),
+    'rebuy': lambda: BuyAndHoldStrategy(stop_loss=-0.05, take_profit=0.08, trailing_stop=-0.06,
+                                        mode='rebuy', cooldown_days=5),
+    'multilayer': lambda: BuyAndHoldStrategy(mode='multilayer',
+                                             extra_buys=[{'date': '2020-04-01', 'amount': 100000}]),
+    'dca': lambda: DCAStrategy(buy_day=10, monthly_amount=30000),
+    'strategy_driven': lambda: StrategyDrivenPortfolio(default_strategy='MA5x20'),
+}
+
+
+@pytest.mark.parametrize('name', STRATEGIES)
+@pytest.mark.parametrize('lot_size', [1, 1000])
+def test_matches_dict_reference(name, lot_size, capsys):
+    engine = PortfolioEngine(lot_size=lot_size)
+    result = engine.run({t: df.copy() for t, df in UNIVERSE.items()}, STRATEGIES[name]())
+    expected = reference_run(UNIVERSE, STRATEGIES[name](), lot_size=lot_size)
+
+    assert len(expected['trades']) > 0
+    np.testing.assert_array_equal(result['equity_curve'].to_numpy(), expected['equity'])
+    trades = result['trades']
+    actual = list(zip(trades['date'], trades['ticker'], trades['type'], trades['shares'],
+                      trades['price'], trades['amount'], trades['profit'], trades['reason']))
+    assert actual == expected['trades']
+    assert result['positions'] == expected['positions']
+    assert result['final_prices'] == expected['final_prices']
+    assert result['metrics']['cash'] == round(expected['cash'], 2)
+
+
+def test_dca_skips_missing_close(capsys):
+    data = {t: df.copy() for t, df in UNIVERSE.items()}
+    df = data['2001.TW']
+    buy_dates = df['date'][df['date'].str[8:10] >= '10'].groupby(df['date'].str[:7]).first()
+    df.loc[df['date'].isin(buy_dates), 'close'] = np.nan
+
+    result = PortfolioEngine().run(data, DCAStrategy(buy_day=10, monthly_amount=30000))
+    expected = reference_run(data, DCAStrategy(buy_day=10, monthly_amount=30000))
+    trades = result['trades']
+    assert '2001.TW' not in set(trades['ticker'])
+    assert len(trades) == len(expected['trades'])
+    np.testing.assert_array_equal(result['equity_curve'].to_numpy(), expected['equity'])
+
+
+def test_shared_data_gives_same_result(capsys):
+    data = PortfolioData({t: df.copy() for t, df in UNIVERSE.items()})
+    engine = PortfolioEngine()
+    for name, make in STRATEGIES.items():
+        shared = engine.run(data, make())
+        fresh = engine.run({t: df.copy() for t, df in UNIVERSE.items()}, make())
+        assert shared['metrics'] == fresh['metrics'], name
+        assert shared['trades'].equals(fresh['trades']), name
+
+
+def test_strategy_views_are_read_only(capsys):
+    seen = {}
+
+    class Probe(EqualWeightMonthlyStrategy):
+        def rebalance_signal(self, date, available_tickers, data_slice, positions):
+            ticker = available_tickers[0]
+            seen['row'] = dict(data_slice[ticker])
+            with pytest.raises(TypeError):
+                data_slice[ticker]['close'] = 0
+            with pytest.raises(TypeError):
+                positions[ticker]['shares'] = 1
+            return super().rebalance_signal(date, available_tickers, data_slice, positions)
+
+    PortfolioEngine().run({t: df.copy() for t, df in UNIVERSE.items()}, Probe(freq='monthly'))
+    assert {'open', 'high', 'low', 'close', 'volume', 'ma5'} <= set(seen['row'])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""策略登記呼叫日（schedule）後的結果必須與每天呼叫 rebalance_signal 完全相同"""
+import numpy as np
+import pytest
+
+from backtest.portfolio import PortfolioEngine
+from backtest.strategy_portfolio import (
+    EqualWeightMonthlyStrategy,
+    BuyAndHoldStrategy,
+    DCAStrategy,
+    StrategyDrivenPortfolio,
+)
+from backtest.trading_calendar import TradingCalendar
+from conftest import make_ohlcv
+
+
+def make_universe(n_tickers: int = 8, n: int = 300) -> dict:
+    """錯開上市日、隨機缺幾天的股票池（第二檔比第一檔晚一天上市，第一天之後的再平衡才會有交易）"""
+    rng = np.random.default_rng(7)
+    data = {}
+    for k in range(n_tickers):
+        start = k if k < 2 else int(rng.integers(2, 40))
+        df = make_ohlcv(n, seed=k).iloc[start:]
+        if k >= 2:
+            df = df.drop(df.sample(frac=0.05, random_state=k).index)
+        df = df.reset_index(drop=True)
+        df['ma5'] = df['close'].rolling(5).mean()
+        df['ma20'] = df['close'].rolling(20).mean()
+        data[f'{1000 + k}.TW'] = df
+    return data
+
+
+UNIVERSE = make_universe()
+FIRST_DATE = min(df['date'].iloc[0] for df in UNIVERSE.values())
+
+STRATEGIES = {
+    'ew_weekly': lambda: EqualWeightMonthlyStrategy(freq='weekly', top_n=5),
+    'ew_monthly': lambda: EqualWeightMonthlyStrategy(freq='monthly'),
+    'ew_quarterly': lambda: EqualWeightMonthlyStrategy(freq='quarterly'),
+    'diamond': lambda: BuyAndHoldStrategy(mode='diamond'),
+    'rebuy': lambda: BuyAndHoldStrategy(stop_loss=-0.05, take_profit=0.1, mode='rebuy', cooldown_days=10),
+    'multilayer_first_day': lambda: BuyAndHoldStrategy(
+        mode='multilayer', extra_buys=[{'date': FIRST_DATE, 'amount': 100000}]),
+    'multilayer_before_start': lambda: BuyAndHoldStrategy(
+        mode='multilayer', extra_buys=[{'date': '2000-01-01', 'amount': 50000},
+                                       {'date': FIRST_DATE, 'amount': 50000}]),
+    'multilayer_same_day': lambda: BuyAndHoldStrategy(
+        mode='multilayer', extra_buys=[{'date': '2020-03-02', 'amount': 100000},
+                                       {'date': '2020-03-01', 'amount': 100000},
+                                       {'date': '2020-06-15', 'amount': 100000},
+                                       {'date': '2099-01-01', 'amount': 1}]),
+    'dca_day1': lambda: DCAStrategy(buy_day=1, monthly_amount=20000),
+    'dca_day17': lambda: DCAStrategy(buy_day=17, monthly_amount=20000),
+    'dca_day31': lambda: DCAStrategy(buy_day=31, monthly_amount=20000),
+    'strategy_driven': lambda: StrategyDrivenPortfolio(default_strategy='MA5x20'),
+}
+
+
+def run(strategy):
+    return PortfolioEngine().run({t: df.copy() for t, df in UNIVERSE.items()}, strategy)
+
+
+@pytest.mark.parametrize('name', list(STRATEGIES))
+def test_schedule_matches_daily_calls(name):
+    scheduled = run(STRATEGIES[name]())
+    daily_strategy = STRATEGIES[name]()
+    daily_strategy.schedule = lambda calendar: None
+    daily = run(daily_strategy)
+
+    assert scheduled['equity_curve'].equals(daily['equity_curve'])
+    assert scheduled['trades'].equals(daily['trades'])
+    assert scheduled['positions'] == daily['positions']
+
+
+def test_multilayer_extra_buy_on_first_day_executes():
+    result = run(STRATEGIES['multilayer_first_day']())
+    # 初始買入與加碼是兩個不同的交易日
+    assert result['trades']['date'].nunique() == 2
+
+
+def test_calendar_queries():
+    calendar = TradingCalendar(['2024-01-30', '2024-01-31', '2024-02-01', '2024-02-05',
+                                '2024-02-16', '2024-02-19', '2024-03-01'])
+    assert calendar.period_starts('monthly').tolist() == [True, False, True, False, False, False, True]
+    assert calendar.weekdays(0).tolist() == [False, False, False, True, False, True, False]
+    assert np.flatnonzero(calendar.month_days_on_or_after(15)).tolist() == [0, 4]
+    assert np.flatnonzero(calendar.month_days_on_or_after(15, nth=2)).tolist() == [1, 5]
+    assert calendar.on_or_after('2024-02-02', 2).tolist() == [3, 4]
+    assert calendar.on_or_after('2025-01-01').tolist() == []
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Rebalancer 的陣列計算必須與逐檔先賣後買的純量計算完全相同"""
+import numpy as np
+import pytest
+
+from backtest.rebalance import Rebalancer, target_shares, LOT_SIZE_ODD, LOT_SIZE_ROUND
+
+
+def reference_rebalance(cash, shares, avg_cost, prices, weights, total_equity, tradable,
+                        commission=0.001425, tax=0.003, slippage=0.001, lot_size=1):
+    """逐檔計算：先依序賣出，再依序買入（現金不足的股票跳過）"""
+    shares = shares.copy()
+    avg_cost = avg_cost.copy()
+    trades = []
+    skipped = 0
+    tradable = [bool(t) and p > 0 for t, p in zip(tradable, prices)]
+    for j, price in enumerate(prices):
+        if not tradable[j]:
+            continue
+        target = int(total_equity * weights[j] / price)
+        target -= target % lot_size
+        if target < shares[j]:
+            n = int(shares[j]) - target
+            revenue = n * (price * (1 - slippage))
+            net_revenue = revenue - revenue * commission - revenue * tax
+            trades.append(('SELL', j, n, net_revenue, net_revenue - n * float(avg_cost[j])))
+            cash += net_revenue
+            shares[j] -= n
+            if shares[j] == 0:
+                avg_cost[j] = 0.0
+    cost_factor = 1 + commission + slippage
+    for j, price in enumerate(prices):
+        if not tradable[j]:
+            continue
+        target = int(total_equity * weights[j] / (price * cost_factor))
+        target -= target % lot_size
+        if target > shares[j]:
+            n = target - int(shares[j])
+            cost = n * (price * (1 + slippage))
+            total_cost = cost + cost * commission
+            if cash >= total_cost:
+                cash -= total_cost
+                old = int(shares[j])
+                avg_cost[j] = (old * float(avg_cost[j]) + total_cost) / (old + n)
+                shares[j] = old + n
+                trades.append(('BUY', j, n, total_cost, 0.0))
+            else:
+                skipped += 1
+    return cash, shares, avg_cost, trades, skipped
+
+
+def random_case(rng):
+    n = int(rng.integers(1, 40))
+    prices = rng.uniform(5, 900, n)
+    prices[rng.random(n) < 0.05] = np.nan
+    shares = (rng.integers(0, 5, n) * rng.choice([1, 37, 1000])).astype(np.int64)
+    avg_cost = np.where(shares > 0, rng.uniform(5, 900, n), 0.0)
+    weights = rng.dirichlet(np.ones(n)) * rng.uniform(0.5, 2.5)
+    weights[rng.random(n) < 0.3] = 0
+    tradable = rng.random(n) < 0.9
+    cash = float(rng.uniform(0, 3e6))
+    total_equity = cash + float(np.nansum(shares * prices))
+    return cash, shares, avg_cost, prices, weights, total_equity, tradable
+
+
+@pytest.mark.parametrize('lot_size', [LOT_SIZE_ODD, LOT_SIZE_ROUND])
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_scalar_reference(seed, lot_size):
+    rng = np.random.default_rng(seed)
+    rebalancer = Rebalancer(lot_size=lot_size)
+    skipped = 0
+    for _ in range(300):
+        cash, shares, avg_cost, prices, weights, total_equity, tradable = random_case(rng)
+        expected = reference_rebalance(cash, shares, avg_cost, prices, weights, total_equity, tradable,
+                                       lot_size=lot_size)
+
+        new_shares, new_avg_cost = shares.copy(), avg_cost.copy()
+        new_cash, sells, buys = rebalancer.rebalance(cash, new_shares, new_avg_cost, prices, weights,
+                                                     total_equity, tradable)
+        trades = ([('SELL', int(j), int(n), float(a), float(p))
+                   for j, n, a, p in zip(sells.ticker, sells.shares, sells.amount, sells.pnl)]
+                  + [('BUY', int(j), int(n), float(a), 0.0)
+                     for j, n, a in zip(buys.ticker, buys.shares, buys.amount)])
+        assert new_cash == expected[0]
+        np.testing.assert_array_equal(new_shares, expected[1])
+        np.testing.assert_array_equal(new_avg_cost, expected[2])
+        assert trades == expected[3]
+        # 買入後的持股是整數張（零股持股賣出後也只剩整張）
+        assert not (new_shares[buys.ticker] % lot_size).any()
+        assert not (new_shares[sells.ticker] % lot_size).any()
+        skipped += expected[4]
+    # 現金不足、逐檔檢查的路徑要被測到
+    assert skipped > 0
+
+
+def test_buys_stop_at_first_unaffordable_then_continue():
+    # 第二檔買不起，第三檔較便宜仍然買得到
+    rebalancer = Rebalancer(commission=0, tax=0, slippage=0)
+    shares = np.zeros(3, dtype=np.int64)
+    avg_cost = np.zeros(3)
+    prices = np.array([10.0, 100.0, 1.0])
+    weights = np.array([0.5, 0.6, 0.05])
+    cash, sells, buys = rebalancer.rebalance(550.0, shares, avg_cost, prices, weights, 1000.0,
+                                             np.ones(3, dtype=bool))
+    assert len(sells) == 0
+    assert buys.ticker.tolist() == [0, 2]
+    assert shares.tolist() == [50, 0, 50]
+    assert cash == 0.0
+
+
+def test_round_lot_targets():
+    shares = target_shares(1_000_000, np.array([0.5, 0.3, 0.2, 0.0]), np.array([99.0, 600.0, np.nan, 10.0]),
+                           lot_size=LOT_SIZE_ROUND)
+    assert shares[0] == 5000 and shares[1] == 0 and np.isnan(shares[2]) and shares[3] == 0
+    with pytest.raises(ValueError):
+        Rebalancer(lot_size=0)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""BacktestEngine.run_many 的結果必須與逐一呼叫 run() 相同"""
+import numpy as np
+import pytest
+
+from backtest.engine import BacktestEngine
+from backtest.risk import RiskManager
+from backtest.strategy import (Strategy, MACrossStrategy, RSIStrategy, KDStrategy, MACDStrategy,
+                               BollingerStrategy, MeanReversionStrategy, TurtleStrategy)
+from conftest import make_ohlcv, assert_same_result
+
+
+def strategies() -> list:
+    return [MACrossStrategy(5, 20), MACrossStrategy(10, 60), RSIStrategy(), KDStrategy(),
+            MACDStrategy(), BollingerStrategy(), MeanReversionStrategy(), TurtleStrategy(20, 10)]
+
+
+class BrokenStrategy(Strategy):
+    def generate_signals(self, df):
+        raise RuntimeError("壞掉的策略")
+
+
+@pytest.mark.parametrize('mode', ['vectorized', 'loop', 'kernel'])
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_individual_runs(mode, seed):
+    df = make_ohlcv(700, seed=seed)
+    engine = BacktestEngine(mode=mode)
+    results = engine.run_many(df, strategies(), position_size=0.8)
+    for strategy, result in zip(strategies(), results):
+        assert_same_result(result, engine.run(df, strategy, position_size=0.8))
+        np.testing.assert_array_equal(np.asarray(result['signals'], dtype=float),
+                                      np.asarray(strategy.generate_signals(engine._prepare(
+                                          df, strategy.required_features())), dtype=float))
+
+
+def test_path_dependent_engine_matches_individual_runs():
+    df = make_ohlcv(700, seed=4)
+    engine = BacktestEngine(mode='vectorized', risk_manager=RiskManager(stop_loss_pct=0.05),
+                            cooldown_days=3)
+    for strategy, result in zip(strategies(), engine.run_many(df, strategies())):
+        assert_same_result(result, engine.run(df, strategy))
+
+
+def test_does_not_modify_input():
+    df = make_ohlcv(300, seed=1)
+    before = df.copy()
+    BacktestEngine(mode='vectorized').run_many(df, strategies())
+    assert df.equals(before)
+
+
+def test_skip_errors():
+    df = make_ohlcv(300, seed=2)
+    engine = BacktestEngine(mode='vectorized')
+    with pytest.raises(RuntimeError):
+        engine.run_many(df, [MACrossStrategy(), BrokenStrategy()])
+
+    results = engine.run_many(df, [MACrossStrategy(), BrokenStrategy(), RSIStrategy()], skip_errors=True)
+    assert results[1] is None
+    assert_same_result(results[0], engine.run(df, MACrossStrategy()))
+    assert_same_result(results[2], engine.run(df, RSIStrategy()))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from backtest.optimizer import StrategyOptimizer
+from backtest.search import ParameterSearch, SuccessiveHalving
+from backtest.strategy import MACrossStrategy
+from conftest import make_ohlcv
+
+DF = make_ohlcv(1500, seed=11, drift=0.0005)
+
+
+def make_search(space=None):
+    return ParameterSearch(DF, MACrossStrategy,
+                           space or {'short_period': [5, 10], 'long_period': [60]}, min_trades=1)
+
+
+def test_halving_default_budget_reaches_full_history():
+    search = make_search()
+    best = search.optimize('halving', seed=0, verbose=False)
+    assert best is not None
+    assert best.bars == search.n_bars
+    assert {t.bars for t in search.trials} == set(SuccessiveHalving().rungs(search.n_bars))
+
+
+def test_halving_default_budget_is_sum_of_rungs():
+    search = make_search({'short_period': list(range(3, 30)), 'long_period': [40, 60, 120]})
+    sampler = SuccessiveHalving(n_candidates=27, min_bars=120, eta=3, seed=0)
+    # 1500 根：120 → 360 → 1080 → 1500，候選 27 → 9 → 3 → 1
+    assert sampler.default_trials(search) == 27 + 9 + 3 + 1
+    search.optimize(sampler, verbose=False)
+    assert len(search.trials) == 40
+    assert search.best.bars == search.n_bars
+
+
+def test_truncated_halving_promotes_leader_to_full_history():
+    search = make_search({'short_period': list(range(3, 30)), 'long_period': [40, 60, 120]})
+    best = search.optimize(SuccessiveHalving(seed=0), n_trials=5, verbose=False)
+    assert best is not None and best.bars == search.n_bars
+    assert len(search.trials) == 6
+    assert all(t.bars == 120 for t in search.trials[:5])
+
+
+def test_best_ignores_short_window_trials():
+    search = make_search()
+    search.evaluate({'short_period': 5, 'long_period': 60}, bars=200)
+    assert search.best is None
+    assert search.leader().bars == 200
+    full = search.evaluate({'short_period': 10, 'long_period': 60})
+    assert search.best is full
+
+
+@pytest.mark.parametrize('metric', ['sharpe_ratio', 'max_drawdown', 'total_return'])
+def test_optimizer_search_ranks_best_first(metric, capsys):
+    space = {'short_period': [3, 5, 10], 'long_period': [20, 40, 60]}
+    optimizer = StrategyOptimizer(min_trades=1)
+    results = optimizer.search(DF, MACrossStrategy, space, sampler='grid', metric=metric)
+
+    search = ParameterSearch(DF, MACrossStrategy, space, metric=metric, engine=optimizer.engine,
+                             min_trades=1)
+    best = search.optimize('grid', verbose=False)
+    assert results.iloc[0][list(space)].to_dict() == best.params
+    assert results[metric].is_monotonic_decreasing
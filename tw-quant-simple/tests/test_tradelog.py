@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import pickle
+
+import numpy as np
+
+from backtest.tradelog import TradeLog, SIDE_BUY, SIDE_SELL
+
+
+def test_unpickled_empty_log_can_grow():
+    log = pickle.loads(pickle.dumps(TradeLog(['2024-01-02', '2024-01-03'], tickers=['A'])))
+    log.append(0, SIDE_BUY, 10.0, 100, 1000.0, ticker='A')
+    log.extend(1, SIDE_SELL, np.full(3, 11.0), 10, 110.0, pnl=5.0, ticker=np.zeros(3, dtype=int))
+    assert len(log) == 4
+    assert [t['type'] for t in log] == ['BUY', 'SELL', 'SELL', 'SELL']
+
+
+def test_pickle_round_trip_keeps_records():
+    log = TradeLog(['2024-01-02', '2024-01-03'])
+    log.append(0, SIDE_BUY, 10.0, 100, 1000.0)
+    log.append(1, SIDE_SELL, 11.0, 100, 1090.0, pnl=90.0, entry=10.0, reason='停利')
+    restored = pickle.loads(pickle.dumps(log))
+    assert restored.to_dicts() == log.to_dicts()
+    restored.append(1, SIDE_BUY, 12.0, 10, 120.0)
+    assert len(restored) == 3
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from backtest.engine import BacktestEngine
+from backtest.strategy import MACrossStrategy
+from backtest.tradelog import SIDE_SELL
+from backtest.walkforward import WalkForward, walk_forward_windows, _run_test_window
+from conftest import make_ohlcv
+
+
+def test_windows_cover_history_without_overlap():
+    windows = walk_forward_windows(1000, 300, 100)
+    assert windows[0] == (0, 300, 300, 400)
+    assert [w[2] for w in windows[1:]] == [w[3] for w in windows[:-1]]
+    assert windows[-1][3] == 1000
+
+
+@pytest.mark.parametrize('mode', ['vectorized', 'loop', 'kernel'])
+def test_test_windows_end_flat_with_sell_costs(mode):
+    df = make_ohlcv(900, seed=3, drift=0.001)
+    engine = BacktestEngine(mode=mode)
+    wf = WalkForward(MACrossStrategy, {'short_period': [5, 10], 'long_period': [20, 60]},
+                     train_bars=300, test_bars=150, engine=engine)
+    result = wf.run(df, verbose=False)
+
+    trades = result['trades']
+    sides = [t['type'] for t in trades]
+    assert sides, "合成資料應該要有交易"
+    # 每段都平倉：買賣交錯，最後一筆是賣出
+    assert sides[::2] == ['BUY'] * len(sides[::2])
+    assert sides[1::2] == ['SELL'] * len(sides[1::2])
+    assert len(sides) % 2 == 0
+
+    metrics = result['metrics']
+    profits = [t['profit'] for t in trades if t['type'] == 'SELL']
+    assert metrics['win_rate'] == pytest.approx(np.mean([p > 0 for p in profits]), abs=1e-4)
+    assert metrics['total_profit'] == pytest.approx(sum(p for p in profits if p > 0), abs=0.01)
+
+
+@pytest.mark.parametrize('mode', ['vectorized', 'loop', 'kernel'])
+def test_test_window_ends_in_cash_after_sell_costs(mode):
+    df = make_ohlcv(200, seed=5, drift=0.002)
+    engine = BacktestEngine(mode=mode)
+    result = _run_test_window(engine, df, MACrossStrategy(5, 20))
+
+    trades = result['trades']
+    assert len(trades) and trades.column('side')[-1] == SIDE_SELL
+    assert trades.column('bar')[-1] == len(df) - 1
+    # 最後一天的權益 = 初始資金 - 買入成本 + 賣出淨收入
+    signed = np.where(trades.column('side') == SIDE_SELL, 1.0, -1.0) * trades.column('amount')
+    assert result['equity_curve'].iloc[-1] == pytest.approx(engine.initial_capital + signed.sum())
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Web 投組 API：/api/portfolio/compare 與 /api/portfolio/run 共用的資料載入與策略建構
+（需要 fastapi 與 apscheduler，沒有安裝時略過）
+"""
+import asyncio
+import importlib.util
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('apscheduler')
+
+import data_loader
+from backtest.portfolio import PortfolioEngine
+from conftest import ROOT, make_ohlcv
+
+spec = importlib.util.spec_from_file_location('web_app', os.path.join(ROOT, 'web', 'app.py'))
+web_app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(web_app)
+
+UNIVERSE = {f'{2000 + k}.TW': make_ohlcv(220, seed=80 + k) for k in range(4)}
+UNIVERSE['2004.TW'] = make_ohlcv(20, seed=84)  # 資料不足 30 筆，會被略過
+
+
+@pytest.fixture(autouse=True)
+def stock_data(monkeypatch):
+    def load_stock_cached(ticker, *args, **kwargs):
+        df = UNIVERSE[ticker].copy()
+        df['date'] = pd.to_datetime(df['date'])
+        return df.iloc[::-1].reset_index(drop=True)  # 故意倒序，確認會依日期排序
+
+    monkeypatch.setattr(data_loader, 'load_stock_cached', load_stock_cached)
+    monkeypatch.setattr(web_app, 'resolve_ticker', lambda t: t if t in UNIVERSE else None)
+
+
+def test_load_portfolio_data(monkeypatch):
+    data_map = web_app._load_portfolio_data(list(UNIVERSE) + ['9999.TW'], '2020-02-01', '2020-09-30')
+    assert list(data_map) == ['2000.TW', '2001.TW', '2002.TW', '2003.TW']
+    for df in data_map.values():
+        assert df['date'].is_monotonic_increasing
+        assert df['date'].iloc[0] >= '2020-02-01' and df['date'].iloc[-1] <= '2020-09-30'
+
+    monkeypatch.setattr(web_app, 'PORTFOLIO_MAX_TICKERS', 2)
+    assert list(web_app._load_portfolio_data(list(UNIVERSE))) == ['2000.TW', '2001.TW']
+
+    with pytest.raises(web_app.HTTPException) as exc:
+        web_app._load_portfolio_data(['9999.TW'])
+    assert exc.value.status_code == 404
+
+
+@pytest.mark.parametrize('cfg', [
+    {'strategy': 'equal_weight', 'rebalance_freq': 'quarterly'},
+    {'strategy': 'buy_hold', 'buy_hold_mode': 'rebuy', 'stop_loss': -0.05, 'take_profit': 0.1},
+    {'strategy': 'buy_hold', 'buy_hold_mode': 'multilayer',
+     'extra_buys': [{'date': '2020-03-02', 'amount': 100000}]},
+    {'strategy': 'dca', 'dca_day': 5, 'dca_amount': 20000},
+])
+def test_build_portfolio_strategy(cfg):
+    strategy, name = web_app._build_portfolio_strategy(web_app.PortfolioVariant(**cfg))
+    assert name
+    assert hasattr(strategy, 'rebalance_signal')
+
+
+def test_compare_matches_single_runs(capsys):
+    variants = [web_app.PortfolioVariant(strategy='equal_weight'),
+                web_app.PortfolioVariant(strategy='dca', dca_day=10, dca_amount=30000),
+                web_app.PortfolioVariant(strategy='equal_weight')]
+    req = web_app.PortfolioCompareRequest(tickers=list(UNIVERSE), initial_capital=500_000,
+                                          start_date='2020-02-01', variants=variants)
+    response = asyncio.run(web_app.compare_portfolio_backtest(req))
+
+    data_map = web_app._load_portfolio_data(req.tickers, req.start_date)
+    assert response['tickers'] == list(data_map)
+    names = [web_app._build_portfolio_strategy(cfg)[1] for cfg in variants]
+    assert [r['strategy'] for r in response['results']] == [names[0], names[1], f'{names[0]} #2']
+
+    dates = response['equity_curves']['dates']
+    for cfg, row in zip(variants, response['results']):
+        expected = PortfolioEngine(initial_capital=500_000).run(
+            web_app._load_portfolio_data(req.tickers, req.start_date), web_app._build_portfolio_strategy(cfg)[0])
+        assert row['final_value'] == round(float(expected['equity_curve'].iloc[-1]), 0)
+        assert row['metrics'] == web_app._portfolio_metrics(expected['metrics'])
+        np.testing.assert_array_equal(response['equity_curves']['series'][row['strategy']],
+                                      expected['equity_curve'].round(0).tolist())
+        assert len(dates) == len(expected['equity_curve'])
+
+
+def test_compare_requires_variants():
+    req = web_app.PortfolioCompareRequest(tickers=list(UNIVERSE), variants=[])
+    with pytest.raises(web_app.HTTPException) as exc:
+        asyncio.run(web_app.compare_portfolio_backtest(req))
+    assert exc.value.status_code == 400
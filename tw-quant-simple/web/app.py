@@ -24,6 +24,8 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 # 專案根目錄
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 REPORTS_DIR = os.path.join(BASE_DIR, "reports")
+PORTFOLIO_MAX_TICKERS = 200  # 投組回測最多股票數
+PORTFOLIO_MAX_VARIANTS = 20  # 投組策略比較最多策略數
 sys.path.insert(0, BASE_DIR)
 
 # 全域狀態
@@ -403,13 +405,24 @@ def normalize_ticker(ticker: str) -> str:
     # 純數字，嘗試加 .TW
     return f"{ticker}.TW"
 
+def resolve_ticker(ticker: str) -> str:
+    """標準化股票代碼並確認有資料（.TW 找不到時改試 .TWO），找不到回傳 None"""
+    from data_loader import find_stock_file
+    
+    ticker = normalize_ticker(ticker)
+    if find_stock_file(ticker):
+        return ticker
+    if ticker.endswith('.TW') and find_stock_file(ticker + 'O'):
+        return ticker + 'O'
+    return None
+
 @app.post("/api/backtest/single")
 async def run_single_backtest(req: BacktestRequest):
     """執行單股回測"""
     try:
-        from glob import glob
-        from data_loader import load_stock_with_institutional, find_stock_file
+        from data_loader import load_stock_cached
         from backtest.engine import BacktestEngine
+        from backtest.tradelog import TradeLog
         from backtest.strategy import (
             MACrossStrategy, RSIStrategy, MACDStrategy,
             MomentumBreakoutStrategy, TurtleStrategy,
@@ -417,16 +430,9 @@ async def run_single_backtest(req: BacktestRequest):
             VolumeBreakoutStrategy
         )
         
-        # 標準化股票代碼
-        ticker = normalize_ticker(req.ticker)
-        
-        # 先嘗試 .TW，不行再試 .TWO
-        csv_path = find_stock_file(ticker)
-        if not csv_path and ticker.endswith('.TW'):
-            ticker = ticker.replace('.TW', '.TWO')
-            csv_path = find_stock_file(ticker)
-        
-        if not csv_path:
+        # 標準化股票代碼（先嘗試 .TW，不行再試 .TWO）
+        ticker = resolve_ticker(req.ticker)
+        if not ticker:
             raise HTTPException(404, f"找不到 {req.ticker} 的資料")
         
         import pandas as pd  # 確保 pd 在所有情況下都可用
@@ -434,12 +440,8 @@ async def run_single_backtest(req: BacktestRequest):
         # 判斷是否需要法人資料
         needs_institutional = req.strategy in ['外資連買', '投信連買', '外資連買3天', '外資連買5天', '投信連買3天', '投信連買5天']
         
-        if needs_institutional:
-            # 使用 data_loader 載入包含法人資料的股票
-            df = load_stock_with_institutional(ticker)
-        else:
-            df = pd.read_csv(csv_path)
-            df.columns = [c.lower() for c in df.columns]
+        # 使用 data_loader 快取載入（需要時包含法人資料）
+        df = load_stock_cached(ticker, include_institutional=needs_institutional)
         
         df = df.sort_values('date')
         
@@ -473,13 +475,7 @@ async def run_single_backtest(req: BacktestRequest):
         }
         strategy = strategy_map.get(req.strategy, MACrossStrategy(5, 20))
         
-        # 自訂均線時，動態計算 MA 欄位
-        if req.strategy == "MA_Custom":
-            short_p = req.short_period or 5
-            long_p = req.long_period or 20
-            price_col = 'close' if 'close' in df.columns else 'Close'
-            df[f'ma{short_p}'] = df[price_col].rolling(short_p).mean()
-            df[f'ma{long_p}'] = df[price_col].rolling(long_p).mean()
+        # 策略需要的指標欄位（含自訂均線）由引擎依 required_features() 補算
         
         # 使用用戶指定的初始資金
         engine = BacktestEngine(initial_capital=req.capital)
@@ -494,7 +490,7 @@ async def run_single_backtest(req: BacktestRequest):
         # 準備交易明細（最近 30 筆）
         trades_list = []
         
-        # 處理 trades（可能是 DataFrame 或 list）
+        # 處理 trades（可能是 DataFrame、TradeLog 或 list）
         if isinstance(trades_raw, pd.DataFrame) and not trades_raw.empty:
             for _, row in trades_raw.tail(30).iterrows():
                 trades_list.append({
@@ -504,8 +500,9 @@ async def run_single_backtest(req: BacktestRequest):
                     'shares': int(row.get('shares', 0)),
                     'profit': round(row.get('profit', 0), 0) if row.get('type') == 'SELL' else None
                 })
-        elif isinstance(trades_raw, list) and len(trades_raw) > 0:
-            for t in trades_raw[-30:]:
+        elif isinstance(trades_raw, (TradeLog, list)) and len(trades_raw) > 0:
+            recent = trades_raw.tail(30) if isinstance(trades_raw, TradeLog) else trades_raw[-30:]
+            for t in recent:
                 trades_list.append({
                     'date': str(t.get('date', ''))[:10],
                     'type': t.get('type', ''),
@@ -562,16 +559,13 @@ async def run_batch_backtest(req: BatchBacktestRequest):
 
 # ==================== 投資組合 ====================
 
-class PortfolioRequest(BaseModel):
-    tickers: List[str]
-    initial_capital: float = 1000000
+class PortfolioVariant(BaseModel):
+    """投組策略設定"""
     strategy: str = "equal_weight"  # equal_weight, buy_hold, dca
     stop_loss: Optional[float] = None  # 停損 (如 -0.10)
     take_profit: Optional[float] = None  # 停利 (如 0.30)
     dca_day: int = 1  # 定期定額買入日 (1-28)
     dca_amount: Optional[float] = None  # 定期定額每月投入金額
-    start_date: Optional[str] = None  # 開始日期 YYYY-MM-DD
-    end_date: Optional[str] = None  # 結束日期 YYYY-MM-DD
     # 等權重策略參數
     rebalance_freq: str = "monthly"  # weekly, monthly, quarterly
     # 買入持有策略參數
@@ -580,91 +574,123 @@ class PortfolioRequest(BaseModel):
     rebuy_amount: str = "all"  # all, original
     extra_buys: Optional[List[dict]] = None  # 多層次鑽石手加碼時間表 [{"date": "2024-12-05", "amount": 100000}]
 
+class PortfolioRequest(PortfolioVariant):
+    tickers: List[str]
+    initial_capital: float = 1000000
+    start_date: Optional[str] = None  # 開始日期 YYYY-MM-DD
+    end_date: Optional[str] = None  # 結束日期 YYYY-MM-DD
+
+class PortfolioCompareRequest(BaseModel):
+    tickers: List[str]
+    initial_capital: float = 1000000
+    start_date: Optional[str] = None  # 開始日期 YYYY-MM-DD
+    end_date: Optional[str] = None  # 結束日期 YYYY-MM-DD
+    variants: List[PortfolioVariant]  # 要比較的策略設定
+
+def _load_portfolio_data(tickers: list, start_date: str = None, end_date: str = None) -> dict:
+    """讀取投組股票資料 {ticker: DataFrame}（日期轉成字串，依日期範圍過濾）"""
+    from data_loader import load_stock_cached
+    
+    data_map = {}
+    for ticker in tickers[:PORTFOLIO_MAX_TICKERS]:
+        resolved = resolve_ticker(ticker)
+        if resolved:
+            df = load_stock_cached(resolved)
+            df = df.sort_values('date')
+            df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+            
+            # 依日期範圍過濾
+            if start_date:
+                df = df[df['date'] >= start_date]
+            if end_date:
+                df = df[df['date'] <= end_date]
+            
+            if len(df) > 30:  # 確保有足夠資料
+                data_map[ticker] = df
+    
+    if not data_map:
+        raise HTTPException(404, "找不到任何股票資料（或日期範圍內資料不足）")
+    return data_map
+
+def _build_portfolio_strategy(cfg: PortfolioVariant) -> tuple:
+    """依設定建立投組策略，回傳 (策略, 顯示名稱)"""
+    from backtest.strategy_portfolio import (
+        EqualWeightMonthlyStrategy,
+        BuyAndHoldStrategy,
+        DCAStrategy
+    )
+    
+    if cfg.strategy == "buy_hold":
+        mode = cfg.buy_hold_mode or "diamond"
+        
+        if mode == "diamond":
+            # 鑽石手：永不賣出，不需要停損停利
+            strategy = BuyAndHoldStrategy(
+                stop_loss=None,
+                take_profit=None,
+                mode="diamond"
+            )
+            strategy_name = "💎 鑽石手（永不賣出）"
+        elif mode == "rebuy":
+            # 停損停利後買回
+            strategy = BuyAndHoldStrategy(
+                stop_loss=cfg.stop_loss,
+                take_profit=cfg.take_profit,
+                mode="rebuy",
+                cooldown_days=cfg.cooldown_days,
+                rebuy_amount=cfg.rebuy_amount
+            )
+            strategy_name = f"🔄 停損停利後買回 (冷靜{cfg.cooldown_days}天)"
+        elif mode == "multilayer":
+            # 多層次鑽石手
+            strategy = BuyAndHoldStrategy(
+                stop_loss=None,
+                take_profit=None,
+                mode="multilayer",
+                extra_buys=cfg.extra_buys
+            )
+            extra_count = len(cfg.extra_buys) if cfg.extra_buys else 0
+            strategy_name = f"📈 多層次鑽石手 ({extra_count} 筆加碼)"
+        else:
+            # 預設鑽石手
+            strategy = BuyAndHoldStrategy(mode="diamond")
+            strategy_name = "💎 鑽石手"
+            
+    elif cfg.strategy == "dca":
+        monthly_amt = cfg.dca_amount or 10000  # 預設每月 1 萬元
+        strategy = DCAStrategy(buy_day=cfg.dca_day, monthly_amount=monthly_amt)
+        strategy_name = f"📅 定期定額 (每月{cfg.dca_day}日, ${monthly_amt:,.0f})"
+    else:
+        # 等權重策略
+        freq = cfg.rebalance_freq or "monthly"
+        freq_label = {"weekly": "每週", "monthly": "每月", "quarterly": "每季"}.get(freq, "每月")
+        strategy = EqualWeightMonthlyStrategy(freq=freq)
+        strategy_name = f"📊 等權重 ({freq_label}再平衡)"
+    
+    return strategy, strategy_name
+
+def _portfolio_metrics(metrics: dict) -> dict:
+    """投組績效轉成 API 格式（百分比）"""
+    return {
+        "total_return": round(metrics.get('total_return', 0) * 100, 2),
+        "sharpe_ratio": round(metrics.get('sharpe_ratio', 0), 2),
+        "max_drawdown": round(metrics.get('max_drawdown', 0) * 100, 2),
+        "win_rate": round(metrics.get('win_rate', 0) * 100, 2),
+        "trade_count": metrics.get('trade_count', 0)
+    }
+
 @app.post("/api/portfolio/run")
 async def run_portfolio_backtest(req: PortfolioRequest):
     """執行投組回測"""
     try:
-        import pandas as pd
-        from glob import glob
         from datetime import datetime
         from backtest.portfolio import PortfolioEngine
-        from backtest.strategy_portfolio import (
-            EqualWeightMonthlyStrategy,
-            BuyAndHoldStrategy,
-            DCAStrategy
-        )
         from backtest.portfolio_report import generate_portfolio_html_report
         
-        data_map = {}
-        for ticker in req.tickers[:10]:
-            data_path = os.path.join(BASE_DIR, "data", "tw-share", "dayK", f"{ticker}*.csv")
-            files = glob(data_path)
-            if files:
-                df = pd.read_csv(files[0])
-                date_col = 'date' if 'date' in df.columns else 'Date'
-                df = df.sort_values(date_col)
-                df[date_col] = df[date_col].astype(str)
-                
-                # 依日期範圍過濾
-                if req.start_date:
-                    df = df[df[date_col] >= req.start_date]
-                if req.end_date:
-                    df = df[df[date_col] <= req.end_date]
-                
-                if len(df) > 30:  # 確保有足夠資料
-                    data_map[ticker] = df
-        
-        if not data_map:
-            raise HTTPException(404, "找不到任何股票資料（或日期範圍內資料不足）")
+        data_map = _load_portfolio_data(req.tickers, req.start_date, req.end_date)
         
         # 根據策略選擇建立策略實例
-        strategy_name = ""
-        if req.strategy == "buy_hold":
-            mode = req.buy_hold_mode or "diamond"
-            
-            if mode == "diamond":
-                # 鑽石手：永不賣出，不需要停損停利
-                strategy = BuyAndHoldStrategy(
-                    stop_loss=None,
-                    take_profit=None,
-                    mode="diamond"
-                )
-                strategy_name = "💎 鑽石手（永不賣出）"
-            elif mode == "rebuy":
-                # 停損停利後買回
-                strategy = BuyAndHoldStrategy(
-                    stop_loss=req.stop_loss,
-                    take_profit=req.take_profit,
-                    mode="rebuy",
-                    cooldown_days=req.cooldown_days,
-                    rebuy_amount=req.rebuy_amount
-                )
-                strategy_name = f"🔄 停損停利後買回 (冷靜{req.cooldown_days}天)"
-            elif mode == "multilayer":
-                # 多層次鑽石手
-                strategy = BuyAndHoldStrategy(
-                    stop_loss=None,
-                    take_profit=None,
-                    mode="multilayer",
-                    extra_buys=req.extra_buys
-                )
-                extra_count = len(req.extra_buys) if req.extra_buys else 0
-                strategy_name = f"📈 多層次鑽石手 ({extra_count} 筆加碼)"
-            else:
-                # 預設鑽石手
-                strategy = BuyAndHoldStrategy(mode="diamond")
-                strategy_name = "💎 鑽石手"
-                
-        elif req.strategy == "dca":
-            monthly_amt = req.dca_amount or 10000  # 預設每月 1 萬元
-            strategy = DCAStrategy(buy_day=req.dca_day, monthly_amount=monthly_amt)
-            strategy_name = f"📅 定期定額 (每月{req.dca_day}日, ${monthly_amt:,.0f})"
-        else:
-            # 等權重策略
-            freq = req.rebalance_freq or "monthly"
-            freq_label = {"weekly": "每週", "monthly": "每月", "quarterly": "每季"}.get(freq, "每月")
-            strategy = EqualWeightMonthlyStrategy(freq=freq)
-            strategy_name = f"📊 等權重 ({freq_label}再平衡)"
+        strategy, strategy_name = _build_portfolio_strategy(req)
         
         engine = PortfolioEngine(initial_capital=req.initial_capital)
         result = engine.run(data_map, strategy)
@@ -693,13 +719,7 @@ async def run_portfolio_backtest(req: PortfolioRequest):
         return {
             "tickers": list(data_map.keys()),
             "strategy": strategy_name,
-            "metrics": {
-                "total_return": round(metrics.get('total_return', 0) * 100, 2),
-                "sharpe_ratio": round(metrics.get('sharpe_ratio', 0), 2),
-                "max_drawdown": round(metrics.get('max_drawdown', 0) * 100, 2),
-                "win_rate": round(metrics.get('win_rate', 0) * 100, 2),
-                "trade_count": metrics.get('trade_count', 0)
-            },
+            "metrics": _portfolio_metrics(metrics),
             "final_value": round(final_value, 0),
             "report_url": f"/reports/{report_filename}"
         }
@@ -708,6 +728,48 @@ async def run_portfolio_backtest(req: PortfolioRequest):
     except Exception as e:
         raise HTTPException(500, str(e))
 
+@app.post("/api/portfolio/compare")
+async def compare_portfolio_backtest(req: PortfolioCompareRequest):
+    """同一組股票比較多個投組策略（資料只讀取、對齊一次）"""
+    try:
+        from backtest.portfolio import PortfolioEngine
+        from backtest.portfolio_batch import compare_portfolio_strategies
+        
+        if not req.variants:
+            raise HTTPException(400, "請至少提供一個策略設定")
+        
+        data_map = _load_portfolio_data(req.tickers, req.start_date, req.end_date)
+        
+        strategies = []
+        for cfg in req.variants[:PORTFOLIO_MAX_VARIANTS]:
+            strategy, strategy_name = _build_portfolio_strategy(cfg)
+            strategy.name = strategy_name
+            strategies.append(strategy)
+        
+        engine = PortfolioEngine(initial_capital=req.initial_capital)
+        result = compare_portfolio_strategies(data_map, strategies, engine=engine)
+        
+        curves = result['equity_curves']
+        return {
+            "tickers": list(data_map.keys()),
+            "results": [
+                {
+                    "strategy": name,
+                    "metrics": _portfolio_metrics(res['metrics']),
+                    "final_value": round(float(res['equity_curve'].iloc[-1]), 0)
+                }
+                for name, res in result['results'].items()
+            ],
+            "equity_curves": {
+                "dates": curves.index.strftime('%Y-%m-%d').tolist(),
+                "series": {name: curves[name].round(0).tolist() for name in curves.columns}
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
 # ==================== 報告管理 ====================
 
 @app.get("/api/reports")
@@ -797,17 +859,16 @@ async def run_optimization(req: OptimizeRequest):
     try:
         import pandas as pd
         import numpy as np
-        from glob import glob
         from backtest.optimizer import StrategyOptimizer
         from backtest.strategy import MACrossStrategy
+        from data_loader import load_stock_cached
         
-        data_path = os.path.join(BASE_DIR, "data", "tw-share", "dayK", f"{req.ticker}*.csv")
-        files = glob(data_path)
-        if not files:
+        ticker = resolve_ticker(req.ticker)
+        if not ticker:
             raise HTTPException(404, f"找不到 {req.ticker} 的資料")
         
-        df = pd.read_csv(files[0])
-        df = df.sort_values('date' if 'date' in df.columns else 'Date')
+        df = load_stock_cached(ticker)
+        df = df.sort_values('date')
         
         optimizer = StrategyOptimizer(min_trades=3)
         results = optimizer.grid_search(
@@ -854,29 +915,21 @@ async def get_monitor_signal(req: MonitorRequest):
     """取得特定股票+策略的當前訊號"""
     try:
         import pandas as pd
-        from glob import glob
+        from data_loader import load_stock_cached
         from backtest.strategy import (
             MACrossStrategy, RSIStrategy, MACDStrategy, 
             BollingerStrategy, MomentumBreakoutStrategy, VolumeBreakoutStrategy, TurtleStrategy,
             InstitutionalFollowStrategy
         )
+        from backtest.features import ensure_features
         
-        ticker = normalize_ticker(req.ticker)
-        data_path = os.path.join(BASE_DIR, "data", "tw-share", "dayK", f"{ticker.replace('.TW', '')}*.csv")
-        files = glob(data_path)
-        
-        if not files:
-            raise HTTPException(404, f"找不到 {ticker} 股票資料")
+        ticker = resolve_ticker(req.ticker)
+        if not ticker:
+            raise HTTPException(404, f"找不到 {normalize_ticker(req.ticker)} 股票資料")
         
-        df = pd.read_csv(files[0])
-        df.columns = [c.lower() for c in df.columns]
+        df = load_stock_cached(ticker)
         df = df.sort_values('date').tail(100)  # 取最近 100 筆計算
         
-        # 計算所需指標
-        df['ma5'] = df['close'].rolling(5).mean()
-        df['ma20'] = df['close'].rolling(20).mean()
-        df['ma60'] = df['close'].rolling(60).mean()
-        
         strategy_map = {
             "MA5x20": MACrossStrategy(5, 20),
             "MA5x60": MACrossStrategy(5, 60),
@@ -895,9 +948,6 @@ async def get_monitor_signal(req: MonitorRequest):
         # 支援自訂均線
         if req.short_period and req.long_period:
             strategy = MACrossStrategy(req.short_period, req.long_period)
-            # 計算自訂均線
-            df[f'ma{req.short_period}'] = df['close'].rolling(req.short_period).mean()
-            df[f'ma{req.long_period}'] = df['close'].rolling(req.long_period).mean()
         elif req.strategy.startswith('MA') and 'x' in req.strategy:
             # 解析 MA10x40 格式
             parts = req.strategy.replace('MA', '').split('x')
@@ -905,13 +955,13 @@ async def get_monitor_signal(req: MonitorRequest):
                 short_p = int(parts[0])
                 long_p = int(parts[1])
                 strategy = MACrossStrategy(short_p, long_p)
-                df[f'ma{short_p}'] = df['close'].rolling(short_p).mean()
-                df[f'ma{long_p}'] = df['close'].rolling(long_p).mean()
             else:
                 strategy = strategy_map.get(req.strategy, MACrossStrategy(5, 20))
         else:
             strategy = strategy_map.get(req.strategy, MACrossStrategy(5, 20))
         
+        # 補算策略需要的指標欄位
+        ensure_features(df, strategy.required_features())
         signals = strategy.generate_signals(df)
         
         # 取得最後一個訊號
@@ -920,7 +970,7 @@ async def get_monitor_signal(req: MonitorRequest):
         
         return {
             "signal": int(last_signal),
-            "last_date": str(last_date) if last_date else None
+            "last_date": str(last_date)[:10] if last_date is not None else None
         }
     except HTTPException:
         raise
@@ -932,29 +982,21 @@ async def get_monitor_trades(req: MonitorRequest):
     """取得特定股票+策略的交易歷史"""
     try:
         import pandas as pd
-        from glob import glob
+        from data_loader import load_stock_cached
         from backtest.strategy import (
             MACrossStrategy, RSIStrategy, MACDStrategy, 
             BollingerStrategy, MomentumBreakoutStrategy, VolumeBreakoutStrategy, TurtleStrategy,
             InstitutionalFollowStrategy
         )
+        from backtest.features import ensure_features
         
-        ticker = normalize_ticker(req.ticker)
-        data_path = os.path.join(BASE_DIR, "data", "tw-share", "dayK", f"{ticker.replace('.TW', '')}*.csv")
-        files = glob(data_path)
-        
-        if not files:
-            raise HTTPException(404, f"找不到 {ticker} 股票資料")
+        ticker = resolve_ticker(req.ticker)
+        if not ticker:
+            raise HTTPException(404, f"找不到 {normalize_ticker(req.ticker)} 股票資料")
         
-        df = pd.read_csv(files[0])
-        df.columns = [c.lower() for c in df.columns]
+        df = load_stock_cached(ticker)
         df = df.sort_values('date').reset_index(drop=True)
         
-        # 計算所需指標
-        df['ma5'] = df['close'].rolling(5).mean()
-        df['ma20'] = df['close'].rolling(20).mean()
-        df['ma60'] = df['close'].rolling(60).mean()
-        
         strategy_map = {
             "MA5x20": MACrossStrategy(5, 20),
             "MA5x60": MACrossStrategy(5, 60),
@@ -973,20 +1015,19 @@ async def get_monitor_trades(req: MonitorRequest):
         # 支援自訂均線
         if req.short_period and req.long_period:
             strategy = MACrossStrategy(req.short_period, req.long_period)
-            df[f'ma{req.short_period}'] = df['close'].rolling(req.short_period).mean()
-            df[f'ma{req.long_period}'] = df['close'].rolling(req.long_period).mean()
         elif req.strategy.startswith('MA') and 'x' in req.strategy:
             parts = req.strategy.replace('MA', '').split('x')
             if len(parts) == 2:
                 short_p = int(parts[0])
                 long_p = int(parts[1])
                 strategy = MACrossStrategy(short_p, long_p)
-                df[f'ma{short_p}'] = df['close'].rolling(short_p).mean()
-                df[f'ma{long_p}'] = df['close'].rolling(long_p).mean()
             else:
                 strategy = strategy_map.get(req.strategy, MACrossStrategy(5, 20))
         else:
             strategy = strategy_map.get(req.strategy, MACrossStrategy(5, 20))
+        
+        # 補算策略需要的指標欄位
+        ensure_features(df, strategy.required_features())
         signals = strategy.generate_signals(df)
         
         # 解析交易
@@ -999,7 +1040,7 @@ async def get_monitor_trades(req: MonitorRequest):
                 buy_date = df['date'].iloc[i]
                 buy_price = df['close'].iloc[i]
                 trades.append({
-                    "date": str(buy_date),
+                    "date": str(buy_date)[:10],
                     "type": "buy",
                     "price": float(buy_price),
                     "holding_days": None,
@@ -1012,7 +1053,7 @@ async def get_monitor_trades(req: MonitorRequest):
                 return_pct = (sell_price - buy_price) / buy_price if buy_price else 0
                 
                 trades.append({
-                    "date": str(sell_date),
+                    "date": str(sell_date)[:10],
                     "type": "sell",
                     "price": float(sell_price),
                     "holding_days": int(holding_days),